@@ -0,0 +1,46 @@
+import threading
+import boto3
+from botocore.config import Config
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+_client = None
+_lock = threading.Lock()
+
+def create_s3_client():
+    """ Builds a new S3 client with the pool, keep-alive and retry settings below """
+    return boto3.session.Session().client(
+        "s3",
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME,
+        config=Config(
+            # Enough connections for parallel uploads of several files, each in several parts
+            max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+            tcp_keepalive=True,
+            connect_timeout=5,
+            read_timeout=60,
+            retries={"max_attempts": settings.AWS_S3_MAX_ATTEMPTS, "mode": "adaptive"},
+        ),
+    )
+
+def get_s3_client():
+    """
+    Returns the process-wide S3 client. boto3 clients are thread-safe, so one
+    client (and its connection pool) is shared by all requests and threads of
+    the process instead of setting up credentials and TLS on every call.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = create_s3_client()
+    return _client
+
+@receiver(setting_changed)
+def reset_s3_client(setting, **kwargs):
+    global _client
+    if setting.startswith("AWS_"):
+        with _lock:
+            _client = None
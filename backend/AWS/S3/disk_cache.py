@@ -0,0 +1,237 @@
+"""
+Read-through disk cache for media served by S3FileGetView.
+
+Objects up to MAX_OBJECT_SIZE are copied from S3 into DIRECTORY on the first
+request and served from local disk afterwards (FileResponse, so the server can
+use sendfile). The cache is capped at MAX_BYTES and evicts the least recently
+used objects first.
+
+The directory is shared by the workers of a node, so it is the source of
+truth rather than the in-memory index of one process: every miss rebuilds the
+index from the files on disk (recency is the mtime of a file, bumped on each
+hit) before evicting, so MAX_BYTES caps the directory as a whole and not each
+worker. An entry a worker evicted is dropped by the others as soon as they
+find its file gone. Leftovers of crashed workers (temporary .part files, data
+without metadata or the other way round) are removed once older than
+STALE_AGE.
+
+Concurrent misses for the same key in a process are coalesced: one thread
+fetches from S3 while the others wait for the file to land.
+
+Each app node has its own cache. A deleted media is no longer served because
+the view looks the UserMedia row up first; S3FileDeleteView also drops the
+local copy right away, copies on other nodes age out through LRU eviction.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from django.conf import settings
+from django.utils.http import http_date
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    path: str
+    size: int
+    content_type: str
+    etag: str
+    last_modified: str
+
+
+class MediaDiskCache:
+    # Seconds a coalesced request waits for the fetch of another thread
+    WAIT_TIMEOUT = 30
+    # Seconds after which incomplete files are considered left by a crashed worker
+    STALE_AGE = 600
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.inflight = {}
+        self.loaded = False
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0, "evictions": 0}
+
+    def get_config(self):
+        return settings.AWS_S3_DISK_CACHE
+
+    def is_enabled(self):
+        return self.get_config()["ENABLED"]
+
+    def path_for(self, key):
+        return os.path.join(self.get_config()["DIRECTORY"], hashlib.sha256(key.encode()).hexdigest())
+
+    def load(self):
+        """ Indexes what earlier processes left in the directory (caller holds the lock) """
+        self.sync()
+        self.loaded = True
+        self.evict()
+
+    def sync(self):
+        """
+        Rebuilds the index and the size total from the directory, least
+        recently used first, and removes stale leftovers (caller holds the lock)
+        """
+        directory = self.get_config()["DIRECTORY"]
+        os.makedirs(directory, exist_ok=True)
+        names = set(os.listdir(directory))
+        now = time.time()
+        found = []
+        for name in names:
+            path = os.path.join(directory, name)
+            if name.endswith(".json"):
+                complete = name[:-len(".json")] in names
+            else:
+                complete = not name.endswith(".part") and f"{name}.json" in names
+            try:
+                if not complete:
+                    if now - os.path.getmtime(path) > self.STALE_AGE:
+                        os.remove(path)
+                    continue
+                if not name.endswith(".json"):
+                    continue
+                with open(path) as meta_file:
+                    entry = CacheEntry(**json.load(meta_file))
+                found.append((os.stat(entry.path).st_mtime_ns, entry))
+            except (OSError, ValueError, TypeError):
+                continue
+        found.sort(key=lambda item: item[0])
+        self.entries = OrderedDict((entry.key, entry) for _, entry in found)
+        self.total_bytes = sum(entry.size for entry in self.entries.values())
+
+    def get_or_fetch(self, key, fetch, size_hint=None):
+        """
+        Returns the CacheEntry of `key`, calling `fetch()` (an S3 get_object)
+        on a miss. Returns None when the object is not cacheable (too large),
+        in which case the caller streams it from S3 itself.
+        """
+        if size_hint is not None and size_hint > self.get_config()["MAX_OBJECT_SIZE"]:
+            self.count("bypassed")
+            return None
+
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            entry = self.entries.get(key)
+            if entry is not None:
+                try:
+                    # Shares the recency with the other workers
+                    os.utime(entry.path)
+                except FileNotFoundError:
+                    # Evicted by another worker
+                    del self.entries[key]
+                    self.total_bytes -= entry.size
+                    entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry
+            event = self.inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self.inflight[key] = threading.Event()
+                self.counters["misses"] += 1
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            event.wait(self.WAIT_TIMEOUT)
+            with self.lock:
+                return self.entries.get(key)
+
+        try:
+            return self.store(key, fetch())
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            event.set()
+
+    def store(self, key, s3_response):
+        body = s3_response["Body"]
+        config = self.get_config()
+        if s3_response["ContentLength"] > config["MAX_OBJECT_SIZE"]:
+            body.close()
+            self.count("bypassed")
+            return None
+
+        path = self.path_for(key)
+        entry = CacheEntry(
+            key=key,
+            path=path,
+            size=s3_response["ContentLength"],
+            content_type=s3_response.get("ContentType") or "application/octet-stream",
+            etag=s3_response["ETag"],
+            last_modified=http_date(s3_response["LastModified"].timestamp()),
+        )
+        # Written to a temporary file and renamed so readers never see a partial
+        # object, after the metadata so other workers index it as soon as it lands
+        descriptor, temp_path = tempfile.mkstemp(dir=config["DIRECTORY"], suffix=".part")
+        try:
+            with os.fdopen(descriptor, "wb") as temp_file:
+                for chunk in body.iter_chunks(chunk_size=64 * 1024):
+                    temp_file.write(chunk)
+            with open(f"{path}.json", "w") as meta_file:
+                json.dump(entry.__dict__, meta_file)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            body.close()
+
+        with self.lock:
+            self.sync()
+            if key not in self.entries:
+                self.total_bytes += entry.size
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self.evict()
+        return entry
+
+    def evict(self):
+        """ Removes least recently used objects until the directory fits MAX_BYTES (caller holds the lock) """
+        max_bytes = self.get_config()["MAX_BYTES"]
+        while self.total_bytes > max_bytes and self.entries:
+            _, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry.size
+            self.counters["evictions"] += 1
+            self.remove_files(entry.path)
+
+    def invalidate(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry.size
+        self.remove_files(self.path_for(key))
+
+    def remove_files(self, path):
+        for file_path in (path, f"{path}.json"):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"] + self.counters["coalesced"]
+            return {
+                **self.counters,
+                "hit_ratio": round((self.counters["hits"] + self.counters["coalesced"]) / lookups, 4) if lookups else None,
+                "objects": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.get_config()["MAX_BYTES"],
+            }
+
+
+media_cache = MediaDiskCache()
@@ -0,0 +1,39 @@
+import statistics
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from AWS.S3.client import create_s3_client, get_s3_client
+
+class Command(BaseCommand):
+    help = (
+        "Compares the latency of an S3 call with a client built per request "
+        "(as the views used to do) against the shared pooled client."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Calls per variant.")
+        parser.add_argument("--key", help="HEAD this object instead of the bucket.")
+
+    def handle(self, *args, **options):
+        bucket = settings.AWS_STORAGE_BUCKET_NAME
+
+        def call(s3):
+            if options["key"]:
+                s3.head_object(Bucket=bucket, Key=options["key"])
+            else:
+                s3.head_bucket(Bucket=bucket)
+
+        # Warm up the shared client so its first connection is not measured
+        call(get_s3_client())
+        variants = {
+            "client per request": lambda: call(create_s3_client()),
+            "pooled client": lambda: call(get_s3_client()),
+        }
+        for name, run in variants.items():
+            timings = []
+            for _ in range(options["requests"]):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            percentiles = statistics.quantiles(timings, n=100)
+            self.stdout.write(f"{name:>20}: p50 {percentiles[49]:.1f} ms, p99 {percentiles[98]:.1f} ms")
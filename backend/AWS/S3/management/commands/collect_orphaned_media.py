@@ -0,0 +1,32 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from AWS.S3 import orphans
+
+class Command(BaseCommand):
+    help = "Deletes media attached to no post or message and, with --include-bucket, uploaded objects that belong to no media."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace",
+            type=int,
+            default=settings.AWS_S3_ORPHAN_GRACE_PERIOD,
+            help="Only collect what is older than this many seconds.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted without deleting it.")
+        parser.add_argument(
+            "--include-bucket",
+            action="store_true",
+            help="Also list the upload folders of the bucket for stray objects.",
+        )
+
+    def handle(self, *args, **options):
+        older_than = timezone.now() - timedelta(seconds=options["grace"])
+        report = orphans.collect(older_than, dry_run=options["dry_run"], include_bucket=options["include_bucket"])
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(f"{verb} {report['media']} orphaned media ({report['media_bytes']} bytes).")
+        self.stdout.write(f"{verb} {report['contents']} unreferenced contents.")
+        if options["include_bucket"]:
+            self.stdout.write(f"{verb} {report['objects']} stray objects ({report['object_bytes']} bytes).")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from AWS.S3.models import UserMedia
+from AWS.S3 import variants
+
+class Command(BaseCommand):
+    help = "Generates resized WebP/AVIF variants of uploaded images from the Redis queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit.")
+        parser.add_argument(
+            "--pending",
+            action="store_true",
+            help="Process every image that has no variants yet (e.g. uploaded before variants existed) and exit.",
+        )
+
+    def handle(self, *args, **options):
+        if options["pending"]:
+            pending = UserMedia.objects.filter(variants={}, content_type__startswith="image/")
+            processed = 0
+            for media_id in pending.values_list("id", flat=True).iterator():
+                variants.process(media_id)
+                processed += 1
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} images."))
+            return
+
+        if options["once"]:
+            processed = variants.drain()
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} images."))
+            return
+
+        self.stdout.write("Generating media variants...")
+        variants.run()
@@ -0,0 +1,45 @@
+import shutil
+from django.core.management.base import BaseCommand, CommandError
+from AWS.S3.models import UserMedia
+from AWS.S3 import video
+
+class Command(BaseCommand):
+    help = "Extracts poster frames and encodes HLS renditions of uploaded videos from the Redis queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit.")
+        parser.add_argument(
+            "--pending",
+            action="store_true",
+            help="Process every video that has no HLS renditions yet and exit.",
+        )
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="With --pending, also retry videos whose processing failed before.",
+        )
+
+    def handle(self, *args, **options):
+        config = video.get_config()
+        for binary in (config["FFMPEG"], config["FFPROBE"]):
+            if shutil.which(binary) is None:
+                raise CommandError(f"'{binary}' was not found; install ffmpeg or set FFMPEG_BINARY/FFPROBE_BINARY.")
+
+        if options["pending"]:
+            pending = UserMedia.objects.filter(hls_manifest="", content_type__startswith="video/")
+            if not options["retry_failed"]:
+                pending = pending.filter(video_error="")
+            processed = 0
+            for media_id in pending.values_list("id", flat=True).iterator():
+                video.process(media_id)
+                processed += 1
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} videos."))
+            return
+
+        if options["once"]:
+            processed = video.drain()
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} videos."))
+            return
+
+        self.stdout.write("Processing videos...")
+        video.run()
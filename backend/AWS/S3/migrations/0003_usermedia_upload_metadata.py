@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('S3', '0002_auto_20250311_2151'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usermedia',
+            name='content_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='usermedia',
+            name='sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='usermedia',
+            name='size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
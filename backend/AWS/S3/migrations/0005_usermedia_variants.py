@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('S3', '0004_usermedia_uploaded_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usermedia',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('S3', '0005_usermedia_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usermedia',
+            name='duration',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='usermedia',
+            name='height',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='usermedia',
+            name='hls_manifest',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='usermedia',
+            name='poster',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='usermedia',
+            name='width',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
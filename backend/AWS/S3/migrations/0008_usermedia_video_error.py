@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('S3', '0007_mediacontent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usermedia',
+            name='video_error',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
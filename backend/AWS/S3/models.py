@@ -1,10 +1,46 @@
 from django.db import models
+from django.conf import settings
+
+class MediaContent(models.Model):
+    """
+    One stored S3 object, shared by every UserMedia uploaded with the same
+    bytes. ref_count is the number of those UserMedia rows; the object is
+    deleted when it drops to zero (see AWS/S3/services.py).
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    key = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    content_type = models.CharField(max_length=100, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
 
 class UserMedia(models.Model):
     id = models.AutoField(primary_key=True)
     title = models.CharField(max_length=100)
     file = models.FileField(upload_to='uploads/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Sniffed from the uploaded bytes, not taken from the client
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField(null=True, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    # Shared stored object; null for media uploaded before deduplication and for direct uploads
+    content = models.ForeignKey(MediaContent, on_delete=models.PROTECT, null=True, blank=True, related_name="media")
+    # Resized encodes of images: {format: {width: key}} (see AWS/S3/variants.py)
+    variants = models.JSONField(default=dict, blank=True)
+    # Videos: probed metadata, poster frame and HLS master playlist keys (see AWS/S3/video.py)
+    duration = models.FloatField(null=True, blank=True)
+    width = models.IntegerField(null=True, blank=True)
+    height = models.IntegerField(null=True, blank=True)
+    poster = models.CharField(max_length=255, blank=True)
+    hls_manifest = models.CharField(max_length=255, blank=True)
+    # Why the video worker could not process the video, empty otherwise
+    video_error = models.CharField(max_length=255, blank=True)
+    uploaded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="uploaded_media"
+    )
 
     def __str__(self):
         return self.title
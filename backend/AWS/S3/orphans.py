@@ -0,0 +1,116 @@
+"""
+Garbage collection of media nothing refers to.
+
+Media are uploaded before the post or chat message that uses them exists
+(S3FileUploadView, direct uploads), so a client that never sends the post
+leaves UserMedia rows and S3 objects behind. `manage.py collect_orphaned_media`
+removes, when older than AWS_S3_ORPHAN_GRACE_PERIOD:
+
+- UserMedia rows attached to no post, chat message or avatar, released through
+  release_media so shared content is only deleted with its last reference,
+- MediaContent rows no UserMedia points to any more,
+- on request (include_bucket, --include-bucket), bucket objects belonging to
+  no UserMedia or MediaContent (failed uploads, abandoned direct uploads,
+  derivatives of deleted media).
+
+The bucket sweep only looks at keys build_s3_key could have made: under the
+folders the known media live in (plus "unknown/"), named after a uuid. Other
+objects in the bucket are never touched; strays in a folder no media is left
+in are not found either.
+
+Objects are deleted with delete_objects, 1000 keys per request. The grace
+period keeps media that are still being attached, and direct uploads whose
+finalize call has not arrived yet, out of reach.
+"""
+import re
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from .client import get_s3_client
+from .models import MediaContent, UserMedia
+from .services import delete_objects, release_media
+
+BATCH_SIZE = 1000
+# "<folder>/<uuid hex>..." as named by build_s3_key, derivatives included
+UPLOAD_KEY_RE = re.compile(r"^[^/]+/[0-9a-f]{32}(?:[_.]|$)")
+
+
+def orphaned_media(older_than):
+    return UserMedia.objects.filter(
+        uploaded_at__lt=older_than, posts__isnull=True, messages__isnull=True, avatar_of__isnull=True,
+    )
+
+
+def dangling_contents(older_than):
+    referenced = UserMedia.objects.filter(content__isnull=False).values("content_id")
+    return MediaContent.objects.filter(created_at__lt=older_than).exclude(id__in=referenced)
+
+
+def base_of(key):
+    """
+    Key of the original an object belongs to, without extension: variants,
+    posters and HLS files are stored under "<original>_..." (see variants.py
+    and video.py), and originals are named after a uuid or hash without "_".
+    """
+    folder, _, name = key.partition("/")
+    return f"{folder}/{re.split(r'[_./]', name, maxsplit=1)[0]}" if name else key
+
+
+def known_bases():
+    bases = {base_of(key) for key in UserMedia.objects.values_list("file", flat=True).iterator(chunk_size=5000)}
+    bases.update(base_of(key) for key in MediaContent.objects.values_list("key", flat=True).iterator(chunk_size=5000))
+    return bases
+
+
+def upload_prefixes(bases):
+    """ Folders build_s3_key put the known media in, and the one of files without extension """
+    return sorted({base.partition("/")[0] + "/" for base in bases if "/" in base} | {"unknown/"})
+
+
+def stray_objects(s3, older_than):
+    """ (key, size) of the uploaded objects older than `older_than` that belong to no media """
+    bases = known_bases()
+    paginator = s3.get_paginator("list_objects_v2")
+    for prefix in upload_prefixes(bases):
+        for page in paginator.paginate(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Prefix=prefix):
+            for item in page.get("Contents", []):
+                key = item["Key"]
+                if item["LastModified"] < older_than and UPLOAD_KEY_RE.match(key) and base_of(key) not in bases:
+                    yield key, item["Size"]
+
+
+def collect(older_than, dry_run=False, include_bucket=False):
+    """
+    Removes what is orphaned since before `older_than` and returns a report
+    of it; with `dry_run` only the report is built.
+    """
+    report = {"media": 0, "media_bytes": 0, "contents": 0, "objects": 0, "object_bytes": 0}
+
+    orphans = orphaned_media(older_than)
+    if dry_run:
+        totals = orphans.aggregate(count=Count("id"), size=Sum("size"))
+        report["media"], report["media_bytes"] = totals["count"], totals["size"] or 0
+    else:
+        while batch := list(orphans.only("id", "file", "size", "content_id")[:BATCH_SIZE]):
+            release_media(batch)
+            report["media"] += len(batch)
+            report["media_bytes"] += sum(media.size or 0 for media in batch)
+
+    with transaction.atomic():
+        # Locked so an upload cannot take a new reference to content being deleted
+        contents = list(dangling_contents(older_than).select_for_update())
+        report["contents"] = len(contents)
+        if not dry_run:
+            MediaContent.objects.filter(id__in=[content.id for content in contents]).delete()
+
+    if include_bucket:
+        s3 = get_s3_client()
+        keys = []
+        for key, size in stray_objects(s3, older_than):
+            keys.append(key)
+            report["objects"] += 1
+            report["object_bytes"] += size
+        if not dry_run:
+            delete_objects(s3, keys)
+
+    return report
@@ -2,13 +2,38 @@ from rest_framework import serializers
 from django.conf import settings
 from .models import UserMedia
 
+def object_url(key):
+    return f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/{key}"
+
 class UserMediaSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    poster_url = serializers.SerializerMethodField()
+    hls_url = serializers.SerializerMethodField()
 
     class Meta:
         model = UserMedia
-        fields = ['id', 'title', 'file', 'file_url', 'uploaded_at']
+        fields = [
+            'id', 'title', 'file', 'file_url', 'content_type', 'size', 'srcset',
+            'duration', 'width', 'height', 'poster_url', 'hls_url', 'uploaded_at',
+        ]
 
     def get_file_url(self, obj):
-        return f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/{obj.file}"
+        return object_url(obj.file)
+
+    def get_poster_url(self, obj):
+        return object_url(obj.poster) if obj.poster else None
+
+    def get_hls_url(self, obj):
+        """ HLS master playlist; null until the video has been processed """
+        return object_url(obj.hls_manifest) if obj.hls_manifest else None
 
+    def get_srcset(self, obj):
+        """ {format: "<url> 320w, <url> 640w, ..."} for <source srcset>; empty until variants are generated """
+        return {
+            extension: ", ".join(
+                f"{object_url(key)} {width}w"
+                for width, key in sorted(widths.items(), key=lambda item: int(item[0]))
+            )
+            for extension, widths in (obj.variants or {}).items()
+        }
@@ -0,0 +1,369 @@
+"""
+Upload pipeline for user media.
+
+Files of a request are validated up front, uploaded to S3 in parallel by a
+thread pool bounded by AWS_S3_UPLOAD_CONCURRENCY, and their UserMedia rows
+are created with a single bulk_create. If any upload or the insert fails,
+the objects already uploaded are deleted again so no orphans are left in the
+bucket.
+
+Each file is streamed: StreamingUpload reads it sequentially and hands it to
+a multipart upload in AWS_S3_MULTIPART_PART_SIZE parts, so only a few parts
+are held in memory at a time however large the file is. The SHA-256 and size
+are computed and the MIME type sniffed as the bytes go through.
+
+Uploads are deduplicated: files are hashed before anything is sent and a
+file whose SHA-256 is already stored reuses that MediaContent (and its S3
+object and derivatives) instead of being uploaded again. New content gets a
+random key like any other upload; a key derived from the hash would let
+anyone check whether a given file is stored in the public bucket. UserMedia
+rows count references on their MediaContent; release_media deletes the
+object with its last reference. Both lock the MediaContent rows they change,
+so content is never deleted while a reference to it is being added.
+
+Clients can also bypass the web workers: create_direct_upload issues a
+presigned POST restricted to one key, content type and size, the browser
+uploads straight to the bucket, and finalize_direct_upload checks the stored
+object before creating its UserMedia row.
+"""
+import os
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import magic
+from boto3.s3.transfer import TransferConfig
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models import F
+from .client import get_s3_client
+from .disk_cache import media_cache
+from .models import MediaContent, UserMedia
+from . import variants, video
+
+
+# Bytes looked at to detect the MIME type
+SNIFF_SIZE = 2048
+DIRECT_UPLOAD_SALT = "AWS.S3.direct_upload"
+
+
+class MediaUploadError(Exception):
+    pass
+
+
+class StreamingUpload:
+    """
+    Read-only, non-seekable view of an uploaded file for upload_fileobj.
+
+    Being non-seekable makes boto3 read the parts in order, one after the
+    other, instead of loading them by offset, which lets the checksum be
+    computed on the fly. The head of the file is read up front so the MIME
+    type is known before the upload starts.
+    """
+
+    def __init__(self, file_obj):
+        file_obj.seek(0)
+        self.file_obj = file_obj
+        self.head = file_obj.read(SNIFF_SIZE)
+        self.content_type = magic.from_buffer(self.head, mime=True) if self.head else "application/octet-stream"
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunk = self.head + self.file_obj.read()
+            self.head = b""
+        elif self.head:
+            chunk, self.head = self.head[:size], self.head[size:]
+            if len(chunk) < size:
+                chunk += self.file_obj.read(size - len(chunk))
+        else:
+            chunk = self.file_obj.read(size)
+        self.hash.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    @property
+    def sha256(self):
+        return self.hash.hexdigest()
+
+
+def get_transfer_config():
+    part_size = settings.AWS_S3_MULTIPART_PART_SIZE
+    concurrency = settings.AWS_S3_MULTIPART_CONCURRENCY
+    config = TransferConfig(
+        multipart_threshold=part_size,
+        multipart_chunksize=part_size,
+        max_concurrency=concurrency,
+    )
+    # Parts read ahead of the uploads are buffered in memory; cap them
+    config.max_in_memory_upload_chunks = concurrency
+    return config
+
+
+def stream_upload(s3, file_obj, key):
+    """ Streams a file to S3 under `key` and returns the StreamingUpload with its checksum, size and MIME type """
+    stream = StreamingUpload(file_obj)
+    s3.upload_fileobj(
+        stream, settings.AWS_STORAGE_BUCKET_NAME, key,
+        ExtraArgs={"ContentType": stream.content_type},
+        Config=get_transfer_config(),
+    )
+    return stream
+
+
+def build_s3_key(filename):
+    """ Stores files under a folder named after their extension ("unknown" without one) """
+    file_extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    folder = file_extension if file_extension else "unknown"
+    return f"{folder}/{uuid.uuid4().hex}.{file_extension}"
+
+
+def file_sha256(file_obj):
+    digest = hashlib.sha256()
+    for chunk in file_obj.chunks():
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def validate_media_file(file_obj):
+    """ Returns an error message unless the file is an image or video whose content matches its declared type """
+    file_header = file_obj.read(2048)
+    file_obj.seek(0)
+    detected_mime = magic.from_buffer(file_header, mime=True)
+
+    if file_obj.content_type.startswith("image/"):
+        if not detected_mime.startswith("image/"):
+            return "Uploaded file is not a valid image."
+    elif file_obj.content_type.startswith("video/"):
+        if not detected_mime.startswith("video/"):
+            return "Uploaded file is not a valid video."
+    else:
+        return "Uploaded file must be an image or video."
+    return None
+
+
+def delete_objects(s3, keys):
+    """ Best-effort removal of uploaded objects, up to 1000 keys per request """
+    keys = list(keys)
+    for start in range(0, len(keys), 1000):
+        try:
+            s3.delete_objects(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Delete={"Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True},
+            )
+        except Exception as e:
+            print(f"Failed to delete uploaded objects {keys[start:start + 1000]}: {e}")
+
+
+def upload_parallel(s3, files, keys):
+    """
+    Uploads files to their keys on a bounded thread pool and returns their
+    StreamingUploads. On any failure deletes the ones that made it.
+    """
+    max_workers = min(settings.AWS_S3_UPLOAD_CONCURRENCY, len(files))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-upload") as executor:
+        futures = [executor.submit(stream_upload, s3, file_obj, key) for file_obj, key in zip(files, keys)]
+
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        delete_objects(s3, [key for key, future in zip(keys, futures) if future.exception() is None])
+        raise MediaUploadError(f"Error uploading file to S3: {errors[0]}")
+    return [future.result() for future in futures]
+
+
+@contextmanager
+def upload_files(files, uploaded_by=None, titles=None, derivatives=True):
+    """
+    Uploads the files whose content is not stored yet, concurrently, then
+    opens a transaction, creates the UserMedia rows with one bulk_create and
+    yields them in the order of `files`. Whatever the block writes (e.g. the
+    post the media belongs to) commits together with the rows; if the block
+    raises, the transaction is rolled back and the new uploads are deleted.
+
+        with upload_files(files) as media_objects:
+            post.media.add(*media_objects)
+
+    Without `derivatives` no variants or HLS renditions are queued (e.g.
+    avatars, which get their own sizes). Raises MediaUploadError if an upload
+    failed.
+    """
+    titles = titles or [file_obj.name[:100] for file_obj in files]
+    hashes = [file_sha256(file_obj) for file_obj in files]
+    # One upload per new content, even if the same file is attached twice
+    files_by_hash = {}
+    for file_obj, sha256 in zip(files, hashes):
+        files_by_hash.setdefault(sha256, file_obj)
+    stored = set(MediaContent.objects.filter(sha256__in=hashes).values_list("sha256", flat=True))
+
+    s3 = get_s3_client() if files else None
+    new_keys = {}
+    streams = {}
+
+    def upload(sha256s):
+        keys = {sha256: build_s3_key(files_by_hash[sha256].name) for sha256 in sha256s}
+        if keys:
+            new_keys.update(keys)
+            streams.update(zip(keys, upload_parallel(s3, [files_by_hash[sha256] for sha256 in keys], list(keys.values()))))
+
+    upload([sha256 for sha256 in files_by_hash if sha256 not in stored])
+
+    try:
+        with transaction.atomic():
+            # Locked until the references are counted, so release_media cannot delete them meanwhile
+            contents = {content.sha256: content for content in MediaContent.objects.select_for_update().filter(sha256__in=stored)}
+            # Released since they were looked up: their objects are gone
+            upload([sha256 for sha256 in stored if sha256 not in contents])
+            for sha256, stream in streams.items():
+                contents[sha256], created = MediaContent.objects.select_for_update().get_or_create(sha256=sha256, defaults={
+                    "key": new_keys[sha256], "size": stream.size, "content_type": stream.content_type,
+                })
+                if not created:
+                    # A concurrent upload of the same bytes was registered first
+                    transaction.on_commit(lambda key=new_keys[sha256]: delete_objects(s3, [key]))
+            for sha256, count in Counter(hashes).items():
+                MediaContent.objects.filter(id=contents[sha256].id).update(ref_count=F("ref_count") + count)
+
+            media_objects = UserMedia.objects.bulk_create([
+                UserMedia(
+                    title=title, file=contents[sha256].key, content=contents[sha256],
+                    content_type=contents[sha256].content_type, size=contents[sha256].size, sha256=sha256,
+                    uploaded_by=uploaded_by,
+                )
+                for title, sha256 in zip(titles, hashes)
+            ])
+            if derivatives:
+                # Media of already processed content copy its derivatives in the workers
+                variants.enqueue(*[media.id for media in media_objects if variants.is_image(media)])
+                video.enqueue(*[media.id for media in media_objects if video.is_video(media)])
+            yield media_objects
+    except BaseException:
+        if new_keys:
+            delete_objects(s3, list(new_keys.values()))
+        raise
+
+
+def derived_keys(s3, key):
+    """ Keys of the variants, poster and HLS files stored next to `key` """
+    prefix = f"{os.path.splitext(key)[0]}_"
+    keys = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Prefix=prefix):
+        keys.extend(item["Key"] for item in page.get("Contents", []))
+    return keys
+
+
+def release_media(media_objects):
+    """
+    Deletes UserMedia rows. Their S3 objects (with derivatives) are deleted
+    once no other row references the same content; media without shared
+    content own their object and it is deleted with them.
+    """
+    released = []
+    with transaction.atomic():
+        # The rows as they are now: a concurrent release may have deleted some already
+        rows = list(UserMedia.objects.select_for_update().filter(id__in=[media.id for media in media_objects]).only("id", "file", "content_id"))
+        owned = [media for media in rows if media.content_id is None]
+        if owned:
+            UserMedia.objects.filter(id__in=[media.id for media in owned]).delete()
+            released.extend(str(media.file) for media in owned)
+        # Locked so a concurrent upload cannot take a reference to content being deleted
+        contents = MediaContent.objects.select_for_update().filter(id__in={media.content_id for media in rows if media.content_id})
+        for content in contents:
+            _, deleted = UserMedia.objects.filter(id__in=[media.id for media in rows], content_id=content.id).delete()
+            references = deleted.get(UserMedia._meta.label, 0)
+            if content.ref_count <= references:
+                released.append(content.key)
+                content.delete()
+            elif references:
+                MediaContent.objects.filter(id=content.id).update(ref_count=F("ref_count") - references)
+
+    if released:
+        s3 = get_s3_client()
+        delete_objects(s3, released + [derived for key in released for derived in derived_keys(s3, key)])
+        for key in released:
+            media_cache.invalidate(key)
+    return released
+
+
+def is_media_type(content_type):
+    return content_type.startswith("image/") or content_type.startswith("video/")
+
+
+def create_direct_upload(user, filename, content_type, size):
+    """
+    Returns a presigned POST ({"url", "fields"}) that lets the client upload
+    one image or video of at most `size` bytes straight to the bucket, and
+    the signed token to pass to finalize_direct_upload afterwards.
+    """
+    if not is_media_type(content_type):
+        raise MediaUploadError("Uploaded file must be an image or video.")
+    if not 0 < size <= settings.AWS_S3_DIRECT_UPLOAD_MAX_SIZE:
+        raise MediaUploadError(f"File size must be between 1 and {settings.AWS_S3_DIRECT_UPLOAD_MAX_SIZE} bytes.")
+
+    key = build_s3_key(filename)
+    presigned = get_s3_client().generate_presigned_post(
+        settings.AWS_STORAGE_BUCKET_NAME, key,
+        Fields={"Content-Type": content_type},
+        Conditions=[{"Content-Type": content_type}, ["content-length-range", 1, size]],
+        ExpiresIn=settings.AWS_S3_DIRECT_UPLOAD_EXPIRES,
+    )
+    token = signing.dumps(
+        {"key": key, "user": user.id, "title": filename[:100], "content_type": content_type},
+        salt=DIRECT_UPLOAD_SALT,
+    )
+    return {"url": presigned["url"], "fields": presigned["fields"], "key": key, "token": token}
+
+
+def finalize_direct_upload(user, token):
+    """
+    Checks an object uploaded with create_direct_upload and creates its
+    UserMedia row. The object must exist, be within the size limit and its
+    content must sniff as the declared kind of media; otherwise it is
+    deleted. Finalizing the same upload twice returns the same row.
+    """
+    try:
+        upload = signing.loads(token, salt=DIRECT_UPLOAD_SALT, max_age=settings.AWS_S3_DIRECT_UPLOAD_EXPIRES * 2)
+    except signing.BadSignature:
+        raise MediaUploadError("Invalid or expired upload token.")
+    if upload["user"] != user.id:
+        raise MediaUploadError("Invalid or expired upload token.")
+
+    existing = UserMedia.objects.filter(file=upload["key"]).first()
+    if existing is not None:
+        return existing
+
+    s3 = get_s3_client()
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    try:
+        head = s3.head_object(Bucket=bucket, Key=upload["key"])
+    except s3.exceptions.ClientError:
+        raise MediaUploadError("Uploaded file not found.")
+
+    size = head["ContentLength"]
+    declared = upload["content_type"]
+    sniffed = None
+    if 0 < size <= settings.AWS_S3_DIRECT_UPLOAD_MAX_SIZE:
+        start = s3.get_object(Bucket=bucket, Key=upload["key"], Range=f"bytes=0-{SNIFF_SIZE - 1}")["Body"].read()
+        sniffed = magic.from_buffer(start, mime=True)
+    if sniffed is None or sniffed.split("/")[0] != declared.split("/")[0]:
+        delete_objects(s3, [upload["key"]])
+        raise MediaUploadError("Uploaded file does not match its declared type or size.")
+
+    media, created = UserMedia.objects.get_or_create(
+        file=upload["key"],
+        defaults={"title": upload["title"], "content_type": sniffed, "size": size, "uploaded_by": user},
+    )
+    if created and variants.is_image(media):
+        variants.enqueue(media.id)
+    if created and video.is_video(media):
+        video.enqueue(media.id)
+    return media
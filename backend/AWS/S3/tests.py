@@ -1,8 +1,35 @@
 import os
+import hashlib
+import io
+import json
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 import boto3
+import requests
+from moto import mock_aws
+from PIL import Image
+from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
+from django.core.management import call_command
 from django.conf import settings
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from chats.models import Chat
+from chat_messages.models import ChatMessage
+from posts.models import Post
+from .models import MediaContent, UserMedia
+from .serializers import UserMediaSerializer
+from .disk_cache import MediaDiskCache
+from . import orphans, variants, video
+from .services import release_media, stream_upload
 
 class S3StorageTest(TestCase):
     def test_s3_upload(self):
@@ -56,3 +83,559 @@ class S3StorageTest(TestCase):
             
         except Exception as e:
             self.fail(f"Error connecting to S3: {e}")
+
+@mock_aws
+@override_settings(
+    AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing",
+    AWS_STORAGE_BUCKET_NAME="test-bucket", AWS_S3_REGION_NAME="us-east-1",
+    AWS_S3_MULTIPART_PART_SIZE=5 * 1024 * 1024, AWS_S3_MULTIPART_CONCURRENCY=2,
+)
+class StreamUploadTest(TestCase):
+    def setUp(self):
+        self.s3 = boto3.client("s3", region_name="us-east-1")
+        self.s3.create_bucket(Bucket="test-bucket")
+
+    def test_large_file_is_uploaded_in_parts_with_checksum_and_type(self):
+        content = b"%PDF-1.4\n" + os.urandom(12 * 1024 * 1024)
+        upload = SimpleUploadedFile("report.pdf", content, content_type="application/pdf")
+
+        stream = stream_upload(self.s3, upload, "pdf/report.pdf")
+
+        stored = self.s3.get_object(Bucket="test-bucket", Key="pdf/report.pdf")
+        self.assertEqual(stored["Body"].read(), content)
+        self.assertEqual(stored["ContentType"], "application/pdf")
+        self.assertIn("-3", stored["ETag"])  # multipart ETags end with the part count
+        self.assertEqual(stream.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(stream.size, len(content))
+        self.assertEqual(stream.content_type, "application/pdf")
+
+@mock_aws
+@override_settings(
+    AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing",
+    AWS_STORAGE_BUCKET_NAME="test-bucket", AWS_S3_REGION_NAME="us-east-1",
+)
+class DirectUploadTest(TestCase):
+    def setUp(self):
+        self.s3 = boto3.client("s3", region_name="us-east-1")
+        self.s3.create_bucket(Bucket="test-bucket")
+        User = get_user_model()
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com", phone_number="1", password="pass")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com", phone_number="2", password="pass")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.alice).key}")
+
+    def png(self):
+        content = io.BytesIO()
+        Image.new("RGB", (4, 4)).save(content, "PNG")
+        return content.getvalue()
+
+    def upload(self, content, content_type="image/png"):
+        """ Runs the browser's part of the flow and returns the finalize response """
+        presigned = self.client.post(
+            "/api/AWS/S3/direct/", {"filename": "photo.png", "content_type": content_type, "size": len(content)}
+        ).data
+        response = requests.post(presigned["url"], data=presigned["fields"], files={"file": ("photo.png", content)})
+        self.assertLess(response.status_code, 300)
+        return self.client.post("/api/AWS/S3/direct/finalize/", {"token": presigned["token"]})
+
+    def test_finalized_upload_can_be_attached_to_posts_and_chat_messages(self):
+        response = self.upload(self.png())
+        self.assertEqual(response.status_code, 201)
+        media = UserMedia.objects.get(id=response.data["data"]["id"])
+        self.assertEqual((media.content_type, media.uploaded_by), ("image/png", self.alice))
+
+        response = self.client.post("/api/posts/create/", {"text": "direct", "media_ids": [media.id]}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(Post.objects.get(id=response.data["id"]).media.all()), [media])
+
+        chat, _ = Chat.get_or_create([self.alice, self.bob])
+        response = self.client.post("/api/chat_messages/create/", {"chat": chat.id, "media": media.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ChatMessage.objects.get(id=response.data["id"]).media, media)
+
+    def test_content_not_matching_the_declared_type_is_rejected_and_deleted(self):
+        response = self.upload(b"definitely not a png")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UserMedia.objects.exists())
+        self.assertNotIn("Contents", self.s3.list_objects_v2(Bucket="test-bucket"))
+
+    def test_media_of_other_users_cannot_be_attached(self):
+        media = UserMedia.objects.create(title="bob.png", file="png/bob.png", uploaded_by=self.bob)
+
+        response = self.client.post("/api/posts/create/", {"media_ids": [media.id]}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+@mock_aws
+@override_settings(
+    AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing",
+    AWS_STORAGE_BUCKET_NAME="test-bucket", AWS_S3_REGION_NAME="us-east-1",
+)
+class S3FileGetViewTest(TestCase):
+    def setUp(self):
+        self.s3 = boto3.client("s3", region_name="us-east-1")
+        self.s3.create_bucket(Bucket="test-bucket")
+        self.content = os.urandom(200 * 1024)
+        self.s3.put_object(Bucket="test-bucket", Key="mp4/video.mp4", Body=self.content, ContentType="video/mp4")
+        self.media = UserMedia.objects.create(title="video.mp4", file="mp4/video.mp4")
+        user = get_user_model().objects.create_user(username="alice", email="alice@example.com", phone_number="1", password="pass")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}")
+
+    def get(self, **headers):
+        return self.client.get("/api/AWS/S3/get/", {"id": self.media.id}, **headers)
+
+    def test_full_object_is_streamed_with_caching_headers(self):
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["Content-Length"], str(len(self.content)))
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertTrue(response["ETag"])
+        self.assertTrue(response["Last-Modified"])
+        self.assertIn("max-age", response["Cache-Control"])
+
+    def test_range_request_returns_partial_content(self):
+        response = self.get(HTTP_RANGE="bytes=100-199")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.content[100:200])
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.content)}")
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.get()["ETag"]
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_disk_cache_serves_repeated_requests(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache_settings = {"ENABLED": True, "DIRECTORY": directory, "MAX_BYTES": 10 ** 7, "MAX_OBJECT_SIZE": 10 ** 6}
+        with override_settings(AWS_S3_DISK_CACHE=cache_settings), mock.patch("AWS.S3.views.media_cache", MediaDiskCache()) as cache:
+            first = self.get()
+            second = self.get()
+            self.assertEqual(b"".join(first.streaming_content), self.content)
+            self.assertEqual(b"".join(second.streaming_content), self.content)
+            self.assertEqual(cache.stats()["hits"], 1)
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=second["ETag"]).status_code, 304)
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=f'"other", W/{second["ETag"]}').status_code, 304)
+            self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=second["Last-Modified"]).status_code, 304)
+            self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE="Thu, 01 Jan 1970 00:00:00 GMT").status_code, 200)
+            self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_file_evicted_by_another_process_is_served_from_s3(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache_settings = {"ENABLED": True, "DIRECTORY": directory, "MAX_BYTES": 10 ** 7, "MAX_OBJECT_SIZE": 10 ** 6}
+        with override_settings(AWS_S3_DISK_CACHE=cache_settings), mock.patch("AWS.S3.views.media_cache", MediaDiskCache()):
+            b"".join(self.get().streaming_content)
+            for root, _, names in os.walk(directory):
+                for name in names:
+                    os.remove(os.path.join(root, name))
+
+            response = self.get()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b"".join(response.streaming_content), self.content)
+
+@mock_aws
+@override_settings(
+    AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing",
+    AWS_STORAGE_BUCKET_NAME="test-bucket", AWS_S3_REGION_NAME="us-east-1",
+)
+class MediaDiskCacheTest(TestCase):
+    def setUp(self):
+        self.s3 = boto3.client("s3", region_name="us-east-1")
+        self.s3.create_bucket(Bucket="test-bucket")
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(AWS_S3_DISK_CACHE={
+            "ENABLED": True, "DIRECTORY": self.directory, "MAX_BYTES": 2500, "MAX_OBJECT_SIZE": 1000,
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.cache = MediaDiskCache()
+        self.fetches = []
+
+    def put(self, key, size):
+        self.s3.put_object(Bucket="test-bucket", Key=key, Body=os.urandom(size), ContentType="image/png")
+
+    def fetcher(self, key, delay=0):
+        def fetch():
+            self.fetches.append(key)
+            time.sleep(delay)
+            return self.s3.get_object(Bucket="test-bucket", Key=key)
+        return fetch
+
+    def test_objects_are_fetched_once_and_served_from_disk(self):
+        self.put("png/a.png", 500)
+
+        first = self.cache.get_or_fetch("png/a.png", self.fetcher("png/a.png"))
+        second = self.cache.get_or_fetch("png/a.png", self.fetcher("png/a.png"))
+
+        self.assertEqual(self.fetches, ["png/a.png"])
+        self.assertEqual(first, second)
+        with open(second.path, "rb") as cached:
+            self.assertEqual(cached.read(), self.s3.get_object(Bucket="test-bucket", Key="png/a.png")["Body"].read())
+        self.assertEqual(self.cache.stats()["hit_ratio"], 0.5)
+
+    def test_least_recently_used_objects_are_evicted(self):
+        for name in "abc":
+            self.put(f"png/{name}.png", 1000)
+        self.cache.get_or_fetch("png/a.png", self.fetcher("png/a.png"))
+        self.cache.get_or_fetch("png/b.png", self.fetcher("png/b.png"))
+        self.cache.get_or_fetch("png/a.png", self.fetcher("png/a.png"))
+        self.cache.get_or_fetch("png/c.png", self.fetcher("png/c.png"))
+
+        self.assertEqual(list(self.cache.entries), ["png/a.png", "png/c.png"])
+        self.assertFalse(os.path.exists(self.cache.path_for("png/b.png")))
+
+    def test_large_objects_are_not_cached(self):
+        self.put("mp4/video.mp4", 2000)
+        self.assertIsNone(self.cache.get_or_fetch("mp4/video.mp4", self.fetcher("mp4/video.mp4")))
+        self.assertIsNone(self.cache.get_or_fetch("mp4/video.mp4", self.fetcher("mp4/video.mp4"), size_hint=2000))
+        self.assertEqual(self.fetches, ["mp4/video.mp4"])
+
+    def test_concurrent_misses_make_one_fetch(self):
+        self.put("png/a.png", 500)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get_or_fetch("png/a.png", self.fetcher("png/a.png", delay=0.2))))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.fetches, ["png/a.png"])
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(entry is not None and entry.key == "png/a.png" for entry in results))
+
+    def test_workers_sharing_the_directory_share_the_cap(self):
+        for name in "abc":
+            self.put(f"png/{name}.png", 1000)
+        other_worker = MediaDiskCache()
+        self.cache.get_or_fetch("png/a.png", self.fetcher("png/a.png"))
+        other_worker.get_or_fetch("png/b.png", self.fetcher("png/b.png"))
+        self.cache.get_or_fetch("png/c.png", self.fetcher("png/c.png"))
+
+        self.assertEqual(list(self.cache.entries), ["png/b.png", "png/c.png"])
+        self.assertFalse(os.path.exists(self.cache.path_for("png/a.png")))
+        self.assertEqual(self.cache.stats()["bytes"], 2000)
+
+        # The other worker finds the file gone and fetches it again
+        other_worker.get_or_fetch("png/a.png", self.fetcher("png/a.png"))
+        self.assertEqual(self.fetches.count("png/a.png"), 2)
+
+    def test_load_removes_leftovers_of_crashed_workers(self):
+        self.put("png/a.png", 500)
+        entry = self.cache.get_or_fetch("png/a.png", self.fetcher("png/a.png"))
+        stale = time.time() - MediaDiskCache.STALE_AGE - 1
+        leftovers = [os.path.join(self.directory, name) for name in ("crashed.part", "0" * 64, "1" * 64 + ".json")]
+        for path in leftovers:
+            with open(path, "wb") as leftover:
+                leftover.write(b"x" * 100)
+            os.utime(path, (stale, stale))
+        fresh = os.path.join(self.directory, "writing.part")
+        open(fresh, "wb").close()
+
+        restarted = MediaDiskCache()
+        self.assertEqual(restarted.get_or_fetch("png/a.png", self.fetcher("png/a.png")), entry)
+
+        self.assertFalse(any(os.path.exists(path) for path in leftovers))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertEqual(restarted.stats()["bytes"], 500)
+
+    def test_invalidate_removes_the_local_copy(self):
+        self.put("png/a.png", 500)
+        entry = self.cache.get_or_fetch("png/a.png", self.fetcher("png/a.png"))
+
+        self.cache.invalidate("png/a.png")
+
+        self.assertFalse(os.path.exists(entry.path))
+        self.cache.get_or_fetch("png/a.png", self.fetcher("png/a.png"))
+        self.assertEqual(len(self.fetches), 2)
+
+@mock_aws
+@override_settings(
+    AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing",
+    AWS_STORAGE_BUCKET_NAME="test-bucket", AWS_S3_REGION_NAME="us-east-1",
+    AWS_S3_IMAGE_VARIANTS={"WIDTHS": [320, 640, 1280], "FORMATS": ["webp"], "QUALITY": 75},
+)
+class ImageVariantsTest(TestCase):
+    def setUp(self):
+        self.s3 = boto3.client("s3", region_name="us-east-1")
+        self.s3.create_bucket(Bucket="test-bucket")
+
+    def create_image(self, key, size, orientation=None):
+        image = Image.new("RGB", size, "red")
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        content = io.BytesIO()
+        image.save(content, "JPEG", exif=exif)
+        self.s3.put_object(Bucket="test-bucket", Key=key, Body=content.getvalue())
+        return UserMedia.objects.create(title=key, file=key, content_type="image/jpeg")
+
+    def stored_image(self, key):
+        return Image.open(io.BytesIO(self.s3.get_object(Bucket="test-bucket", Key=key)["Body"].read()))
+
+    def test_variants_are_resized_oriented_and_stripped(self):
+        # Orientation 6: stored landscape, displayed portrait
+        media = self.create_image("jpg/photo.jpg", (1000, 600), orientation=6)
+
+        variants.generate(media)
+
+        media.refresh_from_db()
+        self.assertEqual(media.variants, {"webp": {"320": "jpg/photo_320w.webp"}})
+        variant = self.stored_image("jpg/photo_320w.webp")
+        self.assertEqual((variant.format, variant.size), ("WEBP", (320, 533)))
+        self.assertNotIn(0x0112, variant.getexif())
+
+        srcset = UserMediaSerializer(media).data["srcset"]
+        self.assertEqual(srcset, {"webp": "https://test-bucket.s3.amazonaws.com/jpg/photo_320w.webp 320w"})
+
+    def test_variants_drop_the_recent_messages_of_chats_using_the_media(self):
+        media = self.create_image("jpg/photo.jpg", (400, 300))
+        alice = get_user_model().objects.create_user(username="alice", email="alice@example.com", phone_number="1", password="pass")
+        chat, _ = Chat.get_or_create([alice])
+        ChatMessage.objects.create(chat=chat, user=alice, media=media)
+
+        with mock.patch("chat_messages.cache.invalidate") as invalidate:
+            variants.generate(media)
+
+        invalidate.assert_called_once_with(chat.id)
+
+    def test_small_images_are_not_upscaled(self):
+        media = self.create_image("jpg/icon.jpg", (200, 100))
+
+        variants.generate(media)
+
+        self.assertEqual(media.variants, {"webp": {"200": "jpg/icon_200w.webp"}})
+
+    def test_uploads_are_queued_after_commit(self):
+        with mock.patch.object(variants, "get_redis") as get_redis, self.captureOnCommitCallbacks(execute=True):
+            variants.enqueue(1, 2)
+            get_redis.return_value.rpush.assert_not_called()
+        get_redis.return_value.rpush.assert_called_once_with(variants.QUEUE_KEY, 1, 2)
+
+class VideoPipelineTest(TestCase):
+    def test_ladder_stops_at_the_source_height(self):
+        self.assertEqual([rendition["height"] for rendition in video.select_renditions(720)], [360, 720])
+        self.assertEqual([rendition["height"] for rendition in video.select_renditions(241)], [240])
+
+    def test_master_playlist_lists_every_rendition(self):
+        playlist = video.build_master_playlist(video.select_renditions(1080), 1920, 1080)
+
+        self.assertTrue(playlist.startswith("#EXTM3U\n"))
+        self.assertIn("#EXT-X-STREAM-INF:BANDWIDTH=896000,RESOLUTION=640x360\n360p/index.m3u8", playlist)
+        self.assertIn("#EXT-X-STREAM-INF:BANDWIDTH=5192000,RESOLUTION=1920x1080\n1080p/index.m3u8", playlist)
+
+    def probe(self, info):
+        with mock.patch("AWS.S3.video.subprocess.run") as run:
+            run.return_value.stdout = json.dumps(info)
+            return video.probe("clip")
+
+    def test_probe_falls_back_to_the_stream_duration_and_applies_rotation(self):
+        recorded = {"streams": [{"codec_type": "video", "width": 640, "height": 480}, {"codec_type": "audio", "duration": "4.5"}], "format": {}}
+        self.assertEqual(self.probe(recorded), (4.5, 640, 480, True))
+
+        portrait = {
+            "streams": [{"codec_type": "video", "width": 1920, "height": 1080, "side_data_list": [{"rotation": -90}]}],
+            "format": {"duration": "2.0"},
+        }
+        self.assertEqual(self.probe(portrait), (2.0, 1080, 1920, False))
+
+    def test_results_drop_the_recent_messages_of_chats_using_the_media(self):
+        media = UserMedia.objects.create(title="clip.webm", file="webm/clip.webm", content_type="video/webm")
+        alice = get_user_model().objects.create_user(username="alice", email="alice@example.com", phone_number="1", password="pass")
+        chat, _ = Chat.get_or_create([alice])
+        ChatMessage.objects.create(chat=chat, user=alice, media=media)
+
+        with mock.patch("AWS.S3.video.generate", side_effect=ValueError("unreadable")), \
+                mock.patch("chat_messages.cache.invalidate") as invalidate:
+            video.process(media.id)
+
+        invalidate.assert_called_once_with(chat.id)
+
+    def test_failure_is_recorded_and_not_retried_by_pending(self):
+        media = UserMedia.objects.create(title="clip.webm", file="webm/clip.webm", content_type="video/webm")
+
+        with mock.patch("AWS.S3.video.generate", side_effect=ValueError("unreadable")):
+            video.process(media.id)
+
+        media.refresh_from_db()
+        self.assertEqual(media.video_error, "unreadable")
+        with mock.patch("AWS.S3.video.process") as process, mock.patch("shutil.which", return_value="/usr/bin/ffmpeg"):
+            call_command("process_videos", pending=True, stdout=io.StringIO())
+            process.assert_not_called()
+            call_command("process_videos", pending=True, retry_failed=True, stdout=io.StringIO())
+            process.assert_called_once_with(media.id)
+
+    @skipUnless(shutil.which("ffmpeg") and shutil.which("ffprobe"), "ffmpeg is not installed")
+    @mock_aws
+    @override_settings(
+        AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing",
+        AWS_STORAGE_BUCKET_NAME="test-bucket", AWS_S3_REGION_NAME="us-east-1",
+    )
+    def test_video_gets_poster_and_hls_ladder(self):
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="test-bucket")
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "clip.mp4")
+            subprocess.run(
+                ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc=duration=3:size=1280x720:rate=25", source],
+                check=True,
+            )
+            s3.upload_file(source, "test-bucket", "mp4/clip.mp4")
+        media = UserMedia.objects.create(title="clip.mp4", file="mp4/clip.mp4", content_type="video/mp4")
+
+        video.generate(media)
+
+        media.refresh_from_db()
+        self.assertEqual((media.width, media.height), (1280, 720))
+        self.assertAlmostEqual(media.duration, 3, places=0)
+        keys = {item["Key"] for item in s3.list_objects_v2(Bucket="test-bucket")["Contents"]}
+        self.assertIn("mp4/clip_poster.jpg", keys)
+        self.assertIn("mp4/clip_hls/master.m3u8", keys)
+        self.assertIn("mp4/clip_hls/720p/index.m3u8", keys)
+        self.assertEqual(UserMediaSerializer(media).data["hls_url"], "https://test-bucket.s3.amazonaws.com/mp4/clip_hls/master.m3u8")
+
+@mock_aws
+@override_settings(
+    AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing",
+    AWS_STORAGE_BUCKET_NAME="test-bucket", AWS_S3_REGION_NAME="us-east-1",
+)
+class MediaDeduplicationTest(TestCase):
+    def setUp(self):
+        self.s3 = boto3.client("s3", region_name="us-east-1")
+        self.s3.create_bucket(Bucket="test-bucket")
+        user = get_user_model().objects.create_user(username="alice", email="alice@example.com", phone_number="1", password="pass")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}")
+        content = io.BytesIO()
+        Image.new("RGB", (4, 4), "blue").save(content, "PNG")
+        self.meme = content.getvalue()
+
+    def upload(self, name):
+        response = self.client.post("/api/AWS/S3/upload/", {"file": SimpleUploadedFile(name, self.meme, content_type="image/png")})
+        self.assertEqual(response.status_code, 201)
+        return UserMedia.objects.get(id=response.data["data"]["id"])
+
+    def stored_keys(self):
+        return [item["Key"] for item in self.s3.list_objects_v2(Bucket="test-bucket").get("Contents", [])]
+
+    def test_identical_uploads_share_one_object(self):
+        first = self.upload("meme.png")
+        second = self.upload("forwarded.png")
+
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(first.content.ref_count, 2)
+        self.assertEqual(self.stored_keys(), [first.content.key])
+        self.assertNotIn(first.sha256, first.content.key)
+
+    def test_releasing_stale_media_twice_counts_one_reference(self):
+        first = self.upload("meme.png")
+        second = self.upload("forwarded.png")
+        self.upload("again.png")
+
+        release_media([first])
+        release_media([first])
+
+        self.assertEqual(MediaContent.objects.get().ref_count, 2)
+        release_media([second])
+        self.assertEqual(MediaContent.objects.get().ref_count, 1)
+
+    def test_object_is_deleted_with_its_last_reference(self):
+        first = self.upload("meme.png")
+        second = self.upload("forwarded.png")
+
+        self.client.delete(f"/api/AWS/S3/delete/?id={first.id}")
+        self.assertEqual(MediaContent.objects.get().ref_count, 1)
+        self.assertEqual(len(self.stored_keys()), 1)
+
+        self.client.delete(f"/api/AWS/S3/delete/?id={second.id}")
+        self.assertFalse(MediaContent.objects.exists())
+        self.assertEqual(self.stored_keys(), [])
+
+@mock_aws
+@override_settings(
+    AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing",
+    AWS_STORAGE_BUCKET_NAME="test-bucket", AWS_S3_REGION_NAME="us-east-1",
+)
+class OrphanedMediaTest(TestCase):
+    def setUp(self):
+        self.s3 = boto3.client("s3", region_name="us-east-1")
+        self.s3.create_bucket(Bucket="test-bucket")
+        User = get_user_model()
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com", phone_number="1", password="pass")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com", phone_number="2", password="pass")
+
+        self.posted = self.media("posted", self.alice)
+        Post.objects.create(user=self.alice).media.add(self.posted)
+        self.sent = self.media("sent", self.alice)
+        chat, _ = Chat.get_or_create([self.alice, self.bob])
+        ChatMessage.objects.create(chat=chat, user=self.alice, media=self.sent)
+        self.orphan = self.media("orphan", self.bob)
+        self.put(self.key("orphan", "_320w.webp"))
+        self.put(self.key("stray"))
+        # Not named by build_s3_key, so never collected
+        self.put("png/README.txt")
+        self.put("backups/db.sql")
+
+    def key(self, name, suffix=".png"):
+        """ Key named like build_s3_key does, after a uuid """
+        return f"png/{hashlib.md5(name.encode()).hexdigest()}{suffix}"
+
+    def put(self, key):
+        self.s3.put_object(Bucket="test-bucket", Key=key, Body=b"data")
+
+    def media(self, name, user):
+        self.put(self.key(name))
+        return UserMedia.objects.create(title=name, file=self.key(name), size=4, uploaded_by=user)
+
+    def stored_keys(self):
+        return sorted(item["Key"] for item in self.s3.list_objects_v2(Bucket="test-bucket").get("Contents", []))
+
+    def test_unattached_media_and_stray_objects_are_collected(self):
+        report = orphans.collect(timezone.now() + timedelta(minutes=1), include_bucket=True)
+
+        self.assertEqual((report["media"], report["objects"]), (1, 1))
+        self.assertEqual(set(UserMedia.objects.values_list("id", flat=True)), {self.posted.id, self.sent.id})
+        self.assertEqual(
+            self.stored_keys(), sorted(["backups/db.sql", "png/README.txt", self.key("posted"), self.key("sent")]),
+        )
+
+    def test_bucket_is_only_swept_on_request(self):
+        report = orphans.collect(timezone.now() + timedelta(minutes=1))
+
+        self.assertEqual((report["media"], report["objects"]), (1, 0))
+        self.assertIn(self.key("stray"), self.stored_keys())
+
+    def test_grace_period_and_dry_run_keep_everything(self):
+        recent = orphans.collect(timezone.now() - timedelta(hours=1), include_bucket=True)
+        self.assertEqual((recent["media"], recent["objects"]), (0, 0))
+
+        report = orphans.collect(timezone.now() + timedelta(minutes=1), dry_run=True, include_bucket=True)
+        self.assertEqual((report["media"], report["objects"]), (1, 1))
+        self.assertEqual(UserMedia.objects.count(), 3)
+        self.assertEqual(len(self.stored_keys()), 7)
+
+    def test_bulk_delete_only_removes_own_media(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.alice).key}")
+
+        response = client.post(
+            "/api/AWS/S3/delete/bulk/", {"ids": [self.posted.id, self.sent.id, self.orphan.id]}, format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["deleted"], sorted([self.posted.id, self.sent.id]))
+        self.assertEqual(list(UserMedia.objects.all()), [self.orphan])
+        self.assertEqual(self.stored_keys(), sorted([
+            "backups/db.sql", "png/README.txt", self.key("orphan"), self.key("orphan", "_320w.webp"), self.key("stray"),
+        ]))
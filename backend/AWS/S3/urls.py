@@ -1,8 +1,15 @@
 from django.urls import path
-from .views import S3FileUploadView, S3FileGetView, S3FileDeleteView
+from .views import (
+    S3FileUploadView, S3FileGetView, S3FileDeleteView, S3DirectUploadView, S3DirectUploadFinalizeView,
+    S3BulkDeleteView, S3CacheStatsView,
+)
 
 urlpatterns = [
     path("S3/upload/", S3FileUploadView.as_view(), name="S3_Upload"),
+    path("S3/direct/", S3DirectUploadView.as_view(), name="S3_Direct_Upload"),
+    path("S3/direct/finalize/", S3DirectUploadFinalizeView.as_view(), name="S3_Direct_Upload_Finalize"),
     path("S3/get/", S3FileGetView.as_view(), name="S3_Get"),
     path("S3/delete/", S3FileDeleteView.as_view(), name="S3_Delete"),
+    path("S3/delete/bulk/", S3BulkDeleteView.as_view(), name="S3_Bulk_Delete"),
+    path("S3/cache/stats/", S3CacheStatsView.as_view(), name="S3_Cache_Stats"),
 ]
@@ -0,0 +1,136 @@
+"""
+Resized WebP/AVIF variants of uploaded images.
+
+Uploads enqueue the new media ids in Redis once their transaction commits;
+`manage.py generate_media_variants` pops them, downloads the original,
+applies its EXIF orientation and writes one encode per width and format
+without any metadata, next to the original key:
+
+    jpg/3f2a....jpg -> jpg/3f2a..._320w.webp, jpg/3f2a..._320w.avif, ...
+
+The keys are stored in UserMedia.variants as {format: {width: key}} and
+exposed by UserMediaSerializer as srcset strings.
+"""
+import io
+import os
+from django.conf import settings
+from django.db import transaction
+from PIL import Image, ImageOps, features
+from redis.exceptions import RedisError
+from backend.redis_client import get_redis
+from .client import get_s3_client
+from .models import UserMedia
+
+QUEUE_KEY = "media:variants:queue"
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "avif": ("AVIF", "image/avif"),
+}
+# Animated and vector images are served as they are
+SKIPPED_TYPES = {"image/gif", "image/svg+xml"}
+
+
+def get_config():
+    return settings.AWS_S3_IMAGE_VARIANTS
+
+
+def get_formats():
+    """ Configured formats this Pillow build can encode """
+    return [name for name in get_config()["FORMATS"] if features.check(name)]
+
+
+def is_image(media):
+    return media.content_type.startswith("image/") and media.content_type not in SKIPPED_TYPES
+
+
+def variant_key(key, width, extension):
+    return f"{os.path.splitext(key)[0]}_{width}w.{extension}"
+
+
+def enqueue(*media_ids):
+    """ Queues media for the variants worker once the current transaction commits """
+    def push():
+        try:
+            get_redis().rpush(QUEUE_KEY, *media_ids)
+        except RedisError as e:
+            print(f"Failed to queue media {media_ids} for variants: {e}")
+
+    if media_ids:
+        transaction.on_commit(push)
+
+
+def generate(media):
+    """ Encodes and uploads the variants of an image and records their keys on the media row """
+    if not is_image(media):
+        return {}
+
+    config = get_config()
+    s3 = get_s3_client()
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    key = str(media.file.name) if hasattr(media.file, "name") else str(media.file)
+
+    original = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    with Image.open(io.BytesIO(original)) as image:
+        # Bake the EXIF orientation into the pixels; the encodes below carry no EXIF
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+        # Never upscale; an image narrower than the smallest width gets one variant at its own size
+        widths = [width for width in config["WIDTHS"] if width < image.width] or [image.width]
+        variants = {}
+        for width in widths:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+            for extension in get_formats():
+                pillow_format, content_type = FORMATS[extension]
+                output = io.BytesIO()
+                resized.save(output, pillow_format, quality=config["QUALITY"])
+                output.seek(0)
+                target = variant_key(key, width, extension)
+                s3.upload_fileobj(output, bucket, target, ExtraArgs={
+                    "ContentType": content_type,
+                    "CacheControl": "public, max-age=31536000, immutable",
+                })
+                variants.setdefault(extension, {})[str(width)] = target
+
+    media.variants = variants
+    # save() rather than update(): post_save drops the chats' recent-messages caches
+    media.save(update_fields=["variants"])
+    return variants
+
+
+def process(media_id):
+    media = UserMedia.objects.filter(id=media_id).first()
+    if media is None or media.variants:
+        return
+    # Same content uploaded before: its variants are already stored
+    if media.content_id is not None:
+        processed = UserMedia.objects.filter(content_id=media.content_id).exclude(variants={}).first()
+        if processed is not None:
+            media.variants = processed.variants
+            media.save(update_fields=["variants"])
+            return
+    try:
+        generate(media)
+    except Exception as e:
+        print(f"Failed to generate variants for media {media_id}: {e}")
+
+
+def run(timeout=5):
+    """ Processes queued media until interrupted """
+    redis = get_redis()
+    while True:
+        item = redis.blpop(QUEUE_KEY, timeout=timeout)
+        if item is not None:
+            process(int(item[1]))
+
+
+def drain():
+    """ Processes the media currently queued and returns how many there were """
+    redis = get_redis()
+    processed = 0
+    while (media_id := redis.lpop(QUEUE_KEY)) is not None:
+        process(int(media_id))
+        processed += 1
+    return processed
@@ -0,0 +1,253 @@
+"""
+Poster frames and HLS renditions of uploaded videos.
+
+Uploads enqueue new video media in Redis once their transaction commits;
+`manage.py process_videos` pops them and, with the local ffmpeg/ffprobe:
+
+- probes the duration and the displayed dimensions (rotation applied),
+- extracts a JPEG poster frame,
+- encodes an HLS ladder (one H.264/AAC rendition per AWS_S3_VIDEO["RENDITIONS"]
+  entry not taller than the source) with keyframes aligned on segment
+  boundaries, and writes a master playlist referencing them.
+
+Everything is stored next to the original key:
+
+    mp4/3f2a....mp4 -> mp4/3f2a..._poster.jpg
+                       mp4/3f2a..._hls/master.m3u8
+                       mp4/3f2a..._hls/720p/index.m3u8, segment_000.ts, ...
+
+A video that cannot be processed keeps its error in UserMedia.video_error and
+is left out of `process_videos --pending` until retried with --retry-failed.
+"""
+import json
+import os
+import subprocess
+import tempfile
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from redis.exceptions import RedisError
+from backend.redis_client import get_redis
+from .client import get_s3_client
+from .models import UserMedia
+
+QUEUE_KEY = "media:video:queue"
+
+CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".jpg": "image/jpeg",
+}
+
+
+def get_config():
+    return settings.AWS_S3_VIDEO
+
+
+def is_video(media):
+    return media.content_type.startswith("video/")
+
+
+def enqueue(*media_ids):
+    """ Queues media for the video worker once the current transaction commits """
+    def push():
+        try:
+            get_redis().rpush(QUEUE_KEY, *media_ids)
+        except RedisError as e:
+            print(f"Failed to queue media {media_ids} for video processing: {e}")
+
+    if media_ids:
+        transaction.on_commit(push)
+
+
+def rotation(stream):
+    """ Degrees the player rotates a video stream by, from its display matrix or legacy rotate tag """
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            return int(float(side_data["rotation"]))
+    return int(stream.get("tags", {}).get("rotate", 0))
+
+
+def probe(path):
+    """
+    Returns (duration in seconds or None, width, height, has_audio) of a video
+    file. Width and height are as displayed: ffmpeg applies the rotation of
+    phone videos when encoding, so the ladder is built on the rotated size.
+    The duration comes from the container, or from the streams when the
+    container has none (e.g. WebM recorded by MediaRecorder).
+    """
+    output = subprocess.run(
+        [
+            get_config()["FFPROBE"], "-v", "error",
+            "-show_entries", "stream=codec_type,width,height,duration:stream_side_data=rotation:stream_tags=rotate:format=duration",
+            "-of", "json", path,
+        ],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    info = json.loads(output)
+    video = next(stream for stream in info["streams"] if stream.get("codec_type") == "video")
+    has_audio = any(stream.get("codec_type") == "audio" for stream in info["streams"])
+
+    durations = [info.get("format", {}).get("duration")] + [stream.get("duration") for stream in info["streams"]]
+    duration = next((float(value) for value in durations if value not in (None, "N/A")), None)
+    width, height = int(video["width"]), int(video["height"])
+    if rotation(video) % 180:
+        width, height = height, width
+    return duration, width, height, has_audio
+
+
+def select_renditions(height):
+    """ Renditions not taller than the source; a source below the ladder gets the lowest one at its own height """
+    renditions = get_config()["RENDITIONS"]
+    selected = [rendition for rendition in renditions if rendition["height"] <= height]
+    return selected or [{**renditions[0], "height": height - height % 2}]
+
+
+def scaled_width(width, height, target_height):
+    """ Width keeping the aspect ratio, rounded to an even number as H.264 requires """
+    return max(2, round(width * target_height / height / 2) * 2)
+
+
+def build_master_playlist(renditions, width, height):
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for rendition in renditions:
+        bandwidth = (rendition["video_bitrate"] + rendition["audio_bitrate"]) * 1000
+        resolution = f"{scaled_width(width, height, rendition['height'])}x{rendition['height']}"
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={resolution}")
+        lines.append(f"{rendition['height']}p/index.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def encode_rendition(source, directory, rendition, has_audio):
+    config = get_config()
+    segment_seconds = config["SEGMENT_SECONDS"]
+    output_directory = os.path.join(directory, f"{rendition['height']}p")
+    os.makedirs(output_directory)
+    command = [
+        config["FFMPEG"], "-v", "error", "-y", "-i", source,
+        "-map", "0:v:0", "-vf", f"scale=-2:{rendition['height']}",
+        "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main",
+        "-b:v", f"{rendition['video_bitrate']}k",
+        "-maxrate", f"{rendition['video_bitrate'] * 1.07:.0f}k",
+        "-bufsize", f"{rendition['video_bitrate'] * 1.5:.0f}k",
+        # Keyframes on segment boundaries so players can switch renditions between segments
+        "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})", "-sc_threshold", "0",
+    ]
+    if has_audio:
+        command += ["-map", "0:a:0", "-c:a", "aac", "-b:a", f"{rendition['audio_bitrate']}k", "-ac", "2"]
+    command += [
+        "-f", "hls", "-hls_time", str(segment_seconds), "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(output_directory, "segment_%03d.ts"),
+        os.path.join(output_directory, "index.m3u8"),
+    ]
+    subprocess.run(command, check=True, capture_output=True)
+
+
+def extract_poster(source, path, duration):
+    subprocess.run(
+        [
+            get_config()["FFMPEG"], "-v", "error", "-y",
+            "-ss", f"{min(1.0, duration / 2) if duration else 0:.2f}", "-i", source,
+            "-frames:v", "1", "-q:v", "3", path,
+        ],
+        check=True, capture_output=True,
+    )
+
+
+def upload_directory(s3, directory, prefix):
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            key = f"{prefix}/{os.path.relpath(path, directory).replace(os.sep, '/')}"
+            s3.upload_file(path, bucket, key, ExtraArgs={
+                "ContentType": CONTENT_TYPES.get(os.path.splitext(filename)[1], "application/octet-stream"),
+                "CacheControl": "public, max-age=31536000, immutable",
+            })
+
+
+def generate(media):
+    """ Probes a video, uploads its poster and HLS ladder and records them on the media row """
+    if not is_video(media):
+        return
+    s3 = get_s3_client()
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    key = str(media.file.name) if hasattr(media.file, "name") else str(media.file)
+    base = os.path.splitext(key)[0]
+
+    with tempfile.TemporaryDirectory(prefix="video-") as directory:
+        source = os.path.join(directory, "source")
+        s3.download_file(bucket, key, source)
+        duration, width, height, has_audio = probe(source)
+
+        poster_path = os.path.join(directory, "poster.jpg")
+        extract_poster(source, poster_path, duration)
+        poster_key = f"{base}_poster.jpg"
+        s3.upload_file(poster_path, bucket, poster_key, ExtraArgs={
+            "ContentType": "image/jpeg", "CacheControl": "public, max-age=31536000, immutable",
+        })
+
+        hls_directory = os.path.join(directory, "hls")
+        os.makedirs(hls_directory)
+        renditions = select_renditions(height)
+        for rendition in renditions:
+            encode_rendition(source, hls_directory, rendition, has_audio)
+        with open(os.path.join(hls_directory, "master.m3u8"), "w") as playlist:
+            playlist.write(build_master_playlist(renditions, width, height))
+        upload_directory(s3, hls_directory, f"{base}_hls")
+
+    fields = {
+        "duration": duration,
+        "width": width,
+        "height": height,
+        "poster": poster_key,
+        "hls_manifest": f"{base}_hls/master.m3u8",
+        "video_error": "",
+    }
+    for name, value in fields.items():
+        setattr(media, name, value)
+    # save() rather than update(): post_save drops the chats' recent-messages caches
+    media.save(update_fields=list(fields))
+
+
+def process(media_id):
+    media = UserMedia.objects.filter(id=media_id).first()
+    if media is None or media.hls_manifest:
+        return
+    # Same content uploaded before: its poster and renditions are already stored
+    if media.content_id is not None:
+        processed = UserMedia.objects.filter(content_id=media.content_id).exclude(hls_manifest="").first()
+        if processed is not None:
+            fields = ["duration", "width", "height", "poster", "hls_manifest"]
+            for name in fields:
+                setattr(media, name, getattr(processed, name))
+            media.save(update_fields=fields)
+            return
+    try:
+        generate(media)
+    except Exception as e:
+        print(f"Failed to process video of media {media_id}: {e}")
+        media.video_error = str(e)[:255] or type(e).__name__
+        try:
+            media.save(update_fields=["video_error"])
+        except DatabaseError:
+            # Deleted while it was being processed
+            pass
+
+
+def run(timeout=5):
+    """ Processes queued videos until interrupted """
+    redis = get_redis()
+    while True:
+        item = redis.blpop(QUEUE_KEY, timeout=timeout)
+        if item is not None:
+            process(int(item[1]))
+
+
+def drain():
+    """ Processes the videos currently queued and returns how many there were """
+    redis = get_redis()
+    processed = 0
+    while (media_id := redis.lpop(QUEUE_KEY)) is not None:
+        process(int(media_id))
+        processed += 1
+    return processed
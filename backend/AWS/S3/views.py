@@ -1,23 +1,91 @@
-import boto3
-import os
-import uuid
 import mimetypes
+import re
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
 from django.conf import settings
-from django.http import StreamingHttpResponse
+from django.http import StreamingHttpResponse, HttpResponseNotModified, FileResponse
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
 from rest_framework.views import APIView
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.parsers import MultiPartParser, FormParser
+from accounts.authentication import CachedTokenAuthentication
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework import status
 from .models import UserMedia
 from .serializers import UserMediaSerializer
-from django.core.files.base import ContentFile
-from django.utils.timezone import now
+from .client import get_s3_client
+from .disk_cache import media_cache
+from .services import (
+    upload_files, release_media, create_direct_upload, finalize_direct_upload, MediaUploadError,
+)
+
+# A single byte range; anything else is ignored and the whole object is sent
+RANGE_RE = re.compile(r"^bytes=(\d+-\d*|-\d+)$")
+STREAM_CHUNK_SIZE = 64 * 1024
+# Keys are never reused for other content, so clients may keep media for good
+MEDIA_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+def stream_body(body, chunk_size=STREAM_CHUNK_SIZE):
+    """ Streams an S3 response body in fixed-size chunks and releases its connection at the end """
+    try:
+        for chunk in body.iter_chunks(chunk_size=chunk_size):
+            yield chunk
+    finally:
+        body.close()
+
+def s3_error_response(error):
+    """ Maps an S3 ClientError of get_object to the response of S3FileGetView """
+    metadata = error.response.get("ResponseMetadata", {})
+    error_status = metadata.get("HTTPStatusCode")
+    if error_status == status.HTTP_304_NOT_MODIFIED:
+        response = HttpResponseNotModified()
+        response["ETag"] = metadata.get("HTTPHeaders", {}).get("etag", "")
+        response["Cache-Control"] = MEDIA_CACHE_CONTROL
+        return response
+    if error_status == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE:
+        return Response({"error": "Requested range not satisfiable"}, status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+    if error_status == status.HTTP_404_NOT_FOUND:
+        return Response({"error": "File not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response({"error": str(error)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+def is_not_modified(request, etag, last_modified):
+    """
+    Evaluates If-None-Match and If-Modified-Since the way S3 does for
+    get_object, so cached and uncached media answer alike: a list of
+    (possibly weak) ETags or * is accepted, and If-Modified-Since is only
+    looked at without If-None-Match.
+    """
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        etags = [etag.removeprefix("W/") for etag in parse_etags(if_none_match)]
+        return "*" in etags or etag.removeprefix("W/") in etags
+    modified_since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+    return modified_since is not None and parse_http_date_safe(last_modified) <= modified_since
+
+def cached_file_response(request, entry):
+    """
+    Serves a disk cache entry, answering matching conditional headers with 304.
+    Returns None if the file is gone, to be served from S3 instead.
+    """
+    if is_not_modified(request, entry.etag, entry.last_modified):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            response = FileResponse(open(entry.path, "rb"), content_type=entry.content_type)
+        except FileNotFoundError:
+            # Evicted by another process sharing the directory
+            media_cache.invalidate(entry.key)
+            return None
+        response["Content-Length"] = entry.size
+        response["Accept-Ranges"] = "bytes"
+    response["ETag"] = entry.etag
+    response["Last-Modified"] = entry.last_modified
+    response["Cache-Control"] = MEDIA_CACHE_CONTROL
+    return response
 
 class S3FileUploadView(APIView):
     parser_classes = [MultiPartParser, FormParser]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     
     def post(self, request, *args, **kwargs):
@@ -26,40 +94,68 @@ class S3FileUploadView(APIView):
 
         file = request.FILES["file"]
         title = request.data.get("title", file.name[:100])
-        file_extension = os.path.splitext(file.name)[1].lower().lstrip(".")  # Remove the dot
-        
-        # If the extension is unknown, use "unknown"
-        folder = file_extension if file_extension else "unknown"
-        
-        unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
-        s3_key = f"{folder}/{unique_filename}"
-        
-        try:
-            s3 = boto3.client(
-                "s3",
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_S3_REGION_NAME,
-            )
-
-            file_content = file.read()
-            s3.upload_fileobj(ContentFile(file_content), settings.AWS_STORAGE_BUCKET_NAME, s3_key)
-
-            file_url = f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/{s3_key}"
 
-            media = UserMedia.objects.create(title=title, file=s3_key, uploaded_at=now())
+        try:
+            # Streamed to S3 in parts, or not sent at all if the same content is already stored
+            with upload_files([file], uploaded_by=request.user, titles=[title]) as media_objects:
+                media = media_objects[0]
             serializer = UserMediaSerializer(media)
 
             return Response({
                 "message": "File uploaded successfully",
-                "file_url": file_url,
+                "file_url": serializer.data["file_url"],
                 "data": serializer.data
             }, status=status.HTTP_201_CREATED)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class S3DirectUploadView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Issues a presigned POST for uploading one file straight to S3.
+        Expects "filename", "content_type" and "size"; the browser posts the
+        returned "fields" plus the file to "url", then calls the finalize
+        endpoint with "token".
+        """
+        filename = request.data.get("filename")
+        content_type = request.data.get("content_type")
+        try:
+            size = int(request.data.get("size"))
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid 'size' parameter"}, status=status.HTTP_400_BAD_REQUEST)
+        if not filename or not content_type:
+            return Response({"error": "'filename' and 'content_type' are required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            upload = create_direct_upload(request.user, filename, content_type, size)
+        except MediaUploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(upload, status=status.HTTP_200_OK)
+
+class S3DirectUploadFinalizeView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        """ Verifies a direct upload by its "token" and creates the UserMedia row """
+        token = request.data.get("token")
+        if not token:
+            return Response({"error": "'token' is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            media = finalize_direct_upload(request.user, token)
+        except MediaUploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "message": "File uploaded successfully",
+            "data": UserMediaSerializer(media).data,
+        }, status=status.HTTP_201_CREATED)
+
 class S3FileGetView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
@@ -73,25 +169,59 @@ class S3FileGetView(APIView):
             return Response({"error": "File not found"}, status=status.HTTP_404_NOT_FOUND)
 
         s3_key = str(media.file.name) if hasattr(media.file, "name") else str(media.file)
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_S3_REGION_NAME,
-        )
+        s3 = get_s3_client()
 
-        try:
-            s3_response = s3.get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=s3_key)
-            file_stream = s3_response["Body"]
-            content_type = s3_response.get("ContentType") or mimetypes.guess_type(s3_key)[0] or "application/octet-stream"
+        # Whole-object requests are served from the local disk cache; ranges go to S3
+        range_header = request.META.get("HTTP_RANGE", "")
+        if media_cache.is_enabled() and not RANGE_RE.match(range_header):
+            try:
+                entry = media_cache.get_or_fetch(
+                    s3_key,
+                    lambda: s3.get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=s3_key),
+                    size_hint=media.size,
+                )
+            except ClientError as e:
+                return s3_error_response(e)
+            response = cached_file_response(request, entry) if entry is not None else None
+            if response is not None:
+                return response
+
+        # Conditional and range headers are evaluated by S3 against the object's metadata
+        get_kwargs = {"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": s3_key}
+        if RANGE_RE.match(range_header):
+            get_kwargs["Range"] = range_header
+        if request.META.get("HTTP_IF_NONE_MATCH"):
+            get_kwargs["IfNoneMatch"] = request.META["HTTP_IF_NONE_MATCH"]
+        elif request.META.get("HTTP_IF_MODIFIED_SINCE"):
+            modified_since = parse_http_date_safe(request.META["HTTP_IF_MODIFIED_SINCE"])
+            if modified_since is not None:
+                get_kwargs["IfModifiedSince"] = datetime.fromtimestamp(modified_since, tz=timezone.utc)
 
-            return StreamingHttpResponse(file_stream, content_type=content_type)
+        try:
+            s3_response = s3.get_object(**get_kwargs)
+        except ClientError as e:
+            return s3_error_response(e)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        content_type = s3_response.get("ContentType") or mimetypes.guess_type(s3_key)[0] or "application/octet-stream"
+        response = StreamingHttpResponse(
+            stream_body(s3_response["Body"]),
+            content_type=content_type,
+            status=status.HTTP_206_PARTIAL_CONTENT if s3_response.get("ContentRange") else status.HTTP_200_OK,
+        )
+        response["Content-Length"] = s3_response["ContentLength"]
+        response["Accept-Ranges"] = "bytes"
+        response["ETag"] = s3_response["ETag"]
+        response["Last-Modified"] = http_date(s3_response["LastModified"].timestamp())
+        response["Cache-Control"] = MEDIA_CACHE_CONTROL
+        if s3_response.get("ContentRange"):
+            response["Content-Range"] = s3_response["ContentRange"]
+        return response
+
 class S3FileDeleteView(APIView):
     parser_classes = [MultiPartParser, FormParser]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     
     def delete(self, request, *args, **kwargs):
@@ -102,16 +232,44 @@ class S3FileDeleteView(APIView):
             media = UserMedia.objects.get(id=file_id)
         except UserMedia.DoesNotExist:
             return Response({"error": "File not found"}, status=status.HTTP_404_NOT_FOUND)
-        s3_key = media.file.name if hasattr(media.file, "name") else media.file
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_S3_REGION_NAME,
-        )
         try:
-            s3.delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=s3_key)
-            media.delete()
+            # The S3 object goes with the last media referencing its content
+            release_media([media])
             return Response({"message": "File deleted successfully"}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class S3BulkDeleteView(APIView):
+    parser_classes = [JSONParser, FormParser]
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    # One delete_objects request worth of media
+    MAX_IDS = 1000
+
+    def post(self, request, *args, **kwargs):
+        """ Deletes up to MAX_IDS media of the user at once; admins may delete anyone's """
+        ids = request.data.getlist("ids") if hasattr(request.data, "getlist") else request.data.get("ids")
+        if not isinstance(ids, list) or not ids:
+            return Response({"error": "ids must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.MAX_IDS:
+            return Response({"error": f"At most {self.MAX_IDS} ids per request"}, status=status.HTTP_400_BAD_REQUEST)
+        if not all(str(media_id).isdigit() for media_id in ids):
+            return Response({"error": "ids must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        media_objects = UserMedia.objects.filter(id__in=ids).only("id", "file", "content_id")
+        if not request.user.is_staff:
+            media_objects = media_objects.filter(uploaded_by=request.user)
+        media_objects = list(media_objects)
+        try:
+            release_media(media_objects)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({"deleted": sorted(media.id for media in media_objects)}, status=status.HTTP_200_OK)
+
+class S3CacheStatsView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        """ Hit ratio and size of this node's media disk cache """
+        return Response(media_cache.stats(), status=status.HTTP_200_OK)
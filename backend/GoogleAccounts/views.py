@@ -1,7 +1,7 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
+from accounts.authentication import CachedTokenAuthentication
 from rest_framework.authtoken.models import Token
 from rest_framework import status
 from .models import GoogleAccount
@@ -12,7 +12,7 @@ class GoogleAccountRetrieveView(APIView):
     View for retrieving the linked Google account of the current user.
     """
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
 
     def get(self, request, *args, **kwargs):
         try:
@@ -31,7 +31,7 @@ class GoogleAccountLinkView(APIView):
     Before linking, it is additionally checked that the given google_id is not linked to another user.
     """
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
 
     def post(self, request, *args, **kwargs):
         google_id = request.data.get("google_id")
@@ -66,7 +66,7 @@ class GoogleAccountUnlinkView(APIView):
     View for unlinking the Google account from the current user.
     """
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
 
     def delete(self, request, *args, **kwargs):
         try:
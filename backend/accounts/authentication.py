@@ -0,0 +1,136 @@
+"""
+Token authentication with a cached token -> user lookup.
+
+DRF's TokenAuthentication joins authtoken_token and the user table on every
+request, and InactiveUserMiddleware used to run the same lookup before it.
+Here the lookup runs once per request (the middleware stores its result on
+the request for CachedTokenAuthentication) and is served from two caches:
+
+- a small per-process dict, LOCAL_TTL seconds,
+- Redis, TTL seconds, shared by every worker.
+
+Only a summary of the user is cached (USER_FIELDS); the user is rebuilt from
+it as a model instance whose other fields are deferred, so reading them loads
+them and save() only writes the loaded fields.
+
+accounts/signals.py drops the entries of a user whenever the user is saved
+or deleted and the entry of a token when it is deleted. Other processes may
+still use their local copy for up to LOCAL_TTL seconds.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from redis.exceptions import RedisError
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from backend.redis_client import get_redis
+from .models import UserProfile
+
+TOKEN_KEY = "accounts:token:{key}"
+USER_FIELDS = ["id", "username", "email", "phone_number", "avatar_id", "is_active", "is_staff", "is_superuser"]
+# Attribute of the Django request holding the (user, token) resolved by InactiveUserMiddleware
+REQUEST_ATTRIBUTE = "_token_auth"
+
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def get_config():
+    return settings.AUTH_TOKEN_CACHE
+
+
+def cache_key(key):
+    return TOKEN_KEY.format(key=key)
+
+
+def build(key, summary):
+    """ (user, token) model instances from a cached summary """
+    # from_db takes the values in the order of the model's fields
+    fields = [field.attname for field in UserProfile._meta.concrete_fields if field.attname in USER_FIELDS]
+    user = UserProfile.from_db("default", fields, [summary[field] for field in fields])
+    token = Token.from_db("default", ["key", "user_id"], [key, user.id])
+    token.user = user
+    return user, token
+
+
+def get_local(key):
+    with _local_lock:
+        entry = _local.get(key)
+        if entry is None:
+            return None
+        expires_at, summary = entry
+        if expires_at < time.monotonic():
+            del _local[key]
+            return None
+        return summary
+
+
+def set_local(key, summary):
+    config = get_config()
+    with _local_lock:
+        _local[key] = (time.monotonic() + config["LOCAL_TTL"], summary)
+        _local.move_to_end(key)
+        while len(_local) > config["LOCAL_MAX_ENTRIES"]:
+            _local.popitem(last=False)
+
+
+def resolve(key):
+    """ Returns (user, token) for a token key, or None if there is no such token """
+    summary = get_local(key)
+    if summary is None:
+        try:
+            raw = get_redis().get(cache_key(key))
+            summary = json.loads(raw) if raw else None
+        except RedisError as e:
+            print(f"Token cache read failed: {e}")
+        if summary is None:
+            token = Token.objects.select_related("user").only(
+                "key", "user_id", *[f"user__{field}" for field in USER_FIELDS]
+            ).filter(key=key).first()
+            if token is None:
+                return None
+            summary = {field: getattr(token.user, field) for field in USER_FIELDS}
+            try:
+                get_redis().set(cache_key(key), json.dumps(summary), ex=get_config()["TTL"])
+            except RedisError as e:
+                print(f"Token cache write failed: {e}")
+        set_local(key, summary)
+    return build(key, summary)
+
+
+def invalidate(*keys):
+    """ Drops cached token lookups, e.g. after the user was deactivated """
+    if not keys:
+        return
+    with _local_lock:
+        for key in keys:
+            _local.pop(key, None)
+    try:
+        get_redis().delete(*[cache_key(key) for key in keys])
+    except RedisError as e:
+        print(f"Token cache invalidation failed: {e}")
+
+
+def invalidate_user(user_id):
+    invalidate(*Token.objects.filter(user_id=user_id).values_list("key", flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """ TokenAuthentication backed by resolve(); reuses the lookup InactiveUserMiddleware already made """
+
+    def authenticate(self, request):
+        resolved = getattr(request._request, REQUEST_ATTRIBUTE, None)
+        if resolved is not None:
+            return resolved
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        resolved = resolve(key)
+        if resolved is None:
+            raise AuthenticationFailed("Invalid token.")
+        if not resolved[0].is_active:
+            raise AuthenticationFailed("User inactive or deleted.")
+        return resolved
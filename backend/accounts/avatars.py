@@ -0,0 +1,114 @@
+"""
+Avatars stored in the media bucket.
+
+An avatar is a UserMedia referenced by UserProfile.avatar, uploaded through
+upload_files so identical images share one object. When it is set, a square,
+centre-cropped WebP is written next to the original for every
+AWS_S3_AVATAR_SIZES entry:
+
+    png/3f2a....png -> png/3f2a..._avatar_64.webp, png/3f2a..._avatar_256.webp, ...
+
+The keys follow from the original key, so responses build the
+{"small", "medium", "large"} URLs from the UserMedia row alone. Stored under
+"<original>_", they are deleted with the original by release_media.
+
+Avatars used to be kept as base64 text in UserProfile.avatar_base64, which
+is no longer read; `manage.py move_base64_avatars` moves them here.
+"""
+import base64
+import binascii
+import io
+import mimetypes
+import os
+import magic
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from PIL import Image, ImageOps
+from AWS.S3.client import get_s3_client
+from AWS.S3.serializers import object_url
+from AWS.S3.services import upload_files, release_media, MediaUploadError
+from .authentication import invalidate_user
+from .models import UserProfile
+from . import profile_cache
+
+
+def size_key(key, pixels):
+    return f"{os.path.splitext(key)[0]}_avatar_{pixels}.webp"
+
+
+def render_sizes(data):
+    """ Yields (pixels, WebP bytes) for every configured size of an image """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        for pixels in sorted(set(settings.AWS_S3_AVATAR_SIZES.values())):
+            square = ImageOps.fit(image, (pixels, pixels), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            square.save(output, "WEBP", quality=settings.AWS_S3_IMAGE_VARIANTS["QUALITY"])
+            yield pixels, output.getvalue()
+
+
+def upload_sizes(s3, key, data):
+    for pixels, encoded in render_sizes(data):
+        s3.put_object(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=size_key(key, pixels), Body=encoded,
+            ContentType="image/webp", CacheControl="public, max-age=31536000, immutable",
+        )
+
+
+def avatar_urls(media):
+    """ {size name: URL} of an avatar, None without one """
+    if media is None:
+        return None
+    key = str(media.file)
+    return {name: object_url(size_key(key, pixels)) for name, pixels in settings.AWS_S3_AVATAR_SIZES.items()}
+
+
+def set_avatar(user, file_obj):
+    """ Stores an uploaded image as the user's avatar and releases the previous one """
+    previous = user.avatar
+    with upload_files([file_obj], uploaded_by=user, titles=["avatar"], derivatives=False) as (media,):
+        file_obj.seek(0)
+        upload_sizes(get_s3_client(), str(media.file), file_obj.read())
+        UserProfile.objects.filter(id=user.id).update(avatar=media)
+    user.avatar = media
+    # The avatar was set with an update, which sends no post_save
+    transaction.on_commit(lambda: invalidate_user(user.id))
+    transaction.on_commit(lambda: profile_cache.invalidate(user.id))
+    if previous is not None:
+        transaction.on_commit(lambda: release_media([previous]))
+    return media
+
+
+def move_base64_avatars(batch_size=100):
+    """
+    Stores the legacy base64 avatars with set_avatar and empties the column,
+    one transaction per user. Avatars that are no decodable image, and those
+    of users who have set a new avatar since, are dropped. Returns (moved, dropped).
+    """
+    pending = UserProfile.objects.exclude(avatar_base64__isnull=True).exclude(avatar_base64="").order_by("id")
+    moved = dropped = 0
+    while batch := list(pending.select_related("avatar")[:batch_size]):
+        for user in batch:
+            with transaction.atomic():
+                UserProfile.objects.filter(id=user.id).update(avatar_base64=None)
+                if user.avatar_id is not None:
+                    dropped += 1
+                    continue
+                try:
+                    # The frontends stored either bare base64 or a data: URL
+                    data = base64.b64decode(user.avatar_base64.split(",", 1)[-1])
+                    content_type = magic.from_buffer(data[:2048], mime=True)
+                    if not content_type.startswith("image/"):
+                        raise ValueError(f"{content_type} is not an image")
+                    name = f"avatar{mimetypes.guess_extension(content_type) or ''}"
+                    # A savepoint, so a failed upload keeps the column emptied
+                    with transaction.atomic():
+                        set_avatar(user, SimpleUploadedFile(name, data, content_type=content_type))
+                except (binascii.Error, ValueError, OSError, MediaUploadError) as e:
+                    print(f"Dropping avatar of user {user.id}: {e}")
+                    dropped += 1
+                else:
+                    moved += 1
+    return moved, dropped
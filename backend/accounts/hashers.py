@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hashers, get_hashers_by_algorithm
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    pbkdf2_sha256 with the iteration count of PASSWORD_HASHING["ITERATIONS"].
+
+    The count is read when the hasher is instantiated and kept on the
+    instance, so a hasher sent to the hashing process pool (see
+    accounts/hashing.py) uses the parameters of the process that sent it.
+    Hashes with another count report must_update and are rehashed on login.
+    """
+
+    def __init__(self):
+        self.iterations = settings.PASSWORD_HASHING["ITERATIONS"]
+
+
+@receiver(setting_changed)
+def reset_hashers(*, setting, **kwargs):
+    if setting == "PASSWORD_HASHING":
+        get_hashers.cache_clear()
+        get_hashers_by_algorithm.cache_clear()
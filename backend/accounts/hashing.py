@@ -0,0 +1,98 @@
+"""
+Password hashing off the event loop.
+
+PBKDF2 takes hundreds of milliseconds of CPU per password. The async login
+and registration views hand it to a dedicated process pool of
+PASSWORD_HASHING["WORKERS"] processes, so a burst of logins neither blocks
+the event loop nor holds the GIL other requests of the worker need.
+
+At most MAX_PENDING hashes are queued or running; beyond that HashingBusy is
+raised right away and the view answers 503 instead of queueing without bound.
+
+The hasher instances are pickled to the pool together with their parameters
+(see accounts/hashers.py); the pool processes only run the hash functions.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, identify_hasher, is_password_usable
+
+_executor = None
+_lock = threading.Lock()
+_pending = None
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def init_worker():
+    import django
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    django.setup()
+
+
+def get_executor():
+    global _executor, _pending
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                config = settings.PASSWORD_HASHING
+                _pending = threading.BoundedSemaphore(config["MAX_PENDING"])
+                # spawn: forking a server process with running threads is unsafe
+                _executor = ProcessPoolExecutor(
+                    max_workers=config["WORKERS"],
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker,
+                )
+    return _executor
+
+
+def verify(hasher, password, encoded):
+    return hasher.verify(password, encoded)
+
+
+def encode(hasher, password, salt):
+    return hasher.encode(password, salt)
+
+
+async def run(function, *args):
+    executor = get_executor()
+    if not _pending.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        return await asyncio.wrap_future(executor.submit(function, *args))
+    finally:
+        _pending.release()
+
+
+async def make_password(password):
+    """ Async counterpart of django.contrib.auth.hashers.make_password """
+    hasher = get_hasher("default")
+    return await run(encode, hasher, password, hasher.salt())
+
+
+async def check_password(user, password):
+    """
+    Async counterpart of user.check_password: verifies in the pool and, when
+    the stored hash uses another hasher or other parameters than the default
+    one, stores a new hash of the password.
+    """
+    encoded = user.password
+    if password is None or not is_password_usable(encoded):
+        return False
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    if not await run(verify, hasher, password, encoded):
+        return False
+
+    preferred = get_hasher("default")
+    if hasher.algorithm != preferred.algorithm or preferred.must_update(encoded):
+        user.password = await make_password(password)
+        await type(user).objects.filter(id=user.id).aupdate(password=user.password)
+    return True
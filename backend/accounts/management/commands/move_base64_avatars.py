@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from accounts import avatars
+
+class Command(BaseCommand):
+    help = "Moves the legacy base64 avatars of UserProfile.avatar_base64 to the media bucket."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Users loaded per query.")
+
+    def handle(self, *args, **options):
+        moved, dropped = avatars.move_base64_avatars(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} avatars, dropped {dropped}."))
@@ -1,21 +1,48 @@
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
 from django.utils.deprecation import MiddlewareMixin
 from django.http import JsonResponse
 from rest_framework.authtoken.models import Token
+from . import authentication
 
 class InactiveUserMiddleware(MiddlewareMixin):
+    """
+    Logs out deactivated users. The token lookup is kept on the request so
+    CachedTokenAuthentication does not repeat it (see accounts/authentication.py).
+    """
     def process_request(self, request):
         auth_header = request.headers.get("Authorization")
         if auth_header and auth_header.startswith("Token "):
             token_key = auth_header.split(" ")[1]
-            try:
-                token = Token.objects.get(key=token_key)
-                user = token.user
-                
-                if not user.is_active:
-                    token.delete()
-                    return JsonResponse(
-                        {"error": "Your account is inactive.", "forceLogout": True}, 
-                        status=403
-                    )
-            except Token.DoesNotExist:
-                pass
+            resolved = authentication.resolve(token_key)
+            if resolved is None:
+                return
+            user, token = resolved
+            if not user.is_active:
+                Token.objects.filter(key=token_key).delete()
+                return JsonResponse(
+                    {"error": "Your account is inactive.", "forceLogout": True}, 
+                    status=403
+                )
+            setattr(request, authentication.REQUEST_ATTRIBUTE, resolved)
+
+
+class WebSocketTokenAuthMiddleware(BaseMiddleware):
+    """
+    Channels middleware that populates scope["user"] from a "?token=<key>" query
+    parameter, since browsers cannot set an Authorization header on WebSockets.
+    Must sit inside AuthMiddlewareStack so it overrides the session user.
+    """
+    async def __call__(self, scope, receive, send):
+        token_key = parse_qs(scope.get("query_string", b"").decode()).get("token", [None])[0]
+        if token_key:
+            scope = dict(scope, user=await self.get_user(token_key))
+        return await super().__call__(scope, receive, send)
+
+    async def get_user(self, token_key):
+        resolved = await database_sync_to_async(authentication.resolve)(token_key)
+        if resolved is None or not resolved[0].is_active:
+            return AnonymousUser()
+        return resolved[0]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:55
+
+import accounts.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('S3', '0007_mediacontent'),
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='userprofile',
+            managers=[
+                ('objects', accounts.models.UserProfileManager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='avatar_of', to='S3.usermedia'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def report_base64_avatars(apps, schema_editor):
+    """
+    Moving the avatars needs S3 and the current upload code, so it is left to
+    `manage.py move_base64_avatars`; the migration only points at it.
+    """
+    UserProfile = apps.get_model("accounts", "UserProfile")
+    pending = UserProfile.objects.exclude(avatar_base64__isnull=True).exclude(avatar_base64="").count()
+    if pending:
+        print(f"\n  {pending} users still have a base64 avatar, run `manage.py move_base64_avatars` to move them to S3.")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_userprofile_avatar'),
+    ]
+
+    operations = [
+        migrations.RunPython(report_base64_avatars, migrations.RunPython.noop),
+    ]
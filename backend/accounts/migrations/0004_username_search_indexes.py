@@ -0,0 +1,25 @@
+import django.contrib.postgres.indexes
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so the users table stays writable
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0003_move_base64_avatars'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='userprofile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['username'], name='userprofile_username_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='userprofile',
+            index=models.Index(django.db.models.functions.comparison.Collate(django.db.models.functions.text.Upper('username'), 'C'), models.F('id'), name='userprofile_username_prefix'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:13
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def count_subscriptions(apps, schema_editor):
+    """ Fills the new counters, BATCH_SIZE users per statement """
+    UserProfile = apps.get_model("accounts", "UserProfile")
+    UserSubscription = apps.get_model("subscriptions", "UserSubscription")
+
+    def count(field):
+        return Coalesce(Subquery(
+            UserSubscription.objects.filter(**{field: OuterRef("pk")}).order_by()
+            .values(field).annotate(count=Count("id")).values("count")
+        ), 0)
+
+    last_id = 0
+    while batch := list(UserProfile.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:BATCH_SIZE]):
+        last_id = batch[-1]
+        UserProfile.objects.filter(id__in=batch).update(
+            follower_count=count("subscribed_to"), following_count=count("subscriber"),
+        )
+
+
+class Migration(migrations.Migration):
+    # Committed batch by batch, see count_subscriptions
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0004_username_search_indexes'),
+        ('subscriptions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_subscriptions, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,38 @@
-from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.contrib.auth.models import AbstractUser, Group, Permission, UserManager
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Collate, Upper
+
+class UserProfileManager(UserManager):
+    def profiles(self):
+        """ Users as returned by the API: with their avatar row, without the legacy base64 column """
+        return self.defer("avatar_base64").select_related("avatar")
 
 class UserProfile(AbstractUser):
     email = models.EmailField(unique=True)
     phone_number = models.CharField(max_length=15, unique=True)
+    # Legacy inline avatars, emptied by `manage.py move_base64_avatars`; avatars live in S3 (see accounts/avatars.py)
     avatar_base64 = models.TextField(blank=True, null=True)
+    avatar = models.ForeignKey(
+        "S3.UserMedia", on_delete=models.SET_NULL, null=True, blank=True, related_name="avatar_of"
+    )
+    # Denormalized UserSubscription counts, see subscriptions/counters.py
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
     groups = models.ManyToManyField(Group, related_name="user_profiles", blank=True)
     user_permissions = models.ManyToManyField(Permission, related_name="user_profiles", blank=True)
 
+    objects = UserProfileManager()
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Similarity search of usernames (pg_trgm)
+            GinIndex(fields=["username"], opclasses=["gin_trgm_ops"], name="userprofile_username_trgm"),
+            # Case-insensitive prefix autocomplete, scanned in order (see UserSearchView)
+            models.Index(Collate(Upper("username"), "C"), F("id"), name="userprofile_username_prefix"),
+        ]
+
     def __str__(self):
         return self.username
@@ -0,0 +1,6 @@
+from backend.pagination import KeysetPagination
+
+class UserSearchPagination(KeysetPagination):
+    """ Username search results; UserSearchView sets the ordering of the search mode """
+    page_size = 10
+    max_page_size = 50
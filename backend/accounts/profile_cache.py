@@ -0,0 +1,115 @@
+"""
+Cached public profile summaries, for pages that show many authors at once.
+
+A summary is what a feed or a chat needs to draw a user, no contact details:
+
+    {"id": 7, "username": "alice", "avatar": {"small": ..., "medium": ..., "large": ...}}
+
+Summaries are kept in Redis under accounts:profile:<id> for TTL seconds.
+get_profiles() reads them with one MGET and loads the missing ones with a
+single query, so a batch of any size costs at most one round trip to each.
+
+accounts/signals.py drops the summary of a user once a save or deletion of
+the user (or the deletion of their avatar) commits; set_avatar does the
+same, as it changes the avatar with an update.
+
+A read that missed may load the row just before such a change commits and
+write it back after the invalidation. To keep it from caching the old row,
+invalidate() also bumps accounts:profile:<id>:version, read with the
+summaries, and the write-back only happens if the version is unchanged.
+"""
+import json
+from django.conf import settings
+from redis.exceptions import RedisError
+from backend.redis_client import get_redis
+from .models import UserProfile
+from . import avatars
+
+PROFILE_KEY = "accounts:profile:{id}"
+VERSION_KEY = "accounts:profile:{id}:version"
+
+# Caches ARGV[2] under KEYS[1] unless the version in KEYS[2] moved past ARGV[1]
+SET_IF_VERSION_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+"""
+
+
+def get_config():
+    return settings.ACCOUNTS_PROFILE_CACHE
+
+
+def cache_key(user_id):
+    return PROFILE_KEY.format(id=user_id)
+
+
+def version_key(user_id):
+    return VERSION_KEY.format(id=user_id)
+
+
+def summarize(user):
+    return {"id": user.id, "username": user.username, "avatar": avatars.avatar_urls(user.avatar)}
+
+
+def load(user_ids):
+    users = UserProfile.objects.filter(id__in=user_ids).select_related("avatar").only(
+        "id", "username", "avatar", "avatar__file",
+    )
+    return {user.id: summarize(user) for user in users}
+
+
+def get_profiles(user_ids):
+    """ {id: summary} of the existing users among `user_ids` """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+    redis = get_redis()
+    profiles = {}
+    versions = {}
+    try:
+        cached = redis.mget([cache_key(user_id) for user_id in user_ids] + [version_key(user_id) for user_id in user_ids])
+    except RedisError as e:
+        print(f"Profile cache read failed: {e}")
+        cached = None
+    if cached is not None:
+        for user_id, raw, version in zip(user_ids, cached, cached[len(user_ids):]):
+            if raw:
+                profiles[user_id] = json.loads(raw)
+            else:
+                versions[user_id] = version or b""
+
+    missing = [user_id for user_id in user_ids if user_id not in profiles]
+    if missing:
+        loaded = load(missing)
+        profiles.update(loaded)
+        cacheable = [user_id for user_id in loaded if user_id in versions]
+        if cacheable:
+            try:
+                set_if_version = redis.register_script(SET_IF_VERSION_SCRIPT)
+                pipe = redis.pipeline(transaction=False)
+                for user_id in cacheable:
+                    set_if_version(
+                        keys=[cache_key(user_id), version_key(user_id)],
+                        args=[versions[user_id], json.dumps(loaded[user_id]), get_config()["TTL"]],
+                        client=pipe,
+                    )
+                pipe.execute()
+            except RedisError as e:
+                print(f"Profile cache write failed: {e}")
+    return profiles
+
+
+def invalidate(*user_ids):
+    if not user_ids:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.delete(*[cache_key(user_id) for user_id in user_ids])
+        for user_id in user_ids:
+            pipe.incr(version_key(user_id))
+            # Reads started before the invalidation are long over by then
+            pipe.expire(version_key(user_id), get_config()["TTL"])
+        pipe.execute()
+    except RedisError as e:
+        print(f"Profile cache invalidation failed: {e}")
@@ -0,0 +1,57 @@
+"""
+Fixed-window attempt counters in Redis for the login and registration views.
+
+hit() counts one attempt against every given key and reports, in a single
+round trip, whether any of them is over its limit. The views call it before
+looking up the user or hashing anything, so a flood costs one Redis call per
+request. When Redis is unavailable attempts are let through.
+"""
+from django.conf import settings
+from redis.exceptions import RedisError
+from backend.redis_client import get_redis
+
+KEY = "accounts:ratelimit:{scope}:{identifier}"
+
+# KEYS: counters; ARGV: limit and window of each counter, in pairs.
+# Returns the seconds until the longest exceeded window ends, 0 if none is.
+HIT_SCRIPT = """
+local retry_after = 0
+for index, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[index * 2 - 1])
+    local window = tonumber(ARGV[index * 2])
+    local count = redis.call('INCR', key)
+    if count == 1 then
+        redis.call('EXPIRE', key, window)
+    end
+    if count > limit then
+        retry_after = math.max(retry_after, redis.call('TTL', key))
+    end
+end
+return retry_after
+"""
+
+
+def get_config():
+    return settings.LOGIN_RATE_LIMITS
+
+
+def hit(**identifiers):
+    """
+    Counts an attempt for each scope of LOGIN_RATE_LIMITS given as a keyword,
+    e.g. hit(USERNAME="alice", IP="10.0.0.1"). Returns the number of seconds
+    to wait if any limit is exceeded, otherwise None.
+    """
+    config = get_config()
+    keys, args = [], []
+    for scope, identifier in identifiers.items():
+        if identifier:
+            keys.append(KEY.format(scope=scope.lower(), identifier=str(identifier).lower()))
+            args += [config[scope]["LIMIT"], config[scope]["WINDOW"]]
+    if not keys:
+        return None
+    try:
+        retry_after = get_redis().eval(HIT_SCRIPT, len(keys), *keys, *args)
+    except RedisError as e:
+        print(f"Rate limit check failed, letting the attempt through: {e}")
+        return None
+    return max(int(retry_after), 1) if retry_after else None
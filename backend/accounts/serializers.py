@@ -1,11 +1,9 @@
-import base64
 from rest_framework import serializers
 from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from AWS.S3.services import MediaUploadError
 from .models import UserProfile
-from rest_framework import serializers
-from django.contrib.auth.hashers import make_password
-import base64
-from .models import UserProfile
+from .avatars import avatar_urls, set_avatar
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -26,16 +24,29 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         validated_data.pop("confirm_password")  # Delete before saving
         avatar_file = validated_data.pop("avatar", None)
 
-        if avatar_file:
-            validated_data["avatar_base64"] = base64.b64encode(avatar_file.read()).decode("utf-8")
-
-        validated_data["password"] = make_password(validated_data["password"])
-        return UserProfile.objects.create(**validated_data)
+        # RegisterUserView hashes the password in the hashing pool
+        encoded_password = validated_data.pop("encoded_password", None)
+        validated_data["password"] = encoded_password or make_password(validated_data["password"])
+        with transaction.atomic():
+            user = UserProfile.objects.create(**validated_data)
+            if avatar_file:
+                try:
+                    set_avatar(user, avatar_file)
+                except MediaUploadError as e:
+                    raise serializers.ValidationError({"avatar": str(e)})
+        return user
 
 class UserProfileSerializer(serializers.ModelSerializer):
+    avatar = serializers.SerializerMethodField()
+
     class Meta:
         model = UserProfile
-        fields = ['id', 'username', 'email', 'phone_number', 'avatar_base64']
+        fields = ['id', 'username', 'email', 'phone_number', 'avatar', 'follower_count', 'following_count']
+        read_only_fields = ['follower_count', 'following_count']
+
+    def get_avatar(self, obj):
+        """ {"small", "medium", "large"} avatar URLs, null without an avatar """
+        return avatar_urls(obj.avatar)
 
 class UserUpdateSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False)
@@ -49,12 +60,28 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         if "password" in validated_data:
             password = validated_data.pop("password")
             instance.set_password(password)
-        
+
+        avatar_file = validated_data.pop("avatar", None)
+        if avatar_file:
+            try:
+                set_avatar(instance, avatar_file)
+            except MediaUploadError as e:
+                raise serializers.ValidationError({"avatar": str(e)})
+
         for attr, value in validated_data.items():
-            if attr == "avatar" and value:
-                avatar_base64 = base64.b64encode(value.read()).decode("utf-8")
-                setattr(instance, "avatar_base64", avatar_base64)
-            else:
-                setattr(instance, attr, value)
+            setattr(instance, attr, value)
         instance.save()
-        return instance
\ No newline at end of file
+        return instance
+
+
+class UserSearchResultSerializer(serializers.ModelSerializer):
+    """ Lean search/autocomplete entry: no contact details, only the small avatar """
+    avatar = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UserProfile
+        fields = ["id", "username", "avatar"]
+
+    def get_avatar(self, obj):
+        urls = avatar_urls(obj.avatar)
+        return urls["small"] if urls else None
@@ -0,0 +1,34 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from AWS.S3.models import UserMedia
+from .models import UserProfile
+from . import authentication, profile_cache
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_tokens_on_user_save(sender, instance, created, **kwargs):
+    # Covers is_active and every other cached field; a new user has no token yet
+    if not created:
+        authentication.invalidate_user(instance.id)
+        # After the commit, so a concurrent read cannot cache the old row again
+        transaction.on_commit(lambda: profile_cache.invalidate(instance.id))
+
+@receiver(post_delete, sender=UserProfile)
+def invalidate_profile_on_user_delete(sender, instance, **kwargs):
+    # instance.id is cleared once the deletion is over
+    user_id = instance.id
+    transaction.on_commit(lambda: profile_cache.invalidate(user_id))
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    # Also reached when a deleted user's tokens are cascaded
+    authentication.invalidate(instance.key)
+
+@receiver(pre_delete, sender=UserMedia)
+def invalidate_tokens_on_avatar_delete(sender, instance, **kwargs):
+    # SET_NULL clears UserProfile.avatar with an update, which sends no post_save
+    user_ids = list(UserProfile.objects.filter(avatar=instance).values_list("id", flat=True))
+    if user_ids:
+        transaction.on_commit(lambda: [authentication.invalidate_user(user_id) for user_id in user_ids])
+        transaction.on_commit(lambda: profile_cache.invalidate(*user_ids))
@@ -1,3 +1,305 @@
-from django.test import TestCase
+import base64
+import io
+import boto3
+from unittest import mock, skipUnless
+from django.core.management import call_command
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from moto import mock_aws
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from AWS.S3.models import UserMedia
+from .models import UserProfile
+from .avatars import size_key
+from backend.redis_client import get_redis
+from . import profile_cache
 
-# Create your tests here.
+def png(color):
+    content = io.BytesIO()
+    Image.new("RGB", (600, 400), color).save(content, "PNG")
+    return content.getvalue()
+
+@mock_aws
+@override_settings(
+    AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing",
+    AWS_STORAGE_BUCKET_NAME="test-bucket", AWS_S3_REGION_NAME="us-east-1",
+)
+class AvatarTest(TestCase):
+    def setUp(self):
+        self.s3 = boto3.client("s3", region_name="us-east-1")
+        self.s3.create_bucket(Bucket="test-bucket")
+        self.client = APIClient()
+
+    def stored_keys(self):
+        return sorted(item["Key"] for item in self.s3.list_objects_v2(Bucket="test-bucket").get("Contents", []))
+
+    def register(self):
+        response = self.client.post("/api/accounts/register/", {
+            "username": "alice", "email": "alice@example.com", "phone_number": "1",
+            "password": "pass", "confirm_password": "pass",
+            "avatar": SimpleUploadedFile("me.png", png("red"), content_type="image/png"),
+        })
+        self.assertEqual(response.status_code, 201)
+        return UserProfile.objects.get(username="alice")
+
+    def test_registration_stores_the_avatar_in_sizes(self):
+        user = self.register()
+
+        key = str(user.avatar.file)
+        self.assertIsNone(user.avatar_base64)
+        self.assertEqual(self.stored_keys(), sorted([key] + [size_key(key, pixels) for pixels in (64, 256, 512)]))
+        small = self.s3.get_object(Bucket="test-bucket", Key=size_key(key, 64))["Body"].read()
+        self.assertEqual(Image.open(io.BytesIO(small)).size, (64, 64))
+
+        response = self.client.get(f"/api/accounts/user/{user.id}/")
+        self.assertNotIn("avatar_base64", response.data)
+        self.assertEqual(response.data["avatar"]["small"], f"https://test-bucket.s3.amazonaws.com/{size_key(key, 64)}")
+
+    def test_new_avatar_releases_the_previous_one(self):
+        user = self.register()
+        previous = user.avatar
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put("/api/accounts/update/", {
+                "avatar": SimpleUploadedFile("new.png", png("blue"), content_type="image/png"),
+            })
+
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertNotEqual(user.avatar, previous)
+        self.assertFalse(UserMedia.objects.filter(id=previous.id).exists())
+        self.assertFalse([key for key in self.stored_keys() if key.startswith(str(previous.file).rsplit(".", 1)[0])])
+
+    def test_command_moves_base64_avatars_to_the_bucket(self):
+        with_avatar = UserProfile.objects.create_user(
+            username="bob", email="bob@example.com", phone_number="2", password="pass",
+            avatar_base64="data:image/png;base64," + base64.b64encode(png("green")).decode(),
+        )
+        broken = UserProfile.objects.create_user(
+            username="carol", email="carol@example.com", phone_number="3", password="pass", avatar_base64="bm90IGFuIGltYWdl",
+        )
+
+        call_command("move_base64_avatars", batch_size=1, stdout=io.StringIO())
+
+        with_avatar.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertIsNone(with_avatar.avatar_base64)
+        self.assertEqual(with_avatar.avatar.content.ref_count, 1)
+        self.assertIn(size_key(str(with_avatar.avatar.file), 256), self.stored_keys())
+        self.assertEqual((broken.avatar, broken.avatar_base64), (None, None))
+
+@skipUnless(connection.vendor == "postgresql", "Username search relies on pg_trgm and the C collation")
+class UserSearchViewTest(TestCase):
+    def setUp(self):
+        for index, username in enumerate(["alice", "Alicia", "alina", "bob", "malice", "alicexyz"]):
+            UserProfile.objects.create_user(
+                username=username, email=f"{username}@example.com", phone_number=str(index), password="pass",
+            )
+        self.client = APIClient()
+
+    def search(self, **params):
+        return self.client.get("/api/accounts/user/search/", params).data
+
+    def test_prefix_mode_is_case_insensitive_and_paginated(self):
+        first = self.search(query="ali", mode="prefix", limit=2)
+        second = self.search(query="ali", mode="prefix", limit=2, after=first["next"])
+
+        self.assertEqual([user["username"] for user in first["results"]], ["alice", "alicexyz"])
+        self.assertEqual([user["username"] for user in second["results"]], ["Alicia", "alina"])
+        self.assertIsNone(second["next"])
+        self.assertEqual(set(first["results"][0]), {"id", "username", "avatar"})
+
+    def test_similar_mode_ranks_the_closest_username_first(self):
+        results = self.search(query="alice")["results"]
+
+        self.assertEqual(results[0]["username"], "alice")
+        self.assertIn("malice", [user["username"] for user in results])
+        self.assertNotIn("bob", [user["username"] for user in results])
+
+    def test_numeric_query_looks_up_the_id(self):
+        user = UserProfile.objects.get(username="bob")
+        self.assertEqual([result["id"] for result in self.search(query=str(user.id))["results"]], [user.id])
+
+class CachedTokenAuthenticationTest(TestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create_user(username="alice", email="alice@example.com", phone_number="1", password="pass")
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_cached_lookup_needs_no_query(self):
+        self.assertEqual(self.client.get("/api/accounts/user/").status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/accounts/user/")
+        self.assertEqual(response.data["username"], "alice")
+
+    def test_deactivation_logs_out_despite_the_cache(self):
+        self.client.get("/api/accounts/user/")
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get("/api/accounts/user/")
+
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(response.json()["forceLogout"])
+        self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get("/api/accounts/user/")
+        self.token.delete()
+
+        self.assertEqual(self.client.get("/api/accounts/user/").status_code, 401)
+
+    def test_cached_user_saves_only_its_loaded_fields(self):
+        self.client.get("/api/accounts/user/")
+        response = self.client.put("/api/accounts/update/", {"username": "alice2"})
+
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.username, "alice2")
+        self.assertTrue(self.user.check_password("pass"))
+        self.assertEqual(self.client.get("/api/accounts/user/").data["username"], "alice2")
+
+@override_settings(
+    PASSWORD_HASHING={"ITERATIONS": 1000, "WORKERS": 1, "MAX_PENDING": 8},
+    LOGIN_RATE_LIMITS={"USERNAME": {"LIMIT": 3, "WINDOW": 60}, "IP": {"LIMIT": 100, "WINDOW": 60}},
+)
+class LoginViewTest(TestCase):
+    def setUp(self):
+        # Attempt counters outlive tests in the shared Redis
+        for key in get_redis().scan_iter("accounts:ratelimit:*"):
+            get_redis().delete(key)
+        self.user = UserProfile.objects.create_user(username="alice", email="alice@example.com", phone_number="1", password="pass")
+
+    def login(self, password="pass"):
+        return self.client.post("/api/accounts/login/", {"username": "alice", "password": password}, content_type="application/json")
+
+    def test_valid_credentials_return_a_token(self):
+        response = self.login()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["token"], Token.objects.get(user=self.user).key)
+        self.assertEqual(self.login("wrong").status_code, 400)
+
+    def test_password_hashed_with_other_parameters_is_rehashed(self):
+        with self.settings(PASSWORD_HASHING={"ITERATIONS": 500, "WORKERS": 1, "MAX_PENDING": 8}):
+            self.user.set_password("pass")
+            self.user.save()
+
+        self.assertEqual(self.login().status_code, 200)
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$1000$"))
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_floods_are_rejected_before_hashing(self):
+        for _ in range(3):
+            self.login("wrong")
+
+        with mock.patch("accounts.hashing.run") as run:
+            response = self.login()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        run.assert_not_called()
+
+    @override_settings(
+        TRUSTED_PROXY_COUNT=1,
+        LOGIN_RATE_LIMITS={"USERNAME": {"LIMIT": 100, "WINDOW": 60}, "IP": {"LIMIT": 2, "WINDOW": 60}},
+    )
+    def test_clients_behind_the_proxy_are_limited_separately(self):
+        def login_from(forwarded_for):
+            return self.client.post(
+                "/api/accounts/login/", {"username": "alice", "password": "wrong"}, content_type="application/json",
+                REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR=forwarded_for,
+            )
+
+        for _ in range(2):
+            self.assertEqual(login_from("203.0.113.5").status_code, 400)
+        self.assertEqual(login_from("203.0.113.5").status_code, 429)
+        # Hops the client added itself are not trusted
+        self.assertEqual(login_from("198.51.100.7, 203.0.113.5").status_code, 429)
+        self.assertEqual(login_from("198.51.100.7").status_code, 400)
+
+class BatchUserViewTest(TestCase):
+    def setUp(self):
+        # Summaries outlive tests in the shared Redis
+        for key in get_redis().scan_iter("accounts:profile:*"):
+            get_redis().delete(key)
+        self.users = [
+            UserProfile.objects.create_user(username=name, email=f"{name}@example.com", phone_number=str(index), password="pass")
+            for index, name in enumerate(["alice", "bob", "carol"])
+        ]
+        self.client = APIClient()
+
+    def batch(self, ids, **headers):
+        return self.client.get("/api/accounts/user/batch/", {"ids": ",".join(map(str, ids))}, headers=headers)
+
+    def test_results_follow_the_requested_order(self):
+        alice, bob, carol = self.users
+        response = self.batch([carol.id, 999999, alice.id, carol.id])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user["username"] for user in response.data["results"]], ["carol", "alice"])
+        self.assertEqual(set(response.data["results"][0]), {"id", "username", "avatar"})
+
+    def test_cached_batch_needs_no_query(self):
+        ids = [user.id for user in self.users]
+        with self.assertNumQueries(1):
+            self.batch(ids)
+        with self.assertNumQueries(0):
+            response = self.batch(ids)
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_unchanged_batch_is_not_modified(self):
+        ids = [user.id for user in self.users]
+        etag = self.batch(ids)["ETag"]
+
+        response = self.batch(ids, if_none_match=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_update_invalidates_the_summary(self):
+        alice = self.users[0]
+        etag = self.batch([alice.id])["ETag"]
+        self.client.force_authenticate(alice)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put("/api/accounts/update/", {"username": "alice2"})
+
+        response = self.batch([alice.id], if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["username"], "alice2")
+
+    def test_deleted_user_is_dropped(self):
+        alice_id = self.users[0].id
+        self.batch([alice_id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[0].delete()
+
+        self.assertEqual(self.batch([alice_id]).data["results"], [])
+
+    def test_read_racing_an_invalidation_does_not_cache_the_old_row(self):
+        alice = self.users[0]
+        load = profile_cache.load
+
+        def load_then_rename(user_ids):
+            # The row is read, then the rename commits before the write-back
+            loaded = load(user_ids)
+            UserProfile.objects.filter(id=alice.id).update(username="alice2")
+            profile_cache.invalidate(alice.id)
+            return loaded
+
+        with mock.patch("accounts.profile_cache.load", load_then_rename):
+            self.assertEqual(self.batch([alice.id]).data["results"][0]["username"], "alice")
+        self.assertEqual(self.batch([alice.id]).data["results"][0]["username"], "alice2")
+
+    def test_too_many_ids_are_rejected(self):
+        self.assertEqual(self.batch(range(1, 502)).status_code, 400)
+        self.assertEqual(self.batch(["x"]).status_code, 400)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import RegisterUserView, LoginView, UpdateUserProfileView, UserProfileView, UserSearchView, GetUserByIdView
+from .views import RegisterUserView, LoginView, UpdateUserProfileView, UserProfileView, UserSearchView, GetUserByIdView, BatchUserView
 
 urlpatterns = [
     path("register/", RegisterUserView.as_view(), name="register"),
@@ -8,5 +8,6 @@ urlpatterns = [
 
     path("user/", UserProfileView.as_view(), name="user"),
     path('user/search/', UserSearchView.as_view(), name="user_search"),
+    path('user/batch/', BatchUserView.as_view(), name="user_batch"),
     path('user/<int:id>/', GetUserByIdView.as_view(), name='get_user_by_id'),
 ]
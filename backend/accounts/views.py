@@ -1,49 +1,122 @@
+import hashlib
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity, TrigramWordSimilarity
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import Cast, Collate, Concat, Greatest, Upper
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status, parsers
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.authentication import TokenAuthentication
+from .authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
-from .serializers import UserRegistrationSerializer, UserProfileSerializer, UserUpdateSerializer
+from .serializers import UserRegistrationSerializer, UserProfileSerializer, UserUpdateSerializer, UserSearchResultSerializer
+from .pagination import UserSearchPagination
 from .models import UserProfile
+from .avatars import avatar_urls
+from . import hashing, profile_cache, ratelimit
 
-class RegisterUserView(APIView):
-    parser_classes = [parsers.MultiPartParser, parsers.FormParser]
+def request_data(request):
+    """ Form fields or a JSON object, whichever the client sent; None if the JSON is malformed """
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    data = request.POST.copy()
+    data.update(request.FILES)
+    return data
 
-    def post(self, request):
-        serializer = UserRegistrationSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save()
-            return Response({"message": "User registered successfully"}, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+def client_ip(request):
+    """
+    Address of the client behind the TRUSTED_PROXY_COUNT proxies: the hop
+    the outermost of them appended to X-Forwarded-For. Earlier hops come from
+    the client and are ignored.
+    """
+    proxies = settings.TRUSTED_PROXY_COUNT
+    if proxies:
+        hops = [hop.strip() for hop in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if hop.strip()]
+        if len(hops) >= proxies:
+            return hops[-proxies]
+    return request.META.get("REMOTE_ADDR")
+
+def too_many_attempts(retry_after):
+    response = JsonResponse({"error": "Too many attempts. Please try again later."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response["Retry-After"] = str(retry_after)
+    return response
+
+def hashing_busy():
+    response = JsonResponse({"error": "Server is busy. Please try again."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response["Retry-After"] = "1"
+    return response
+
+@method_decorator(csrf_exempt, name="dispatch")
+class RegisterUserView(View):
+    """ Async so the password is hashed in the hashing pool without holding a worker thread """
 
-class LoginView(APIView):
-    def post(self, request):
-        username = request.data.get("username")
-        password = request.data.get("password")
+    async def post(self, request):
+        retry_after = await sync_to_async(ratelimit.hit, thread_sensitive=False)(IP=client_ip(request))
+        if retry_after:
+            return too_many_attempts(retry_after)
+        data = request_data(request)
+        if data is None:
+            return JsonResponse({"error": "Malformed request body."}, status=status.HTTP_400_BAD_REQUEST)
 
+        serializer = UserRegistrationSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         try:
-            user = UserProfile.objects.get(username=username)
-            print(f"User found: {user}")
+            encoded = await hashing.make_password(serializer.validated_data["password"])
+        except hashing.HashingBusy:
+            return hashing_busy()
+        try:
+            await sync_to_async(serializer.save)(encoded_password=encoded)
+        except ValidationError as e:
+            return JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({"message": "User registered successfully"}, status=status.HTTP_201_CREATED)
 
-            if not user.is_active:
-                print("User is inactive!")
-                return Response({"error": "Your account is inactive. Please contact support."}, status=status.HTTP_403_FORBIDDEN)
+@method_decorator(csrf_exempt, name="dispatch")
+class LoginView(View):
+    """
+    Async login. Attempts are rate limited per username and per IP before
+    anything else happens, and the password is checked in the hashing pool
+    (rehashed there too when the hasher parameters changed).
+    """
 
-            if user.check_password(password):
-                token, created = Token.objects.get_or_create(user=user)
-                print(f"Authentication successful! Token: {token.key}")
-                return Response({"token": token.key, "user_id": user.id}, status=status.HTTP_200_OK)
-            else:
-                print("Password check failed!")
+    async def post(self, request):
+        data = request_data(request)
+        if data is None:
+            return JsonResponse({"error": "Malformed request body."}, status=status.HTTP_400_BAD_REQUEST)
+        username = data.get("username")
+        password = data.get("password")
 
-        except UserProfile.DoesNotExist:
-            print("User not found!")
+        retry_after = await sync_to_async(ratelimit.hit, thread_sensitive=False)(USERNAME=username, IP=client_ip(request))
+        if retry_after:
+            return too_many_attempts(retry_after)
 
-        return Response({"error": "Invalid credentials"}, status=status.HTTP_400_BAD_REQUEST)
+        user = await UserProfile.objects.only("id", "password", "is_active").filter(username=username).afirst()
+        if user is not None:
+            if not user.is_active:
+                return JsonResponse({"error": "Your account is inactive. Please contact support."}, status=status.HTTP_403_FORBIDDEN)
+            try:
+                valid = await hashing.check_password(user, password)
+            except hashing.HashingBusy:
+                return hashing_busy()
+            if valid:
+                token, created = await Token.objects.aget_or_create(user=user)
+                return JsonResponse({"token": token.key, "user_id": user.id}, status=status.HTTP_200_OK)
+
+        return JsonResponse({"error": "Invalid credentials"}, status=status.HTTP_400_BAD_REQUEST)
 
 class UserProfileView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -53,36 +126,63 @@ class UserProfileView(APIView):
             "username": user.username,
             "email": user.email,
             "phone_number": user.phone_number,
-            "avatar_base64": user.avatar_base64
+            "avatar": avatar_urls(user.avatar),
         })
 
 class UserSearchView(APIView):
+    """
+    GET ?query=<text>&mode=prefix|similar&limit=<n>&after=<cursor>
+
+    prefix  - autocomplete: usernames starting with the query, case-insensitively,
+              in alphabetical order. A range scan of the userprofile_username_prefix index.
+    similar - default: usernames trigram-similar to the query or to a part of it,
+              best match first. Candidates come from the userprofile_username_trgm
+              GIN index. Queries shorter than a trigram are searched by prefix.
+
+    A numeric query looks the user up by id. Results are capped at `limit`;
+    `next` is the cursor of the following page.
+    """
+    pagination_class = UserSearchPagination
+    # Below this length a query has no trigram of its own to look up
+    MIN_SIMILAR_LENGTH = 3
+    # Above every character a username can start with, in code point order
+    PREFIX_END = "\U0010ffff"
+
     def get(self, request):
-        query = request.GET.get('query', None)
+        query = request.GET.get('query', "").strip()
         if not query:
             return Response({"error": "The 'query' parameter is not provided."}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            if query.isdigit():
-                try:
-                    user = UserProfile.objects.get(id=query)
-                    serializer = UserProfileSerializer(user)
-                    return Response(serializer.data, status=status.HTTP_200_OK)
-                except UserProfile.DoesNotExist:
-                    return Response({"error": "User with this ID was not found."}, status=status.HTTP_404_NOT_FOUND)
-            else:
-                users = UserProfile.objects.filter(username__icontains=query)
-                if users.exists():
-                    serializer = UserProfileSerializer(users, many=True)
-                    return Response(serializer.data, status=status.HTTP_200_OK)
-                else:
-                    return Response({"error": "User with this username was not found."}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            return Response({"error": "Error: " + str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        mode = request.GET.get("mode", "similar")
+        if mode not in ("prefix", "similar"):
+            return Response({"error": "mode must be 'prefix' or 'similar'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        users = UserProfile.objects.select_related("avatar").only("id", "username", "avatar", "avatar__file")
+        if query.isdigit():
+            users = users.filter(id=query)
+            return Response({"previous": None, "next": None, "results": UserSearchResultSerializer(users, many=True).data})
+
+        paginator = self.pagination_class()
+        if mode == "prefix" or len(query) < self.MIN_SIMILAR_LENGTH:
+            # Compared in the "C" collation, like the index: byte order, so a prefix is a key range.
+            # The query is uppercased by the database too, as Python disagrees on some letters (ß)
+            users = users.annotate(username_key=Collate(Upper("username"), "C")).filter(
+                username_key__gte=Collate(Upper(Value(query)), "C"),
+                username_key__lt=Collate(Concat(Upper(Value(query)), Value(self.PREFIX_END)), "C"),
+            )
+            paginator.ordering = ("username_key", "id")
+        else:
+            users = users.annotate(
+                rank=Cast(Greatest(TrigramSimilarity("username", query), TrigramWordSimilarity(query, "username")), FloatField()),
+            ).filter(Q(username__trigram_similar=query) | Q(username__trigram_word_similar=query))
+            paginator.ordering = ("-rank", "id")
+
+        page = paginator.paginate_queryset(users, request, view=self)
+        return paginator.get_paginated_response(UserSearchResultSerializer(page, many=True).data)
 
 class GetUserByIdView(APIView):
     def get(self, request, id):
         try:
-            user = UserProfile.objects.get(id=id)
+            user = UserProfile.objects.profiles().get(id=id)
         except UserProfile.DoesNotExist:
             return Response(
                 {"error": "User with this ID was not found."},
@@ -91,8 +191,38 @@ class GetUserByIdView(APIView):
         serializer = UserProfileSerializer(user)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+class BatchUserView(APIView):
+    """
+    GET ?ids=1,2,3 (or ?ids=1&ids=2)
+
+    Public summaries of up to MAX_IDS users, in the order asked, served from
+    the profile cache; unknown ids are left out. The response carries an ETag
+    of its content, so a client sending it back in If-None-Match gets a 304
+    until one of the users changes.
+    """
+    MAX_IDS = 500
+
+    def get(self, request):
+        raw_ids = [part.strip() for value in request.GET.getlist("ids") for part in value.split(",") if part.strip()]
+        if not raw_ids:
+            return Response({"error": "The 'ids' parameter is not provided."}, status=status.HTTP_400_BAD_REQUEST)
+        if not all(raw_id.isdigit() for raw_id in raw_ids):
+            return Response({"error": "ids must be user ids."}, status=status.HTTP_400_BAD_REQUEST)
+        ids = list(dict.fromkeys(int(raw_id) for raw_id in raw_ids))
+        if len(ids) > self.MAX_IDS:
+            return Response({"error": f"At most {self.MAX_IDS} ids per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        profiles = profile_cache.get_profiles(ids)
+        results = [profiles[user_id] for user_id in ids if user_id in profiles]
+        etag = '"%s"' % hashlib.md5(json.dumps(results, sort_keys=True).encode()).hexdigest()
+        if etag in [tag.strip() for tag in request.META.get("HTTP_IF_NONE_MATCH", "").split(",")]:
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            return response
+        return Response({"results": results}, headers={"ETag": etag})
+
 class UpdateUserProfileView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     parser_classes = [parsers.MultiPartParser, parsers.FormParser]
 
@@ -2,15 +2,20 @@ import os
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
 from channels.auth import AuthMiddlewareStack
-import chat_messages.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django_asgi_app = get_asgi_application()
+
+import chat_messages.routing
+from accounts.middleware import WebSocketTokenAuthMiddleware
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
-        URLRouter(
-            chat_messages.routing.websocket_urlpatterns
+        WebSocketTokenAuthMiddleware(
+            URLRouter(
+                chat_messages.routing.websocket_urlpatterns
+            )
         )
     ),
 })
\ No newline at end of file
@@ -0,0 +1,157 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+def encode_cursor(values):
+    """ Packs the ordering values of a row into an opaque URL-safe cursor """
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    """ Unpacks a cursor produced by encode_cursor, raising ValidationError if it is malformed """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise ValidationError({"cursor": "Invalid cursor."})
+    if not isinstance(values, list) or len(values) != size:
+        raise ValidationError({"cursor": "Invalid cursor."})
+    return values
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite ordering, e.g. ("uploaded_at", "id").
+
+    Every page is a single indexed range scan: the cursor holds the ordering
+    values of the boundary row, so the cost of a page does not depend on how
+    far the client has scrolled (unlike OFFSET).
+
+    Query parameters:
+        limit   - page size, capped at max_page_size
+        after   - rows that come after the cursor in `ordering`
+        before  - rows that come before the cursor in `ordering`
+
+    Without a cursor the first page is returned, or the last one when
+    `start_from_end` is set (e.g. "latest N messages" of a chat).
+    """
+    ordering = ("id",)
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = "limit"
+    start_from_end = False
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return self.page_size
+        try:
+            page_size = int(value)
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: "Must be an integer."})
+        return max(1, min(page_size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size_value = self.get_page_size(request)
+        before = request.query_params.get("before")
+        after = request.query_params.get("after")
+        if before and after:
+            raise ValidationError({"cursor": "Use either 'before' or 'after', not both."})
+
+        if after:
+            queryset = queryset.filter(self.keyset_filter(self.decode_values(after, queryset), forward=True))
+            rows = list(queryset.order_by(*self.ordering)[:self.page_size_value + 1])
+            self.has_previous = True
+            self.has_next = len(rows) > self.page_size_value
+            rows = rows[:self.page_size_value]
+        elif before or self.start_from_end:
+            if before:
+                queryset = queryset.filter(self.keyset_filter(self.decode_values(before, queryset), forward=False))
+            rows = list(queryset.order_by(*self.reversed_ordering())[:self.page_size_value + 1])
+            self.has_previous = len(rows) > self.page_size_value
+            self.has_next = bool(before)
+            rows = rows[:self.page_size_value][::-1]
+        else:
+            rows = list(queryset.order_by(*self.ordering)[:self.page_size_value + 1])
+            self.has_previous = False
+            self.has_next = len(rows) > self.page_size_value
+            rows = rows[:self.page_size_value]
+
+        self.rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            "previous": self.get_cursor(self.rows[0]) if self.rows and self.has_previous else None,
+            "next": self.get_cursor(self.rows[-1]) if self.rows and self.has_next else None,
+            "results": data,
+        })
+
+    def get_cursor(self, row):
+        values = []
+        for field in self.ordering:
+            value = row
+            for attr in field.lstrip("-").split("__"):
+                value = getattr(value, attr)
+            values.append(value)
+        return encode_cursor(values)
+
+    def decode_values(self, cursor, queryset):
+        """
+        The cursor's values converted to the types of their ordering fields
+        (model fields or annotations), so a crafted cursor is a 400 rather
+        than a database error.
+        """
+        values = decode_cursor(cursor, len(self.ordering))
+        converted = []
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            if name in queryset.query.annotations:
+                model_field = queryset.query.annotations[name].output_field
+            else:
+                try:
+                    model_field = queryset.model._meta.get_field(name)
+                except FieldDoesNotExist:
+                    raise ValidationError({"cursor": "Invalid cursor."})
+            if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+                raise ValidationError({"cursor": "Invalid cursor."})
+            try:
+                value = model_field.to_python(value)
+            except (DjangoValidationError, TypeError, ValueError):
+                raise ValidationError({"cursor": "Invalid cursor."})
+            if value is None:
+                raise ValidationError({"cursor": "Invalid cursor."})
+            converted.append(value)
+        return converted
+
+    def reversed_ordering(self):
+        return tuple(field[1:] if field.startswith("-") else f"-{field}" for field in self.ordering)
+
+    def keyset_filter(self, values, forward):
+        """
+        Expands the row comparison (f1, f2, ...) > (v1, v2, ...) into
+        f1 > v1 OR (f1 = v1 AND f2 > v2) OR ..., with the direction of each
+        field taken from `ordering`. The extra non-strict bound on the first
+        field lets the planner use it as an index range condition.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            descending = field.startswith("-")
+            lookup = "gt" if forward != descending else "lt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+
+        first = self.ordering[0]
+        lookup = "gte" if forward != first.startswith("-") else "lte"
+        return Q(**{f"{first.lstrip('-')}__{lookup}": values[0]}) & condition
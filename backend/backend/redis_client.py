@@ -0,0 +1,15 @@
+import threading
+import redis
+from django.conf import settings
+
+_client = None
+_lock = threading.Lock()
+
+def get_redis():
+    """ Returns the process-wide Redis client (redis-py clients are thread-safe and pooled) """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    return _client
@@ -17,6 +17,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
@@ -97,6 +98,32 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The first hasher encodes new passwords (and verifies pbkdf2_sha256 ones); the others verify older hashes
+PASSWORD_HASHERS = [
+    "accounts.hashers.TunedPBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+# Password hashing of the login and registration views (see accounts/hashing.py).
+# Passwords hashed with other ITERATIONS are rehashed on their next login.
+PASSWORD_HASHING = {
+    "ITERATIONS": int(os.getenv("PASSWORD_HASH_ITERATIONS", 1000000)),
+    "WORKERS": int(os.getenv("PASSWORD_HASH_WORKERS", 2)),
+    # Hashes queued or running at once; further logins get a 503
+    "MAX_PENDING": 64,
+}
+# Attempts allowed per WINDOW seconds, checked before any password is hashed (see accounts/ratelimit.py)
+LOGIN_RATE_LIMITS = {
+    "USERNAME": {"LIMIT": 10, "WINDOW": 60},
+    "IP": {"LIMIT": 30, "WINDOW": 60},
+}
+# Reverse proxies in front of the app, each appending to X-Forwarded-For. The
+# client address is the hop the outermost one saw; with 0 it is REMOTE_ADDR.
+# Never set it higher than the real number of proxies, or clients can pick their address.
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", 0))
+
 AUTHENTICATION_BACKENDS = [
     'social_core.backends.google.GoogleOAuth2',
     'django.contrib.auth.backends.ModelBackend',
@@ -127,6 +154,49 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_STORAGE_BUCKET_NAME = os.getenv("AWS_STORAGE_BUCKET_NAME")
 AWS_S3_REGION_NAME = os.getenv("AWS_S3_REGION_NAME")
 AWS_QUERYSTRING_AUTH = False  # Makes files publicly available
+# Shared S3 client (see AWS/S3/client.py)
+AWS_S3_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_S3_MAX_POOL_CONNECTIONS", 50))
+AWS_S3_MAX_ATTEMPTS = 5
+# Files of one request uploaded in parallel (see AWS/S3/services.py)
+AWS_S3_UPLOAD_CONCURRENCY = int(os.getenv("AWS_S3_UPLOAD_CONCURRENCY", 4))
+# Multipart upload of a single file: parts of PART_SIZE bytes, CONCURRENCY of
+# them in flight. Memory per upload stays around CONCURRENCY * PART_SIZE.
+AWS_S3_MULTIPART_PART_SIZE = int(os.getenv("AWS_S3_MULTIPART_PART_SIZE", 8 * 1024 * 1024))
+AWS_S3_MULTIPART_CONCURRENCY = int(os.getenv("AWS_S3_MULTIPART_CONCURRENCY", 4))
+# Presigned direct-to-S3 uploads (see AWS/S3/services.py)
+AWS_S3_DIRECT_UPLOAD_MAX_SIZE = int(os.getenv("AWS_S3_DIRECT_UPLOAD_MAX_SIZE", 500 * 1024 * 1024))
+AWS_S3_DIRECT_UPLOAD_EXPIRES = 15 * 60  # seconds
+# Unattached media and stray objects younger than this are left alone by `manage.py collect_orphaned_media`
+AWS_S3_ORPHAN_GRACE_PERIOD = int(os.getenv("AWS_S3_ORPHAN_GRACE_PERIOD", 24 * 60 * 60))  # seconds
+# Resized image variants generated by `manage.py generate_media_variants` (see AWS/S3/variants.py)
+AWS_S3_IMAGE_VARIANTS = {
+    "WIDTHS": [320, 640, 1280],
+    "FORMATS": ["webp", "avif"],
+    "QUALITY": 75,
+}
+# Square avatar sizes in pixels, encoded when an avatar is set (see accounts/avatars.py)
+AWS_S3_AVATAR_SIZES = {"small": 64, "medium": 256, "large": 512}
+# Poster frames and HLS renditions made by `manage.py process_videos` (see AWS/S3/video.py)
+AWS_S3_VIDEO = {
+    "FFMPEG": os.getenv("FFMPEG_BINARY", "ffmpeg"),
+    "FFPROBE": os.getenv("FFPROBE_BINARY", "ffprobe"),
+    "SEGMENT_SECONDS": 6,
+    # Bitrates in kbit/s, lowest rendition first
+    "RENDITIONS": [
+        {"height": 360, "video_bitrate": 800, "audio_bitrate": 96},
+        {"height": 720, "video_bitrate": 2800, "audio_bitrate": 128},
+        {"height": 1080, "video_bitrate": 5000, "audio_bitrate": 192},
+    ],
+}
+# Read-through LRU disk cache of media on each app node (see AWS/S3/disk_cache.py)
+AWS_S3_DISK_CACHE = {
+    "ENABLED": os.getenv("AWS_S3_DISK_CACHE") == "True",
+    "DIRECTORY": os.getenv("AWS_S3_DISK_CACHE_DIR", str(BASE_DIR / "media_cache")),
+    # Cap of the whole directory, shared by the workers of the node
+    "MAX_BYTES": int(os.getenv("AWS_S3_DISK_CACHE_MAX_BYTES", 2 * 1024 ** 3)),
+    # Larger objects (typically videos) are always streamed from S3
+    "MAX_OBJECT_SIZE": 20 * 1024 ** 2,
+}
 
 # URL to access files
 AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
@@ -137,16 +207,59 @@ ASGI_APPLICATION = "backend.asgi.application"
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+REDIS_HOST = os.getenv("REDIS_URL")
+REDIS_PORT = os.getenv("REDIS_PORT")
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [(os.getenv("REDIS_URL"), os.getenv("REDIS_PORT"))],
+            "hosts": [(REDIS_HOST, REDIS_PORT)],
             "capacity": 1000000
         },
     },
 }
 
+# Token -> user lookups cached by accounts.authentication.CachedTokenAuthentication.
+# Entries are dropped by signals when a user or token changes; the per-process
+# copies of other workers expire after LOCAL_TTL.
+AUTH_TOKEN_CACHE = {
+    "TTL": 5 * 60,  # seconds, in Redis
+    "LOCAL_TTL": 10,  # seconds, in process
+    "LOCAL_MAX_ENTRIES": 10000,
+}
+
+# Public profile summaries served by /api/accounts/user/batch/ (see
+# accounts/profile_cache.py), dropped by signals when a user changes.
+ACCOUNTS_PROFILE_CACHE = {
+    "TTL": 60 * 60,  # seconds
+}
+
+# Chat messages write-behind buffer (see chat_messages/write_behind.py).
+# DURABILITY is "memory" (fastest, a crash loses the unflushed batch) or
+# "redis" (queued in Redis and flushed by `manage.py flush_chat_messages`).
+CHAT_MESSAGES_WRITE_BEHIND = {
+    "ENABLED": os.getenv("CHAT_WRITE_BEHIND") == "True",
+    "DURABILITY": os.getenv("CHAT_WRITE_BEHIND_DURABILITY", "redis"),
+    "BATCH_SIZE": 500,
+    "FLUSH_INTERVAL": 0.05,  # seconds
+    "ID_BLOCK_SIZE": 100,
+}
+
+# Ring buffer of the latest serialized messages per chat (see chat_messages/cache.py)
+CHAT_RECENT_MESSAGES_CACHE = {
+    "SIZE": 200,
+    "TTL": 60 * 60 * 24,  # seconds
+}
+
+# Fan-out-on-write home timelines (see posts/timeline.py)
+POSTS_TIMELINE = {
+    "SIZE": 800,
+    "TTL": 60 * 60 * 24 * 14,  # seconds
+    # Authors with more subscribers are merged into feeds at read time instead
+    "FANOUT_MAX_FOLLOWERS": 10000,
+}
+
 # Stripe Settings
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ChatMessagesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat_messages'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,116 @@
+"""
+Per-chat ring buffer of recently sent messages, kept in Redis.
+
+Each chat has a capped list of serialized messages (oldest first), so opening
+a chat or joining its WebSocket does not hit Postgres. The list is appended to
+when a message is sent and filled from the database on the first read miss.
+
+A per-chat generation counter guards against a slow fill overwriting newer
+state: every append or invalidation bumps it, and a fill only writes if the
+generation is still the one it saw before reading the database.
+"""
+import json
+from django.conf import settings
+from redis.exceptions import RedisError
+from backend.redis_client import get_redis
+from .models import ChatMessage
+from .serializers import ChatMessageReadSerializer
+
+LIST_KEY = "chat_messages:recent:{chat_id}"
+GENERATION_KEY = "chat_messages:recent:{chat_id}:gen"
+
+APPEND_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+    redis.call('LTRIM', KEYS[1], -tonumber(ARGV[2]), -1)
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+"""
+
+FILL_SCRIPT = """
+local generation = redis.call('GET', KEYS[2]) or '0'
+if generation ~= ARGV[1] or redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('RPUSH', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+def get_config():
+    return settings.CHAT_RECENT_MESSAGES_CACHE
+
+
+def serialize(chat_message):
+    return json.dumps(ChatMessageReadSerializer(chat_message).data)
+
+
+def keys(chat_id):
+    return [LIST_KEY.format(chat_id=chat_id), GENERATION_KEY.format(chat_id=chat_id)]
+
+
+def append(chat_message):
+    """ Adds a newly sent message to its chat's buffer, if the buffer is populated """
+    config = get_config()
+    try:
+        get_redis().eval(APPEND_SCRIPT, 2, *keys(chat_message.chat_id), serialize(chat_message), config["SIZE"], config["TTL"])
+    except RedisError as e:
+        print(f"Recent messages cache append failed: {e}")
+
+
+def invalidate(*chat_ids):
+    """ Drops the buffers of the given chats, e.g. after a message or its media changed """
+    if not chat_ids:
+        return
+    try:
+        pipe = get_redis().pipeline()
+        for chat_id in chat_ids:
+            list_key, generation_key = keys(chat_id)
+            pipe.incr(generation_key)
+            pipe.expire(generation_key, get_config()["TTL"])
+            pipe.delete(list_key)
+        pipe.execute()
+    except RedisError as e:
+        print(f"Recent messages cache invalidation failed: {e}")
+
+
+def get_recent(chat_id, count):
+    """
+    Returns (messages, cached_total): up to `count` of the newest messages of a
+    chat, oldest first, and how many messages the buffer holds. Fills the
+    buffer from the database on a miss. Falls back to the database alone if
+    Redis is unavailable.
+    """
+    config = get_config()
+    count = min(count, config["SIZE"])
+    list_key, generation_key = keys(chat_id)
+    try:
+        redis = get_redis()
+        pipe = redis.pipeline()
+        pipe.get(generation_key)
+        pipe.llen(list_key)
+        pipe.lrange(list_key, -count, -1)
+        generation, total, raw_items = pipe.execute()
+        if total:
+            return [json.loads(raw) for raw in raw_items], total
+    except RedisError as e:
+        print(f"Recent messages cache read failed: {e}")
+        redis = None
+
+    chat_messages = list(
+        ChatMessage.objects.filter(chat_id=chat_id).select_related("media")
+        .order_by("-uploaded_at", "-id")[:config["SIZE"]]
+    )[::-1]
+    data = ChatMessageReadSerializer(chat_messages, many=True).data
+    if redis is not None and data:
+        try:
+            redis.eval(
+                FILL_SCRIPT, 2, list_key, generation_key,
+                generation or b"0", config["TTL"], *[json.dumps(item) for item in data],
+            )
+        except RedisError as e:
+            print(f"Recent messages cache fill failed: {e}")
+    return list(data[-count:]), len(data)
@@ -1,18 +1,139 @@
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from chats.models import Chat
+from AWS.S3.models import UserMedia
+from .models import ChatMessage
+from .events import apublish_message, user_group_name
+from . import cache as recent_cache
+from . import read_state
+from . import write_behind
+from urllib.parse import parse_qs
 import json
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    MAX_TEXT_LENGTH = 10000
+
     async def connect(self):
         self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
         self.room_group_name = f"chat_{self.room_name}"
+        self.user = self.scope.get("user")
+
+        # Only members of the chat may listen to it or post into it
+        if not self.user or not self.user.is_authenticated or not self.room_name.isdigit():
+            await self.close()
+            return
+        self.chat_id = int(self.room_name)
+        if not await Chat.objects.filter(id=self.chat_id, users=self.user).aexists():
+            await self.close()
+            return
 
-        # Join the group
+        # Join the chat group, and the user's group for unread counters of all their chats
+        self.user_group_name = user_group_name(self.user.id)
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
         await self.accept()
 
+        # "?replay=<n>" sends the latest n messages from the recent messages cache
+        replay = parse_qs(self.scope.get("query_string", b"").decode()).get("replay", ["0"])[0]
+        if replay.isdigit() and int(replay) > 0:
+            messages, _ = await sync_to_async(recent_cache.get_recent)(self.chat_id, int(replay))
+            await self.send(text_data=json.dumps({"type": "history", "messages": messages}))
+
     async def disconnect(self, close_code):
-        # Leave the group
+        # Leave the groups
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if hasattr(self, "user_group_name"):
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        """
+        Accepts outgoing messages from the client:
+            {"type": "message", "client_id": "...", "text": "...", "media": <UserMedia id>}
+        The message is persisted, broadcast to the chat group and acknowledged
+        to the sender with the client-supplied id. Membership is checked again for
+        every message, as the user may have been removed since connecting.
+
+        Also accepts read receipts:
+            {"type": "read", "message": <ChatMessage id, optional>}
+        """
+        try:
+            payload = json.loads(text_data or "")
+        except ValueError:
+            await self.send_error(None, "Invalid JSON.")
+            return
+        if not isinstance(payload, dict):
+            await self.send_error(None, "Invalid payload.")
+            return
+
+        if payload.get("type") == "message":
+            await self.receive_message(payload)
+        elif payload.get("type") == "read":
+            await self.receive_read(payload)
+        else:
+            await self.send_error(payload.get("client_id"), "Unknown message type.")
+
+    async def receive_message(self, payload):
+        client_id = payload.get("client_id")
+        text = payload.get("text") or ""
+        media_id = payload.get("media")
+        if not isinstance(text, str) or len(text) > self.MAX_TEXT_LENGTH:
+            await self.send_error(client_id, f"Text must be a string of at most {self.MAX_TEXT_LENGTH} characters.")
+            return
+        if media_id is not None and (not isinstance(media_id, int) or isinstance(media_id, bool)):
+            await self.send_error(client_id, "Media not found.")
+            return
+        if not await Chat.objects.filter(id=self.chat_id, users=self.user).aexists():
+            await self.send_error(client_id, "Access denied.")
+            await self.close()
+            return
+
+        media = None
+        if media_id is not None:
+            try:
+                media = await UserMedia.objects.aget(id=media_id, uploaded_by=self.user)
+            except (UserMedia.DoesNotExist, ValueError, TypeError):
+                await self.send_error(client_id, "Media not found.")
+                return
+        if not text and media is None:
+            await self.send_error(client_id, "Message is empty.")
+            return
+
+        chat_message = ChatMessage(chat_id=self.chat_id, user=self.user, text=text, media=media)
+        if write_behind.is_enabled():
+            await sync_to_async(write_behind.enqueue)(chat_message)
+        else:
+            await chat_message.asave()
+        await apublish_message(chat_message)
+
+        await self.send(text_data=json.dumps({
+            "type": "ack",
+            "client_id": client_id,
+            "id": chat_message.id,
+            "uploaded_at": chat_message.uploaded_at.isoformat(),
+        }))
+
+    async def receive_read(self, payload):
+        message_id = payload.get("message")
+        if message_id is not None and not isinstance(message_id, int):
+            await self.send_error(payload.get("client_id"), "Invalid message id.")
+            return
+        try:
+            state = await sync_to_async(read_state.mark_read)(self.user, self.chat_id, message_id)
+        except read_state.UnknownMessage:
+            await self.send_error(payload.get("client_id"), "Message not found in this chat.")
+            return
+        if state is not None:
+            await self.channel_layer.group_send(
+                self.user_group_name,
+                read_state.unread_event(state.chat_id, state.unread_count, state.last_read_message_id),
+            )
+
+    async def send_error(self, client_id, error):
+        await self.send(text_data=json.dumps({
+            "type": "error",
+            "client_id": client_id,
+            "error": error,
+        }))
 
     # Handler for new messages
     async def chat_message(self, event):
@@ -30,3 +151,18 @@ class ChatConsumer(AsyncWebsocketConsumer):
             "uploaded_at": event["uploaded_at"],
             "media_url": event.get("media_url"),
         }))
+
+    # Handler for members removed from a chat, sent to all their sockets
+    async def chat_removed(self, event):
+        if event["chat"] == self.chat_id:
+            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+            await self.close()
+
+    # Handler for unread counter updates
+    async def chat_unread(self, event):
+        await self.send(text_data=json.dumps({
+            "type": "unread",
+            "chat": event["chat"],
+            "unread_count": event["unread_count"],
+            "last_read_message_id": event.get("last_read_message_id"),
+        }))
@@ -0,0 +1,78 @@
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.db.models import Q
+from chats.models import Chat
+from . import cache as recent_cache
+from . import read_state
+
+def chat_message_event(chat_message):
+    """
+    Builds the channel layer event that ChatConsumer.chat_message relays to the
+    members of a chat. Shared by the HTTP and WebSocket send paths.
+    """
+    return {
+        "type": "chat_message",
+        "id": chat_message.id,
+        "user": {
+            "id": chat_message.user.id,
+            "username": chat_message.user.username,
+        },
+        "chat": chat_message.chat_id,
+        "text": chat_message.text,
+        "uploaded_at": chat_message.uploaded_at.isoformat(),
+        "media_url": chat_message.media.file_url if chat_message.media else None,
+    }
+
+
+def user_group_name(user_id):
+    """ Channel layer group joined by every socket of a user """
+    return f"user_{user_id}"
+
+
+def record_message(chat_message):
+    """
+    Blocking side effects of a new message: appends it to the chat's recent
+    cache, moves the chat's last message pointer and bumps the other members'
+    unread counters. Returns {user_id: unread_count}.
+    """
+    recent_cache.append(chat_message)
+    Chat.objects.filter(id=chat_message.chat_id).filter(
+        Q(last_message__isnull=True) | Q(last_message_id__lt=chat_message.id)
+    ).update(last_message_id=chat_message.id)
+    return read_state.increment_unread(chat_message)
+
+
+async def broadcast_message(chat_message, unread_counts):
+    channel_layer = get_channel_layer()
+    await channel_layer.group_send(f"chat_{chat_message.chat_id}", chat_message_event(chat_message))
+    for user_id, unread_count in unread_counts.items():
+        await channel_layer.group_send(
+            user_group_name(user_id), read_state.unread_event(chat_message.chat_id, unread_count)
+        )
+
+
+def publish_message(chat_message):
+    """ Makes a newly sent message visible to the chat members (sync callers) """
+    unread_counts = record_message(chat_message)
+    async_to_sync(broadcast_message)(chat_message, unread_counts)
+
+
+async def apublish_message(chat_message):
+    """ Makes a newly sent message visible to the chat members (async callers) """
+    unread_counts = await sync_to_async(record_message)(chat_message)
+    await broadcast_message(chat_message, unread_counts)
+
+
+def publish_read_state(state):
+    """ Pushes a member's reset counter to their other sockets """
+    async_to_sync(get_channel_layer().group_send)(
+        user_group_name(state.user_id),
+        read_state.unread_event(state.chat_id, state.unread_count, state.last_read_message_id),
+    )
+
+
+def publish_removals(memberships):
+    """ Closes the chat sockets of removed members, given (user_id, chat_id) pairs """
+    channel_layer = get_channel_layer()
+    for user_id, chat_id in memberships:
+        async_to_sync(channel_layer.group_send)(user_group_name(user_id), {"type": "chat_removed", "chat": chat_id})
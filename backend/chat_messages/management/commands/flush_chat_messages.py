@@ -0,0 +1,33 @@
+import socket
+from django.core.management.base import BaseCommand, CommandError
+from chat_messages import write_behind
+
+class Command(BaseCommand):
+    help = "Flushes the Redis write-behind queue of chat messages into the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--worker",
+            default=socket.gethostname(),
+            help="Name of this flusher. A restarted flusher with the same name replays its unfinished batch.",
+        )
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit.")
+
+    def handle(self, *args, **options):
+        if write_behind.get_config()["DURABILITY"] != "redis":
+            raise CommandError("The flusher is only used with CHAT_MESSAGES_WRITE_BEHIND['DURABILITY'] = 'redis'.")
+
+        worker = options["worker"]
+        recovered = write_behind.redis_buffer.recover(worker)
+        if recovered:
+            self.stdout.write(f"Recovered {recovered} messages from an interrupted batch.")
+
+        if options["once"]:
+            total = 0
+            while flushed := write_behind.redis_buffer.flush(worker):
+                total += flushed
+            self.stdout.write(self.style.SUCCESS(f"Flushed {total} messages."))
+            return
+
+        self.stdout.write(f"Flushing chat messages as worker '{worker}'...")
+        write_behind.redis_buffer.run(worker)
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('S3', '0002_auto_20250311_2151'),
+        ('chat_messages', '0002_rename_file_chatmessage_media'),
+        ('chats', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['chat', 'uploaded_at', 'id'], name='chat_message_history_idx'),
+        ),
+    ]
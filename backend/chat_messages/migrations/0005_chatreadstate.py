@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def create_read_states(apps, schema_editor):
+    """ One state per existing chat member, with everything sent so far counted as read """
+    Chat = apps.get_model('chats', 'Chat')
+    ChatReadState = apps.get_model('chat_messages', 'ChatReadState')
+    Membership = Chat.users.through
+
+    last_message_ids = dict(
+        Chat.objects.annotate(last_message_id=Max('messages__id')).values_list('id', 'last_message_id')
+    )
+    batch = []
+    for chat_id, user_id in Membership.objects.values_list('chat_id', 'userprofile_id').iterator(chunk_size=2000):
+        batch.append(ChatReadState(chat_id=chat_id, user_id=user_id, last_read_message_id=last_message_ids.get(chat_id)))
+        if len(batch) >= 2000:
+            ChatReadState.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    ChatReadState.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_messages', '0004_chatmessage_uploaded_at_default'),
+        ('chats', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.IntegerField(blank=True, null=True)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='chats.chat')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_read_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'chat')},
+            },
+        ),
+        migrations.RunPython(create_read_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:30
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_messages', '0005_chatreadstate'),
+        ('chats', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatreadstate',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='chatreadstate',
+            index=models.Index(fields=['user', 'last_activity_at', 'chat'], name='chat_read_state_inbox_idx'),
+        ),
+    ]
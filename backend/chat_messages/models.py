@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from chats.models import Chat
 from AWS.S3.models import UserMedia
@@ -11,7 +12,33 @@ class ChatMessage(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="messages", db_index=True)
     text = models.TextField(blank=True, null=True)
     media = models.ForeignKey(UserMedia, on_delete=models.SET_NULL, null=True, blank=True, related_name="messages")
-    uploaded_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Not auto_now_add, so write-behind batches keep the time the message was sent
+    uploaded_at = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["chat", "uploaded_at", "id"], name="chat_message_history_idx"),
+        ]
 
     def __str__(self):
         return f"Message from {self.user.username} in chat {self.chat.id}"
+
+class ChatReadState(models.Model):
+    """ Read cursor and unread counter of one member of a chat """
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="read_states")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chat_read_states")
+    # A plain id rather than a FK: with write-behind the message may not be flushed yet
+    last_read_message_id = models.IntegerField(null=True, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
+    # Time of the chat's latest message, copied here so the inbox is one index scan per user
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("user", "chat")
+        indexes = [
+            models.Index(fields=["user", "last_activity_at", "chat"], name="chat_read_state_inbox_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} has {self.unread_count} unread in chat {self.chat_id}"
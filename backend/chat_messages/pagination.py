@@ -0,0 +1,8 @@
+from backend.pagination import KeysetPagination
+
+class ChatMessagePagination(KeysetPagination):
+    """ Chat history: latest messages first, older pages via 'before', catch-up via 'after' """
+    ordering = ("uploaded_at", "id")
+    page_size = 50
+    max_page_size = 200
+    start_from_end = True
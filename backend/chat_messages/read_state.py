@@ -0,0 +1,73 @@
+"""
+Per-member unread counters, maintained incrementally.
+
+Every member of a chat has a ChatReadState row (created when they join the
+chat). Sending a message bumps the counter of the other members with a single
+UPDATE ... SET unread_count = unread_count + 1, and marking the chat read moves
+the cursor and resets the counter, so "unread per chat" is a row lookup rather
+than a COUNT over ChatMessage.
+"""
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from .models import ChatMessage, ChatReadState
+
+
+def unread_event(chat_id, unread_count, last_read_message_id=None):
+    return {
+        "type": "chat_unread",
+        "chat": chat_id,
+        "unread_count": unread_count,
+        "last_read_message_id": last_read_message_id,
+    }
+
+
+def increment_unread(chat_message):
+    """
+    Counts a new message as unread for the other members and moves every
+    member's inbox position, in one UPDATE. Returns {user_id: unread_count}
+    of the other members.
+    """
+    states = ChatReadState.objects.filter(chat_id=chat_message.chat_id)
+    states.update(
+        unread_count=Case(
+            When(user_id=chat_message.user_id, then=F("unread_count")),
+            default=F("unread_count") + 1,
+        ),
+        last_activity_at=Greatest(F("last_activity_at"), Value(chat_message.uploaded_at)),
+    )
+    return dict(states.exclude(user_id=chat_message.user_id).values_list("user_id", "unread_count"))
+
+
+class UnknownMessage(Exception):
+    pass
+
+
+def mark_read(user, chat_id, message_id=None):
+    """
+    Moves the member's read cursor to `message_id` (the latest message by
+    default) and recomputes the counter from the messages after it. The cursor
+    never moves backwards. Returns the updated ChatReadState, or None if the
+    user is not a member of the chat; raises UnknownMessage if `message_id` is
+    not a stored message of the chat.
+    """
+    states = ChatReadState.objects.filter(chat_id=chat_id, user=user)
+    if not states.exists():
+        return None
+
+    messages = ChatMessage.objects.filter(chat_id=chat_id)
+    if message_id is not None and not messages.filter(id=message_id).exists():
+        raise UnknownMessage(message_id)
+
+    with transaction.atomic():
+        # Locked so increment_unread waits instead of being overwritten by the save
+        state = states.select_for_update().get()
+        if message_id is None:
+            # Read under the lock, so a message counted while waiting for it is not reset unseen
+            message_id = messages.order_by("-id").values_list("id", flat=True).first()
+        if message_id is None or (state.last_read_message_id or 0) >= message_id:
+            return state
+        state.last_read_message_id = message_id
+        state.unread_count = messages.filter(id__gt=message_id).exclude(user=user).count()
+        state.save(update_fields=["last_read_message_id", "unread_count", "updated_at"])
+    return state
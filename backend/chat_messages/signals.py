@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from AWS.S3.models import UserMedia
+from chats.models import Chat
+from .models import ChatMessage, ChatReadState
+from .events import publish_removals
+from . import cache as recent_cache
+
+@receiver(post_save, sender=ChatMessage)
+def invalidate_on_message_update(sender, instance, created, **kwargs):
+    # New messages are appended by the send paths; only edits need invalidation
+    if not created:
+        recent_cache.invalidate(instance.chat_id)
+
+@receiver(post_delete, sender=ChatMessage)
+def invalidate_on_message_delete(sender, instance, **kwargs):
+    recent_cache.invalidate(instance.chat_id)
+    # SET_NULL cleared the inbox pointer if this was the chat's last message
+    Chat.objects.filter(id=instance.chat_id, last_message__isnull=True).update(
+        last_message_id=Subquery(
+            ChatMessage.objects.filter(chat_id=OuterRef("id")).order_by("-id").values("id")[:1]
+        )
+    )
+
+@receiver(post_save, sender=UserMedia)
+@receiver(pre_delete, sender=UserMedia)
+def invalidate_on_media_change(sender, instance, **kwargs):
+    # pre_delete: the messages still point at the media before SET_NULL clears them
+    if kwargs.get("created"):
+        return
+    chat_ids = ChatMessage.objects.filter(media=instance).values_list("chat_id", flat=True).distinct()
+    recent_cache.invalidate(*chat_ids)
+
+@receiver(m2m_changed, sender=Chat.users.through)
+def sync_read_states(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Keeps one ChatReadState per chat member, whichever side of Chat.users changed """
+    if action == "post_add" and pk_set:
+        pairs = [(pk, instance.pk) for pk in pk_set] if not reverse else [(instance.pk, pk) for pk in pk_set]
+        ChatReadState.objects.bulk_create(
+            [ChatReadState(user_id=user_id, chat_id=chat_id) for user_id, chat_id in pairs],
+            ignore_conflicts=True,
+        )
+    elif action in ("post_remove", "post_clear"):
+        if action == "post_remove" and not pk_set:
+            return
+        if reverse:
+            states = ChatReadState.objects.filter(user_id=instance.pk)
+            if action == "post_remove":
+                states = states.filter(chat_id__in=pk_set)
+        else:
+            states = ChatReadState.objects.filter(chat_id=instance.pk)
+            if action == "post_remove":
+                states = states.filter(user_id__in=pk_set)
+        # One read state per membership: they tell whose sockets to close
+        removed = list(states.values_list("user_id", "chat_id"))
+        states.delete()
+        if removed:
+            transaction.on_commit(lambda: publish_removals(removed))
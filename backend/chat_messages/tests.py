@@ -1,3 +1,183 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from backend.asgi import application
+from backend.pagination import encode_cursor
+from chats.models import Chat
+from .models import ChatMessage, ChatReadState
+from . import write_behind
 
-# Create your tests here.
+User = get_user_model()
+
+class ChatMessagesListViewTest(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com", phone_number="1", password="pass")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com", phone_number="2", password="pass")
+        self.chat, _ = Chat.get_or_create([self.alice, self.bob])
+        self.messages = [
+            ChatMessage.objects.create(chat=self.chat, user=self.alice, text=f"message {i}")
+            for i in range(7)
+        ]
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.alice).key}")
+        self.url = f"/api/chat_messages/{self.chat.id}/messages/"
+
+    def test_latest_page_is_returned_in_chronological_order(self):
+        response = self.client.get(self.url, {"limit": 3})
+
+        self.assertEqual([m["text"] for m in response.data["results"]], ["message 4", "message 5", "message 6"])
+        self.assertIsNotNone(response.data["previous"])
+        self.assertIsNone(response.data["next"])
+
+    def test_before_and_after_cursors_walk_the_history(self):
+        latest = self.client.get(self.url, {"limit": 3}).data
+        older = self.client.get(self.url, {"limit": 3, "before": latest["previous"]}).data
+        oldest = self.client.get(self.url, {"limit": 3, "before": older["previous"]}).data
+
+        self.assertEqual([m["text"] for m in older["results"]], ["message 1", "message 2", "message 3"])
+        self.assertEqual([m["text"] for m in oldest["results"]], ["message 0"])
+        self.assertIsNone(oldest["previous"])
+
+        newer = self.client.get(self.url, {"limit": 3, "after": older["next"]}).data
+        self.assertEqual([m["text"] for m in newer["results"]], ["message 4", "message 5", "message 6"])
+        self.assertIsNone(newer["next"])
+
+    def test_recent_page_reflects_deleted_messages(self):
+        self.client.get(self.url, {"limit": 3})
+        self.messages[-1].delete()
+
+        response = self.client.get(self.url, {"limit": 3})
+        self.assertEqual([m["text"] for m in response.data["results"]], ["message 3", "message 4", "message 5"])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {"before": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_with_values_of_the_wrong_type_is_rejected(self):
+        uploaded_at = self.messages[0].uploaded_at
+        for values in (["abc", 1], [{"a": 1}, 1], [uploaded_at, "x"], [uploaded_at, [1]], [None, 1]):
+            for parameter in ("before", "after"):
+                response = self.client.get(self.url, {parameter: encode_cursor(values)})
+                self.assertEqual(response.status_code, 400, (parameter, values))
+        self.assertEqual(self.client.get("/api/chats/inbox/", {"after": encode_cursor(["abc", 1])}).status_code, 400)
+
+class UnreadCountersTest(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com", phone_number="1", password="pass")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com", phone_number="2", password="pass")
+        self.chat, _ = Chat.get_or_create([self.alice, self.bob])
+        self.alice_client = APIClient()
+        self.alice_client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.alice).key}")
+        self.bob_client = APIClient()
+        self.bob_client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.bob).key}")
+
+    def test_members_get_a_read_state(self):
+        self.assertEqual(
+            set(ChatReadState.objects.filter(chat=self.chat).values_list("user_id", flat=True)),
+            {self.alice.id, self.bob.id},
+        )
+
+    def test_sent_messages_are_unread_for_other_members_until_marked_read(self):
+        for text in ("one", "two", "three"):
+            response = self.alice_client.post("/api/chat_messages/create/", {"chat": self.chat.id, "text": text})
+            self.assertEqual(response.status_code, 201)
+
+        unread = self.bob_client.get("/api/chat_messages/unread/").data
+        self.assertEqual(unread, {str(self.chat.id): 3})
+        self.assertEqual(self.alice_client.get("/api/chat_messages/unread/").data, {str(self.chat.id): 0})
+
+        first = ChatMessage.objects.filter(chat=self.chat).order_by("id").first()
+        response = self.bob_client.post(f"/api/chat_messages/{self.chat.id}/read/", {"message": first.id})
+        self.assertEqual(response.data["unread_count"], 2)
+
+        response = self.bob_client.post(f"/api/chat_messages/{self.chat.id}/read/")
+        self.assertEqual(response.data["unread_count"], 0)
+
+    def test_messages_outside_the_chat_cannot_be_marked_read(self):
+        self.alice_client.post("/api/chat_messages/create/", {"chat": self.chat.id, "text": "one"})
+
+        for message_id in (1000000, 2 ** 40):
+            response = self.bob_client.post(f"/api/chat_messages/{self.chat.id}/read/", {"message": message_id})
+            self.assertEqual(response.status_code, 400)
+        response = self.bob_client.post(f"/api/chat_messages/{self.chat.id}/read/")
+        self.assertEqual(response.data["unread_count"], 0)
+
+class ChatConsumerTest(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com", phone_number="1", password="pass")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com", phone_number="2", password="pass")
+        self.carol = User.objects.create_user(username="carol", email="carol@example.com", phone_number="3", password="pass")
+        self.chat, _ = Chat.get_or_create([self.alice, self.bob])
+
+    async def connect(self, user):
+        token = await Token.objects.acreate(user=user)
+        return WebsocketCommunicator(application, f"/ws/chat/{self.chat.id}/?token={token.key}")
+
+    async def test_message_is_persisted_broadcast_and_acknowledged(self):
+        sender = await self.connect(self.alice)
+        receiver = await self.connect(self.bob)
+        self.assertTrue((await sender.connect())[0])
+        self.assertTrue((await receiver.connect())[0])
+
+        await sender.send_json_to({"type": "message", "client_id": "c-1", "text": "hello"})
+
+        broadcast = await receiver.receive_json_from()
+        self.assertEqual(broadcast["type"], "message")
+        self.assertEqual(broadcast["text"], "hello")
+        self.assertEqual(broadcast["user"]["id"], self.alice.id)
+
+        replies = [await sender.receive_json_from(), await sender.receive_json_from()]
+        ack = next(reply for reply in replies if reply["type"] == "ack")
+        self.assertEqual(ack["client_id"], "c-1")
+        self.assertEqual(ack["id"], broadcast["id"])
+        self.assertTrue(await ChatMessage.objects.filter(id=ack["id"], chat=self.chat, text="hello").aexists())
+
+        await sender.disconnect()
+        await receiver.disconnect()
+
+    async def test_non_members_are_rejected(self):
+        outsider = await self.connect(self.carol)
+        connected, _ = await outsider.connect()
+        self.assertFalse(connected)
+
+    async def test_text_that_is_not_a_string_is_rejected(self):
+        sender = await self.connect(self.alice)
+        await sender.connect()
+
+        for text in ({"a": 1}, ["hello"], "x" * 10001):
+            await sender.send_json_to({"type": "message", "client_id": "c-1", "text": text})
+            self.assertEqual((await sender.receive_json_from())["type"], "error")
+        self.assertFalse(await ChatMessage.objects.filter(chat=self.chat).aexists())
+        await sender.disconnect()
+
+    async def test_removed_member_is_disconnected(self):
+        sender = await self.connect(self.bob)
+        await sender.connect()
+
+        await sync_to_async(self.chat.users.remove)(self.bob)
+
+        self.assertEqual((await sender.receive_output())["type"], "websocket.close")
+        self.assertFalse(await ChatMessage.objects.filter(chat=self.chat).aexists())
+
+class WriteBehindTest(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com", phone_number="1", password="pass")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com", phone_number="2", password="pass")
+        self.chat, _ = Chat.get_or_create([self.alice, self.bob])
+
+    def test_replayed_batch_is_written_once(self):
+        queued = [
+            ChatMessage(id=1000 + i, chat=self.chat, user=self.alice, text=f"message {i}")
+            for i in range(3)
+        ]
+        raw_items = [write_behind.serialize(chat_message) for chat_message in queued]
+
+        write_behind.write_batch([write_behind.deserialize(raw) for raw in raw_items])
+        write_behind.write_batch([write_behind.deserialize(raw) for raw in raw_items])
+
+        stored = ChatMessage.objects.filter(chat=self.chat).order_by("id")
+        self.assertEqual([m.id for m in stored], [1000, 1001, 1002])
+        self.assertEqual([m.uploaded_at for m in stored], [m.uploaded_at for m in queued])
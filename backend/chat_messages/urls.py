@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import ChatMessageCreateView, ChatMessagesListView
+from .views import ChatMessageCreateView, ChatMessagesListView, ChatMarkReadView, UnreadCountsView
 
 urlpatterns = [
     path("create/", ChatMessageCreateView.as_view(), name="chat-message-create"),
     path("<int:chat_id>/messages/", ChatMessagesListView.as_view(), name="chat-messages-list"),
+    path("<int:chat_id>/read/", ChatMarkReadView.as_view(), name="chat-messages-read"),
+    path("unread/", UnreadCountsView.as_view(), name="chat-messages-unread"),
 ]
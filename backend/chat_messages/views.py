@@ -2,20 +2,23 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.generics import ListAPIView
 from rest_framework.views import APIView
-from rest_framework.authentication import TokenAuthentication
+from accounts.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
-from .models import ChatMessage
+from .models import ChatMessage, ChatReadState
 from .serializers import ChatMessageSerializer, ChatMessageReadSerializer
+from .pagination import ChatMessagePagination
+from .events import publish_message, publish_read_state
+from . import cache as recent_cache
+from . import read_state
+from . import write_behind
 from AWS.S3.models import UserMedia
-from AWS.S3.views import S3FileUploadView  
+from AWS.S3.services import upload_files, MediaUploadError
 from chats.views import Chat
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-import json
+from backend.pagination import encode_cursor
 
 class ChatMessageCreateView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
@@ -36,57 +39,33 @@ class ChatMessageCreateView(APIView):
 
         # Check if a file is present in the request
         file_obj = request.FILES.get("file")
-        media_url = None
 
         if file_obj:
             print(f"File received: {file_obj.name}, size: {file_obj.size} bytes")
-
-            # Upload file via S3FileUploadView
-            file_request = request._request
-            file_request.data = {"file": file_obj}
-
-            upload_view = S3FileUploadView()
-            response = upload_view.post(file_request)
-
-            print("Response from S3:", response.data)
-
-            if response.status_code == status.HTTP_201_CREATED:
-                media_url = response.data.get("data", {}).get("file_url")
-                if media_url:
-                    data["media"] = response.data.get("data", {}).get("id")  # Storing media ID
-                    print("media_id after upload:", data["media"])
-                else:
-                    return Response({"error": "Error: media_url not received"}, status=status.HTTP_400_BAD_REQUEST)
-            else:
+            try:
+                with upload_files([file_obj], uploaded_by=request.user) as media_objects:
+                    data["media"] = media_objects[0].id  # Storing media ID
+                print("media_id after upload:", data["media"])
+            except MediaUploadError as e:
+                print(e)
                 return Response({"error": "File upload error to S3"}, status=status.HTTP_400_BAD_REQUEST)
+        elif data.get("media"):
+            # Media uploaded beforehand through the direct upload flow; only the uploader may attach it
+            if not str(data["media"]).isdigit() or not UserMedia.objects.filter(id=data["media"], uploaded_by=request.user).exists():
+                return Response({"error": "Media not found"}, status=status.HTTP_400_BAD_REQUEST)
 
         # Save the message
         serializer = ChatMessageSerializer(data=data)
         if serializer.is_valid():
-            chat_message = serializer.save()
-            print("Message successfully saved:", serializer.data)
-
-            # Prepare data for WebSocket
-            message_data = {
-                "type": "chat_message",
-                "id": chat_message.id,
-                "user": {
-                    "id": chat_message.user.id,
-                    "username": chat_message.user.username,
-                },
-                "chat": chat_message.chat.id,
-                "text": chat_message.text,
-                "uploaded_at": chat_message.uploaded_at.isoformat(),
-                "media_url": chat_message.media.file_url if chat_message.media else None,  # Using media.file_url
-            }
-
-            print("Sending WebSocket message:", json.dumps(message_data, indent=4))  # Logging the data
-
-            # Sending message to WebSocket
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"chat_{chat_id}", message_data
-            )
+            if write_behind.is_enabled():
+                chat_message = write_behind.enqueue(ChatMessage(**serializer.validated_data))
+                print("Message queued for write-behind:", chat_message.id)
+            else:
+                chat_message = serializer.save()
+                print("Message successfully saved:", serializer.data)
+
+            # Cache the message and send it to the chat's WebSocket group
+            publish_message(chat_message)
 
             return Response(ChatMessageSerializer(chat_message).data, status=status.HTTP_201_CREATED)
 
@@ -95,8 +74,9 @@ class ChatMessageCreateView(APIView):
 
 class ChatMessagesListView(ListAPIView):
     serializer_class = ChatMessageReadSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = ChatMessagePagination
 
     def list(self, request, *args, **kwargs):
         chat_id = self.kwargs.get("chat_id")
@@ -107,8 +87,60 @@ class ChatMessagesListView(ListAPIView):
         if not allowed_chats.filter(id=chat_id).exists():
             return Response({"detail": "Access to the chat is not allowed."}, status=status.HTTP_200_OK)
 
+        if not request.query_params.get("before") and not request.query_params.get("after"):
+            return self.list_recent(request, chat_id)
         return super().list(request, *args, **kwargs)
 
+    def list_recent(self, request, chat_id):
+        """ Serves the latest page from the recent messages cache instead of Postgres """
+        limit = self.paginator.get_page_size(request)
+        messages, cached_total = recent_cache.get_recent(chat_id, limit + 1)
+        results = messages[-limit:]
+
+        # The cache holds the whole chat unless it is full
+        has_previous = len(messages) > limit or cached_total >= recent_cache.get_config()["SIZE"]
+        previous = None
+        if results and has_previous:
+            previous = encode_cursor([results[0]["uploaded_at"], results[0]["id"]])
+        return Response({"previous": previous, "next": None, "results": results})
+
     def get_queryset(self):
         chat_id = self.kwargs.get("chat_id")
-        return ChatMessage.objects.filter(chat_id=chat_id).order_by("uploaded_at")
+        # Ordering is applied by ChatMessagePagination on top of the (chat, uploaded_at, id) index
+        return ChatMessage.objects.filter(chat_id=chat_id).select_related("media")
+
+class ChatMarkReadView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, chat_id, *args, **kwargs):
+        """ Marks the chat read up to 'message' (the latest message by default) """
+        message_id = request.data.get("message")
+        if message_id is not None:
+            try:
+                message_id = int(message_id)
+            except (TypeError, ValueError):
+                return Response({"error": "Invalid 'message' parameter"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            state = read_state.mark_read(request.user, chat_id, message_id)
+        except read_state.UnknownMessage:
+            return Response({"error": "Message not found in this chat"}, status=status.HTTP_400_BAD_REQUEST)
+        if state is None:
+            return Response({"error": "Access denied"}, status=status.HTTP_403_FORBIDDEN)
+
+        publish_read_state(state)
+        return Response({
+            "chat": state.chat_id,
+            "unread_count": state.unread_count,
+            "last_read_message_id": state.last_read_message_id,
+        }, status=status.HTTP_200_OK)
+
+class UnreadCountsView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        """ Unread counters of all chats of the current user, keyed by chat id """
+        counts = ChatReadState.objects.filter(user=request.user).values_list("chat_id", "unread_count")
+        return Response({str(chat_id): unread_count for chat_id, unread_count in counts}, status=status.HTTP_200_OK)
@@ -0,0 +1,215 @@
+"""
+Write-behind buffer for chat messages.
+
+When CHAT_MESSAGES_WRITE_BEHIND["ENABLED"] is set, new messages get an id
+pre-allocated from the Postgres sequence, are broadcast right away and are
+queued instead of being inserted one by one. A flusher writes the queue with
+bulk_create in batches bounded by BATCH_SIZE and FLUSH_INTERVAL.
+
+DURABILITY selects the queue:
+    "memory" - a deque flushed by a thread in the web process. Fastest, but
+               messages not yet flushed are lost if the process dies.
+    "redis"  - a Redis list flushed by `manage.py flush_chat_messages`. A batch
+               is moved to a processing list before it is written and only
+               dropped after the insert commits, so a crashed flusher replays it
+               on restart. Replays are idempotent because ids are pre-allocated.
+"""
+import atexit
+import json
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connection, transaction
+from django.utils.dateparse import parse_datetime
+from backend.redis_client import get_redis
+from .models import ChatMessage
+
+QUEUE_KEY = "chat_messages:write_behind:queue"
+PROCESSING_KEY = "chat_messages:write_behind:processing:{worker}"
+
+# Atomically moves up to ARGV[1] items from the head of the queue to the processing list
+TAKE_BATCH_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+
+def get_config():
+    return settings.CHAT_MESSAGES_WRITE_BEHIND
+
+
+def is_enabled():
+    return get_config()["ENABLED"]
+
+
+class IdAllocator:
+    """ Hands out ChatMessage ids reserved in blocks from the Postgres sequence """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = deque()
+
+    def allocate(self):
+        with self.lock:
+            if not self.ids:
+                self.ids.extend(self.reserve(get_config()["ID_BLOCK_SIZE"]))
+            return self.ids.popleft()
+
+    def reserve(self, count):
+        if connection.vendor != "postgresql":
+            raise ImproperlyConfigured("Chat message write-behind requires PostgreSQL.")
+        table = ChatMessage._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [table, count],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+def serialize(chat_message):
+    return json.dumps({
+        "id": chat_message.id,
+        "chat_id": chat_message.chat_id,
+        "user_id": chat_message.user_id,
+        "text": chat_message.text,
+        "media_id": chat_message.media_id,
+        "uploaded_at": chat_message.uploaded_at.isoformat(),
+    })
+
+
+def deserialize(raw):
+    data = json.loads(raw)
+    data["uploaded_at"] = parse_datetime(data["uploaded_at"])
+    return ChatMessage(**data)
+
+
+def write_batch(chat_messages):
+    """
+    Inserts a batch of buffered messages. Rows that already exist (a replayed
+    batch) are skipped; if the batch is rejected as a whole, e.g. because a
+    referenced media row was deleted meanwhile, rows are retried one by one so
+    a single bad row cannot block the queue.
+    """
+    if not chat_messages:
+        return
+    try:
+        with transaction.atomic():
+            ChatMessage.objects.bulk_create(chat_messages, ignore_conflicts=True)
+    except IntegrityError:
+        for chat_message in chat_messages:
+            try:
+                with transaction.atomic():
+                    ChatMessage.objects.bulk_create([chat_message], ignore_conflicts=True)
+            except IntegrityError as e:
+                print(f"Dropping buffered chat message {chat_message.id}: {e}")
+
+
+class MemoryBuffer:
+    def __init__(self):
+        self.items = deque()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.thread_lock = threading.Lock()
+
+    def push(self, chat_message):
+        self.items.append(chat_message)
+        self.ensure_flusher()
+        if len(self.items) >= get_config()["BATCH_SIZE"]:
+            self.wakeup.set()
+
+    def ensure_flusher(self):
+        if self.thread is None:
+            with self.thread_lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name="chat-write-behind", daemon=True)
+                    self.thread.start()
+
+    def take(self, limit):
+        batch = []
+        while self.items and len(batch) < limit:
+            batch.append(self.items.popleft())
+        return batch
+
+    def flush(self):
+        batch_size = get_config()["BATCH_SIZE"]
+        while self.items:
+            write_batch(self.take(batch_size))
+
+    def run(self):
+        while True:
+            self.wakeup.wait(get_config()["FLUSH_INTERVAL"])
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Chat write-behind flush failed: {e}")
+            finally:
+                connection.close()
+
+
+class RedisBuffer:
+    def __init__(self):
+        self.take_batch = None
+
+    def push(self, chat_message):
+        get_redis().rpush(QUEUE_KEY, serialize(chat_message))
+
+    def flush(self, worker="default"):
+        """ Writes one batch from the queue and returns how many messages it held """
+        redis = get_redis()
+        if self.take_batch is None:
+            self.take_batch = redis.register_script(TAKE_BATCH_SCRIPT)
+        processing_key = PROCESSING_KEY.format(worker=worker)
+        raw_items = self.take_batch(keys=[QUEUE_KEY, processing_key], args=[get_config()["BATCH_SIZE"]])
+        write_batch([deserialize(raw) for raw in raw_items])
+        redis.delete(processing_key)
+        return len(raw_items)
+
+    def recover(self, worker="default"):
+        """ Replays a batch left in the processing list by a flusher that crashed mid-write """
+        redis = get_redis()
+        processing_key = PROCESSING_KEY.format(worker=worker)
+        raw_items = redis.lrange(processing_key, 0, -1)
+        write_batch([deserialize(raw) for raw in raw_items])
+        redis.delete(processing_key)
+        return len(raw_items)
+
+    def run(self, worker="default"):
+        self.recover(worker)
+        while True:
+            started = time.monotonic()
+            flushed = self.flush(worker)
+            if flushed < get_config()["BATCH_SIZE"]:
+                time.sleep(max(0, get_config()["FLUSH_INTERVAL"] - (time.monotonic() - started)))
+
+
+allocator = IdAllocator()
+memory_buffer = MemoryBuffer()
+redis_buffer = RedisBuffer()
+atexit.register(memory_buffer.flush)
+
+
+def get_buffer():
+    durability = get_config()["DURABILITY"]
+    if durability == "memory":
+        return memory_buffer
+    if durability == "redis":
+        return redis_buffer
+    raise ImproperlyConfigured(f"Unknown chat write-behind durability: {durability}")
+
+
+def enqueue(chat_message):
+    """
+    Assigns a pre-allocated id to an unsaved ChatMessage and queues it for the
+    flusher. The returned message can be broadcast immediately.
+    """
+    chat_message.id = allocator.allocate()
+    get_buffer().push(chat_message)
+    return chat_message
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_last_activity(apps, schema_editor):
+    """ Points every chat at its latest message and copies its time to the members' read states """
+    Chat = apps.get_model('chats', 'Chat')
+    ChatMessage = apps.get_model('chat_messages', 'ChatMessage')
+    ChatReadState = apps.get_model('chat_messages', 'ChatReadState')
+
+    chats = Chat.objects.annotate(last_message_id_value=Max('messages__id')).values_list('id', 'created_at', 'last_message_id_value')
+    for chat_id, created_at, last_message_id in chats.iterator(chunk_size=2000):
+        last_activity_at = created_at
+        if last_message_id is not None:
+            Chat.objects.filter(id=chat_id).update(last_message_id=last_message_id)
+            last_activity_at = ChatMessage.objects.filter(id=last_message_id).values_list('uploaded_at', flat=True).first()
+        ChatReadState.objects.filter(chat_id=chat_id).update(last_activity_at=last_activity_at)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_messages', '0006_chatreadstate_last_activity'),
+        ('chats', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='last_message',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat_messages.chatmessage'),
+        ),
+        migrations.RunPython(backfill_last_activity, migrations.RunPython.noop),
+    ]
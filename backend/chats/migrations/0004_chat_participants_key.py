@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:32
+
+import hashlib
+from itertools import groupby
+from django.db import migrations, models
+
+
+def backfill_participants_keys(apps, schema_editor):
+    """
+    Computes the key of every existing chat. If duplicate chats already exist
+    for the same users, the oldest one keeps the key and the others stay NULL.
+    """
+    Chat = apps.get_model('chats', 'Chat')
+    Membership = Chat.users.through
+
+    seen = set()
+    memberships = Membership.objects.order_by('chat_id').values_list('chat_id', 'userprofile_id')
+    for chat_id, rows in groupby(memberships.iterator(chunk_size=5000), key=lambda row: row[0]):
+        joined = ",".join(str(user_id) for user_id in sorted({user_id for _, user_id in rows}))
+        key = hashlib.sha256(joined.encode("ascii")).hexdigest()
+        if key in seen:
+            continue
+        seen.add(key)
+        Chat.objects.filter(pk=chat_id).update(participants_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0003_chat_last_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='participants_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_participants_keys, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+import hashlib
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -6,23 +7,39 @@ User = get_user_model()
 class Chat(models.Model):
     users = models.ManyToManyField(User, related_name="chats")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized for the inbox. No DB constraint: with write-behind the
+    # message row may be flushed after the pointer is moved.
+    last_message = models.ForeignKey(
+        "chat_messages.ChatMessage", on_delete=models.SET_NULL, null=True, blank=True,
+        related_name="+", db_constraint=False,
+    )
+    # Hash of the sorted participant ids, kept in sync with `users` by
+    # chats.signals. The unique index makes "the chat between these users"
+    # a single lookup and stops concurrent requests from creating duplicates.
+    # It is NULL for a chat whose members changed to those of another chat.
+    participants_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
 
-    def save(self, *args, **kwargs):
-        """ Sort users before saving to avoid duplicates """
-        super().save(*args, **kwargs)
-        sorted_users = sorted(self.users.all(), key=lambda user: user.id)
-        self.users.set(sorted_users)
+    @staticmethod
+    def make_participants_key(user_ids):
+        joined = ",".join(str(user_id) for user_id in sorted(set(user_ids)))
+        return hashlib.sha256(joined.encode("ascii")).hexdigest()
 
     @classmethod
     def get_or_create(cls, users):
         """ Gets an existing chat or creates a new one """
-        sorted_users = sorted(users, key=lambda user: user.id)
-        chats = cls.objects.annotate(user_count=models.Count("users")).filter(user_count=len(users))
-        for chat in chats:
-            if set(chat.users.all()) == set(sorted_users):
-                return chat, False
-        chat = cls.objects.create()
-        chat.users.set(sorted_users)
+        user_ids = sorted({user.id for user in users})
+        key = cls.make_participants_key(user_ids)
+
+        chat = cls.objects.filter(participants_key=key).first()
+        if chat is not None:
+            return chat, False
+        try:
+            with transaction.atomic():
+                chat = cls.objects.create(participants_key=key)
+                chat.users.set(user_ids)
+        except IntegrityError:
+            # A concurrent request created the same chat first
+            return cls.objects.get(participants_key=key), False
         return chat, True
 
     def __str__(self):
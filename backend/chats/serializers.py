@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import Chat
+from chat_messages.models import ChatMessage, ChatReadState
 
 User = get_user_model()
 
@@ -16,3 +17,29 @@ class ChatSerializer(serializers.ModelSerializer):
         users = validated_data.pop('users')
         chat, created = Chat.get_or_create(users=users)
         return chat
+
+class ChatParticipantSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username']
+
+class ChatLastMessageSerializer(serializers.ModelSerializer):
+    user = ChatParticipantSerializer(read_only=True)
+    media_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ChatMessage
+        fields = ['id', 'user', 'text', 'uploaded_at', 'media_url']
+
+    def get_media_url(self, obj):
+        return obj.media.file_url if obj.media else None
+
+class ChatInboxSerializer(serializers.ModelSerializer):
+    """ One inbox entry, built from the current user's ChatReadState of a chat """
+    id = serializers.IntegerField(source='chat_id', read_only=True)
+    users = ChatParticipantSerializer(source='chat.users', many=True, read_only=True)
+    last_message = ChatLastMessageSerializer(source='chat.last_message', allow_null=True, read_only=True)
+
+    class Meta:
+        model = ChatReadState
+        fields = ['id', 'users', 'last_message', 'unread_count', 'last_read_message_id', 'last_activity_at']
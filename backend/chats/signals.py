@@ -0,0 +1,35 @@
+from django.db import IntegrityError, transaction
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+from .models import Chat
+
+@receiver(m2m_changed, sender=Chat.users.through)
+def sync_participants_key(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Recomputes participants_key of every chat whose users changed. A chat
+    whose new member set already has a chat keeps no key: the other chat
+    stays the one Chat.get_or_create returns for those users.
+    """
+    if action == "pre_clear" and reverse:
+        # user.chats.clear() does not report which chats it touched
+        instance._cleared_chat_ids = list(sender.objects.filter(userprofile_id=instance.pk).values_list("chat_id", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        chat_ids = [instance.pk]
+    elif action == "post_clear":
+        chat_ids = getattr(instance, "_cleared_chat_ids", [])
+    else:
+        chat_ids = pk_set or []
+
+    for chat_id in chat_ids:
+        user_ids = list(sender.objects.filter(chat_id=chat_id).values_list("userprofile_id", flat=True))
+        key = Chat.make_participants_key(user_ids) if user_ids else None
+        chat = Chat.objects.filter(pk=chat_id)
+        try:
+            with transaction.atomic():
+                chat.exclude(participants_key=key).update(participants_key=key)
+        except IntegrityError:
+            chat.update(participants_key=None)
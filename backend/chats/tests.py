@@ -1,3 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from chat_messages.models import ChatMessage
+from chat_messages.events import publish_message
+from .models import Chat
 
-# Create your tests here.
+User = get_user_model()
+
+class ChatInboxViewTest(TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user(username="me", email="me@example.com", phone_number="0", password="pass")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.me).key}")
+
+    def start_chat(self, index):
+        friend = User.objects.create_user(
+            username=f"friend{index}", email=f"friend{index}@example.com", phone_number=str(index + 1), password="pass"
+        )
+        chat, _ = Chat.get_or_create([self.me, friend])
+        publish_message(ChatMessage.objects.create(chat=chat, user=friend, text=f"hi from {index}"))
+        return chat
+
+    def test_inbox_is_sorted_by_activity_with_previews_and_unread_counts(self):
+        chats = [self.start_chat(i) for i in range(3)]
+        publish_message(ChatMessage.objects.create(chat=chats[0], user=self.me, text="reply"))
+
+        results = self.client.get("/api/chats/inbox/").data["results"]
+
+        self.assertEqual([entry["id"] for entry in results], [chats[0].id, chats[2].id, chats[1].id])
+        self.assertEqual(results[0]["last_message"]["text"], "reply")
+        self.assertEqual(results[0]["unread_count"], 1)
+        self.assertEqual(results[1]["last_message"]["user"]["username"], "friend2")
+        self.assertEqual({user["username"] for user in results[1]["users"]}, {"me", "friend2"})
+
+    def test_query_count_does_not_grow_with_the_number_of_chats(self):
+        for i in range(2):
+            self.start_chat(i)
+        # The first request caches the token lookup
+        self.client.get("/api/chats/inbox/")
+        with CaptureQueriesContext(connection) as few:
+            self.client.get("/api/chats/inbox/")
+        for i in range(2, 12):
+            self.start_chat(i)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get("/api/chats/inbox/")
+
+        self.assertEqual(len(few), len(many))
+
+    def test_inbox_pages_with_a_cursor(self):
+        chats = [self.start_chat(i) for i in range(5)]
+
+        first = self.client.get("/api/chats/inbox/", {"limit": 3}).data
+        second = self.client.get("/api/chats/inbox/", {"limit": 3, "after": first["next"]}).data
+
+        ids = [entry["id"] for entry in first["results"] + second["results"]]
+        self.assertEqual(ids, [chat.id for chat in reversed(chats)])
+        self.assertIsNone(second["next"])
+
+class ChatGetOrCreateTest(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f"user{i}", email=f"user{i}@example.com", phone_number=str(i), password="pass")
+            for i in range(3)
+        ]
+
+    def test_same_participants_return_the_same_chat(self):
+        chat, created = Chat.get_or_create([self.users[0], self.users[1]])
+        again, created_again = Chat.get_or_create([self.users[1], self.users[0]])
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(chat, again)
+        self.assertNotEqual(Chat.get_or_create(self.users)[0], chat)
+
+    def test_key_follows_membership_changes(self):
+        chat, _ = Chat.get_or_create([self.users[0], self.users[1]])
+        chat.users.add(self.users[2])
+
+        self.assertEqual(Chat.get_or_create(self.users), (chat, False))
+        self.users[2].chats.remove(chat)
+        chat.refresh_from_db()
+        self.assertEqual(chat.participants_key, Chat.make_participants_key([self.users[0].id, self.users[1].id]))
+
+    def test_change_to_the_members_of_another_chat_clears_the_key(self):
+        pair, _ = Chat.get_or_create([self.users[0], self.users[1]])
+        group, _ = Chat.get_or_create(self.users)
+
+        group.users.remove(self.users[2])
+
+        group.refresh_from_db()
+        self.assertIsNone(group.participants_key)
+        self.assertEqual(Chat.get_or_create([self.users[0], self.users[1]]), (pair, False))
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import ChatCreateView, ChatListView
+from .views import ChatCreateView, ChatListView, ChatInboxView
 
 urlpatterns = [
     path("create/", ChatCreateView.as_view(), name="chats_create"),
     path("get/", ChatListView.as_view(), name="chats_get"),
+    path("inbox/", ChatInboxView.as_view(), name="chats_inbox"),
 ]
@@ -1,19 +1,51 @@
-from rest_framework.authentication import TokenAuthentication
+from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
+from accounts.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import generics
+from backend.pagination import KeysetPagination
+from chat_messages.models import ChatReadState
 from .models import Chat
-from .serializers import ChatSerializer
+from .serializers import ChatSerializer, ChatInboxSerializer
+
+User = get_user_model()
 
 class ChatCreateView(generics.CreateAPIView):
     queryset = Chat.objects.all()
     serializer_class = ChatSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
 class ChatListView(generics.ListAPIView):
     serializer_class = ChatSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Chat.objects.filter(users=self.request.user).prefetch_related(
+            Prefetch("users", queryset=User.objects.only("id"))
+        )
+
+class ChatInboxPagination(KeysetPagination):
+    ordering = ("-last_activity_at", "-chat_id")
+    page_size = 30
+    max_page_size = 100
+
+class ChatInboxView(generics.ListAPIView):
+    """
+    The current user's chats, most recently active first, each with its
+    participants, last message and unread count. Two queries per page
+    regardless of how many chats the user has: the read states joined with
+    the chats and their last messages, and one prefetch of the participants.
+    """
+    serializer_class = ChatInboxSerializer
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = ChatInboxPagination
 
     def get_queryset(self):
-        return Chat.objects.filter(users=self.request.user)
+        return ChatReadState.objects.filter(user=self.request.user).select_related(
+            "chat__last_message__user", "chat__last_message__media"
+        ).prefetch_related(
+            Prefetch("chat__users", queryset=User.objects.only("id", "username"))
+        )
@@ -3,7 +3,7 @@ from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
+from accounts.authentication import CachedTokenAuthentication
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -13,7 +13,7 @@ from .serializers import ProductSerializer, PaymentSerializer
 
 class CheckoutSessionView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
 
     def post(self, request, *args, **kwargs):
         if StripePayment.objects.filter(user=request.user, status__in=["paid", "active"]).exists():
@@ -65,7 +65,7 @@ class CheckoutSessionView(APIView):
         
 class SubscriptionStatusView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
 
     def get(self, request, user_id, *args, **kwargs):
         user = get_object_or_404(get_user_model(), id=user_id)
@@ -82,7 +82,7 @@ class SubscriptionStatusView(APIView):
 
 class CancelSubscriptionView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
 
     def post(self, request, *args, **kwargs):
         user = request.user
@@ -152,7 +152,7 @@ class ProductListView(APIView):
         
 class PaymentListView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
 
     def get(self, request, *args, **kwargs):
         user = request.user
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from subscriptions.models import UserSubscription
+from posts import timeline
+
+class Command(BaseCommand):
+    help = "Rebuilds the Redis home timelines from the database (e.g. after Redis lost its data)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="users", help="Only rebuild this user's timeline (repeatable).")
+
+    def handle(self, *args, **options):
+        user_ids = options["users"]
+        if not user_ids:
+            user_ids = UserSubscription.objects.values_list("subscriber_id", flat=True).distinct().order_by("subscriber_id").iterator()
+
+        rebuilt = 0
+        for user_id in user_ids:
+            timeline.rebuild(user_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} timelines."))
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('S3', '0002_auto_20250311_2151'),
+        ('posts', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', 'uploaded_at', 'id'], name='post_user_uploaded_idx'),
+        ),
+    ]
@@ -11,6 +11,12 @@ class Post(models.Model):
     media = models.ManyToManyField(UserMedia, blank=True, related_name="posts")
     uploaded_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a user's posts by (uploaded_at, id)
+            models.Index(fields=["user", "uploaded_at", "id"], name="post_user_uploaded_idx"),
+        ]
+
     def __str__(self):
         short_text = (self.text[:30] + "...") if self.text else "No text"
         return f"Post by {self.user.username} at {self.uploaded_at.strftime('%Y-%m-%d %H:%M')} | {short_text}"
@@ -0,0 +1,7 @@
+from backend.pagination import KeysetPagination
+
+class PostPagination(KeysetPagination):
+    """ Profile posts: newest first, older pages via 'after' """
+    ordering = ("-uploaded_at", "-id")
+    page_size = 20
+    max_page_size = 100
@@ -1,3 +1,163 @@
-from django.test import TestCase
+import io
+from unittest import mock
+import boto3
+from moto import mock_aws
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from AWS.S3.models import UserMedia
+from backend.pagination import encode_cursor
+from .models import Post
+from . import timeline
 
-# Create your tests here.
+User = get_user_model()
+
+class SubscribedUsersPostsViewTest(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username="reader", email="reader@example.com", phone_number="0", password="pass")
+        self.authors = [
+            User.objects.create_user(username=f"author{i}", email=f"author{i}@example.com", phone_number=str(i + 1), password="pass")
+            for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.reader).key}")
+        for author in self.authors[:2]:
+            self.client.post("/api/subscriptions/", {"subscribed_to": author.id})
+
+    def create_post(self, author, text):
+        post = Post.objects.create(user=author, text=text)
+        timeline.fan_out(post)
+        return post
+
+    def feed(self, **params):
+        return self.client.get("/api/posts/subscriptions/get/", params).data
+
+    def test_feed_contains_followed_authors_newest_first(self):
+        first = self.create_post(self.authors[0], "first")
+        self.create_post(self.authors[2], "not followed")
+        second = self.create_post(self.authors[1], "second")
+
+        self.assertEqual([post["id"] for post in self.feed()["results"]], [second.id, first.id])
+
+    def test_feed_pages_with_a_cursor(self):
+        posts = [self.create_post(self.authors[i % 2], f"post {i}") for i in range(5)]
+
+        first = self.feed(limit=3)
+        second = self.feed(limit=3, after=first["next"])
+
+        ids = [post["id"] for post in first["results"] + second["results"]]
+        self.assertEqual(ids, [post.id for post in reversed(posts)])
+        self.assertIsNone(second["next"])
+
+    def test_stored_pages_do_not_read_the_follow_list(self):
+        self.create_post(self.authors[0], "first")
+        self.feed()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.feed()["results"]), 1)
+        self.assertFalse([query for query in queries if "subscriptions_usersubscription" in query["sql"]])
+
+    def test_malformed_cursor_is_rejected(self):
+        for cursor in [encode_cursor(["x"]), encode_cursor([0]), "not a cursor"]:
+            response = self.client.get("/api/posts/subscriptions/get/", {"after": cursor})
+            self.assertEqual(response.status_code, 400)
+
+    @override_settings(POSTS_TIMELINE={"SIZE": 800, "TTL": 60, "FANOUT_MAX_FOLLOWERS": 0})
+    def test_posts_of_authors_above_the_fanout_limit_are_merged_on_read(self):
+        self.feed()
+        post = self.create_post(self.authors[0], "from a big account")
+
+        self.assertEqual([p["id"] for p in self.feed()["results"]], [post.id])
+
+    def test_following_someone_includes_their_existing_posts(self):
+        post = self.create_post(self.authors[2], "older post")
+        self.feed()
+
+        self.client.post("/api/subscriptions/", {"subscribed_to": self.authors[2].id})
+
+        self.assertEqual([p["id"] for p in self.feed()["results"]], [post.id])
+
+class UserPostsViewTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", email="author@example.com", phone_number="1", password="pass")
+        self.posts = [Post.objects.create(user=self.author, text=f"post {i}") for i in range(5)]
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.author).key}")
+
+    def get(self, **params):
+        return self.client.get("/api/posts/user/get/", {"user_id": self.author.id, **params})
+
+    def test_posts_are_paged_newest_first(self):
+        first = self.get(limit=2).data
+        second = self.get(limit=2, after=first["next"]).data
+        last = self.get(limit=2, after=second["next"]).data
+
+        pages = [[post["text"] for post in page["results"]] for page in (first, second, last)]
+        self.assertEqual(pages, [["post 4", "post 3"], ["post 2", "post 1"], ["post 0"]])
+        self.assertIsNone(last["next"])
+
+    def test_query_count_does_not_depend_on_media(self):
+        # The first request caches the token lookup
+        self.get()
+        with CaptureQueriesContext(connection) as without_media:
+            self.get()
+        for index, post in enumerate(self.posts):
+            post.media.add(UserMedia.objects.create(title=f"media {index}", file=f"uploads/{index}.jpg"))
+        with CaptureQueriesContext(connection) as with_media:
+            response = self.get()
+
+        self.assertTrue(all(len(post["media"]) == 1 for post in response.data["results"]))
+        self.assertEqual(len(with_media), len(without_media))
+
+@mock_aws
+@override_settings(
+    AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing",
+    AWS_STORAGE_BUCKET_NAME="test-bucket", AWS_S3_REGION_NAME="us-east-1",
+)
+class PostCreateViewTest(TransactionTestCase):
+    def setUp(self):
+        self.s3 = boto3.client("s3", region_name="us-east-1")
+        self.s3.create_bucket(Bucket="test-bucket")
+        self.author = User.objects.create_user(username="author", email="author@example.com", phone_number="1", password="pass")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.author).key}")
+
+    def image(self, name, color="black"):
+        content = io.BytesIO()
+        Image.new("RGB", (4, 4), color).save(content, "PNG")
+        return SimpleUploadedFile(name, content.getvalue(), content_type="image/png")
+
+    def stored_keys(self):
+        return [item["Key"] for item in self.s3.list_objects_v2(Bucket="test-bucket").get("Contents", [])]
+
+    def test_files_are_uploaded_and_attached_in_order(self):
+        files = [self.image(f"photo{i}.png", (i, i, i)) for i in range(5)]
+        response = self.client.post("/api/posts/create/", {"text": "album", "files": files}, format="multipart")
+
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get(id=response.data["id"])
+        self.assertEqual([media.title for media in post.media.order_by("id")], [f"photo{i}.png" for i in range(5)])
+        self.assertCountEqual(self.stored_keys(), [media.file.name for media in post.media.all()])
+        self.assertEqual({media.uploaded_by_id for media in post.media.all()}, {self.author.id})
+
+    def test_invalid_file_rejects_the_post_before_uploading(self):
+        fake = SimpleUploadedFile("fake.png", b"not an image", content_type="image/png")
+        response = self.client.post("/api/posts/create/", {"files": [self.image("ok.png"), fake]}, format="multipart")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(self.stored_keys(), [])
+
+    def test_uploads_are_deleted_when_the_post_cannot_be_saved(self):
+        files = [self.image(f"photo{i}.png") for i in range(3)]
+        with mock.patch.object(Post.objects, "create", side_effect=RuntimeError("database down")):
+            with self.assertRaises(RuntimeError):
+                self.client.post("/api/posts/create/", {"files": files}, format="multipart")
+
+        self.assertFalse(UserMedia.objects.exists())
+        self.assertEqual(self.stored_keys(), [])
@@ -0,0 +1,178 @@
+"""
+Materialized home timelines (fan-out on write).
+
+Every subscriber has a capped Redis sorted set of post ids, scored by id (ids
+follow uploaded_at). Creating a post pushes its id into the timelines of the
+author's subscribers, so reading a feed page is a ZREVRANGEBYSCORE plus one
+query for the page's posts, instead of filtering all posts by the follow list.
+
+Authors with more than FANOUT_MAX_FOLLOWERS subscribers are not fanned out
+(one post would mean that many writes). They are recorded in a Redis set and
+their posts are merged into the page at read time (fan-out on read). Next to
+each timeline, posts:timeline:<id>:merged holds the followed authors that are
+merged, so a page costs O(page) whatever the size of the follow list; the
+follow list itself is only read to rebuild a timeline or to scroll past its
+oldest stored post.
+
+A timeline that does not exist (never built, expired, invalidated by a
+follow/unfollow, or lost with Redis) is rebuilt from the database on the next
+read; `manage.py rebuild_timelines` rebuilds them ahead of time.
+"""
+from django.conf import settings
+from redis.exceptions import RedisError
+from accounts.models import UserProfile
+from backend.redis_client import get_redis
+from subscriptions.models import UserSubscription
+from .models import Post
+
+TIMELINE_KEY = "posts:timeline:{user_id}"
+MERGED_KEY = "posts:timeline:{user_id}:merged"
+CELEBRITIES_KEY = "posts:timeline:celebrities"
+# Member stored in every built timeline and merged set so an empty one is still a cache hit
+SENTINEL = "0"
+
+PUSH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[1])
+    -- rank 0 is the sentinel; keep it and the newest ARGV[2] posts
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 1, -tonumber(ARGV[2]) - 1)
+end
+"""
+
+
+# Adds an author to the merged set of a reader whose timeline is built
+ADD_MERGED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('SADD', KEYS[1], ARGV[1])
+end
+"""
+
+
+def get_config():
+    return settings.POSTS_TIMELINE
+
+
+def timeline_key(user_id):
+    return TIMELINE_KEY.format(user_id=user_id)
+
+
+def merged_key(user_id):
+    return MERGED_KEY.format(user_id=user_id)
+
+
+def follower_count(user_id):
+    # The denormalized counter (subscriptions/counters.py), not a COUNT(*)
+    return UserProfile.objects.filter(id=user_id).values_list("follower_count", flat=True).first() or 0
+
+
+def subscriber_ids(user_id):
+    return UserSubscription.objects.filter(subscribed_to_id=user_id).values_list("subscriber_id", flat=True)
+
+
+def fan_out(post):
+    """ Pushes a new post into the timelines of its author's subscribers """
+    config = get_config()
+    try:
+        redis = get_redis()
+        if follower_count(post.user_id) > config["FANOUT_MAX_FOLLOWERS"]:
+            if redis.sadd(CELEBRITIES_KEY, post.user_id):
+                # Newly merged at read time: tell the built timelines of the subscribers
+                add = redis.register_script(ADD_MERGED_SCRIPT)
+                pipe = redis.pipeline(transaction=False)
+                for index, subscriber_id in enumerate(subscriber_ids(post.user_id).iterator(chunk_size=2000), 1):
+                    add(keys=[merged_key(subscriber_id)], args=[post.user_id], client=pipe)
+                    if index % 1000 == 0:
+                        pipe.execute()
+                pipe.execute()
+            return
+        if redis.srem(CELEBRITIES_KEY, post.user_id):
+            # Posts made while the author was read-merged are missing from the
+            # stored timelines; let them be rebuilt
+            invalidate(*subscriber_ids(post.user_id))
+            return
+
+        push = redis.register_script(PUSH_SCRIPT)
+        pipe = redis.pipeline(transaction=False)
+        for index, subscriber_id in enumerate(subscriber_ids(post.user_id).iterator(chunk_size=2000), 1):
+            push(keys=[timeline_key(subscriber_id)], args=[post.id, config["SIZE"]], client=pipe)
+            if index % 1000 == 0:
+                pipe.execute()
+        pipe.execute()
+    except RedisError as e:
+        print(f"Timeline fan-out failed for post {post.id}: {e}")
+
+
+def invalidate(*user_ids):
+    """ Drops stored timelines, e.g. after the user followed or unfollowed someone """
+    if not user_ids:
+        return
+    try:
+        get_redis().delete(*[key for user_id in user_ids for key in (timeline_key(user_id), merged_key(user_id))])
+    except RedisError as e:
+        print(f"Timeline invalidation failed: {e}")
+
+
+def rebuild(user_id):
+    """ Rebuilds a user's timeline from scratch from the posts of everyone they follow """
+    config = get_config()
+    redis = get_redis()
+    followed = list(UserSubscription.objects.filter(subscriber_id=user_id).values_list("subscribed_to_id", flat=True))
+    post_ids = list(
+        Post.objects.filter(user__in=followed).order_by("-id").values_list("id", flat=True)[:config["SIZE"]]
+    )
+    merged = [
+        followed_id for followed_id, is_celebrity
+        in zip(followed, redis.smismember(CELEBRITIES_KEY, followed) if followed else [])
+        if is_celebrity
+    ]
+    key = timeline_key(user_id)
+    pipe = redis.pipeline()
+    pipe.delete(key, merged_key(user_id))
+    pipe.zadd(key, {SENTINEL: 0, **{str(post_id): post_id for post_id in post_ids}})
+    pipe.sadd(merged_key(user_id), SENTINEL, *merged)
+    pipe.expire(key, config["TTL"])
+    pipe.expire(merged_key(user_id), config["TTL"])
+    pipe.execute()
+
+
+def read_page(user_id, after_id=None, limit=20):
+    """
+    Returns (post_ids, has_more): the next `limit` post ids of the user's
+    feed, newest first, older than `after_id`. Pages past the end of a full
+    stored timeline, and every page while Redis is unavailable, are read from
+    the database directly.
+    """
+    config = get_config()
+    # Authors whose posts are queried; None for everyone the user follows
+    read_from_db = None
+    post_ids = []
+    try:
+        redis = get_redis()
+        key = timeline_key(user_id)
+        if redis.exists(key, merged_key(user_id)) < 2:
+            rebuild(user_id)
+        pipe = redis.pipeline()
+        pipe.zrevrangebyscore(key, f"({after_id}" if after_id else "+inf", "(0", start=0, num=limit + 1)
+        pipe.zcard(key)
+        pipe.smembers(merged_key(user_id))
+        pipe.expire(key, config["TTL"])
+        pipe.expire(merged_key(user_id), config["TTL"])
+        raw_ids, stored, merged, _, _ = pipe.execute()
+        post_ids = [int(post_id) for post_id in raw_ids]
+
+        # Past the oldest stored post of a full timeline the database takes over
+        if len(post_ids) > limit or stored <= config["SIZE"]:
+            # Only authors that are merged at read time
+            read_from_db = [int(author_id) for author_id in merged if int(author_id) != int(SENTINEL)]
+    except RedisError as e:
+        print(f"Timeline read failed, querying posts directly: {e}")
+
+    if read_from_db is None:
+        read_from_db = list(UserSubscription.objects.filter(subscriber_id=user_id).values_list("subscribed_to_id", flat=True))
+    if read_from_db:
+        older = Post.objects.filter(user__in=read_from_db).order_by("-id")
+        if after_id:
+            older = older.filter(id__lt=after_id)
+        post_ids = sorted(set(post_ids) | set(older.values_list("id", flat=True)[:limit + 1]), reverse=True)
+
+    return post_ids[:limit], len(post_ids) > limit
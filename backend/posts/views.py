@@ -2,25 +2,26 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.parsers import MultiPartParser, FormParser
+from accounts.authentication import CachedTokenAuthentication
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.generics import ListAPIView
-from django.http import QueryDict
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
-import magic
 
 from .models import Post
-from subscriptions.models import UserSubscription 
 from AWS.S3.models import UserMedia
-from AWS.S3.views import S3FileUploadView
+from AWS.S3.services import upload_files, validate_media_file, MediaUploadError
 from .serializers import PostSerializer, PostReadSerializer
+from .pagination import PostPagination
+from . import timeline
+from backend.pagination import encode_cursor, decode_cursor
 
 User = get_user_model()
 
 class PostCreateView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
-    authentication_classes = [TokenAuthentication]
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
@@ -30,78 +31,45 @@ class PostCreateView(APIView):
         text = request.data.get('text', '')
         files = request.FILES.getlist('files')
 
-        post = Post.objects.create(user=request.user, text=text)
-
-        media_objects = []
-
+        # Media uploaded beforehand through the direct upload flow
+        if hasattr(request.data, "getlist"):
+            media_ids = request.data.getlist('media_ids')
+        else:
+            media_ids = request.data.get('media_ids') or []
+        try:
+            media_ids = [int(media_id) for media_id in media_ids]
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid 'media_ids' parameter"}, status=status.HTTP_400_BAD_REQUEST)
+        uploaded_media = UserMedia.objects.in_bulk(media_ids) if media_ids else {}
+        if any(media_id not in uploaded_media or uploaded_media[media_id].uploaded_by_id != request.user.id for media_id in media_ids):
+            return Response({"error": "Media not found"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Reject the whole post before anything is uploaded if one file is invalid
         for file_obj in files:
-            print(f"Uploading file: {file_obj.name}")
-
-            file_header = file_obj.read(2048)
-            file_obj.seek(0)
-            detected_mime = magic.from_buffer(file_header, mime=True)
-            print(f"Detected MIME type: {detected_mime}")
-
-            if file_obj.content_type.startswith("image/"):
-                if not detected_mime.startswith("image/"):
-                    return Response(
-                        {"error": "Uploaded file is not a valid image."},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            elif file_obj.content_type.startswith("video/"):
-                if not detected_mime.startswith("video/"):
-                    return Response(
-                        {"error": "Uploaded file is not a valid video."},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                return Response(
-                    {"error": "Uploaded file must be an image or video."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            upload_request = request._request
-            upload_request.POST = QueryDict(mutable=True)
-            upload_request.POST.update({'title': file_obj.name})
-            upload_request.FILES['file'] = file_obj
-
-            upload_view = S3FileUploadView.as_view()
-            response = upload_view(upload_request)
-
-            print("Response from S3FileUploadView:", response.data)
-
-            if response.status_code == status.HTTP_201_CREATED:
-                media_id = response.data.get("data", {}).get("id")
-                if media_id:
-                    try:
-                        media = UserMedia.objects.get(id=media_id)
-                        media_objects.append(media)
-                    except UserMedia.DoesNotExist:
-                        return Response(
-                            {"error": f"Media with ID {media_id} not found"},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                else:
-                    return Response(
-                        {"error": "Error: media_id not received"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                return Response(
-                    {"error": "Error uploading file to S3"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-        if media_objects:
-            post.media.add(*media_objects)
+            error = validate_media_file(file_obj)
+            if error:
+                return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with upload_files(files, uploaded_by=request.user) as media_objects:
+                post = Post.objects.create(user=request.user, text=text)
+                media_objects = [uploaded_media[media_id] for media_id in media_ids] + media_objects
+                if media_objects:
+                    post.media.add(*media_objects)
+        except MediaUploadError as e:
+            print(e)
+            return Response({"error": "Error uploading file to S3"}, status=status.HTTP_400_BAD_REQUEST)
+
+        transaction.on_commit(lambda: timeline.fan_out(post))
 
         serializer = PostSerializer(post)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 class UserPostsView(ListAPIView):
     serializer_class = PostReadSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = PostPagination
 
     def get_queryset(self):
         user_id = self.request.GET.get("user_id")
@@ -109,17 +77,35 @@ class UserPostsView(ListAPIView):
             try:
                 user_id = int(user_id)
                 user = get_object_or_404(User, id=user_id)
-                return Post.objects.filter(user=user).order_by("uploaded_at")
+                return Post.objects.filter(user=user).prefetch_related("media")
             except ValueError:
                 pass
         return Post.objects.none()
     
 class SubscribedUsersPostsView(ListAPIView):
     serializer_class = PostReadSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
-
-    def get_queryset(self):
-        user_profile = self.request.user
-        subscribed_users = UserSubscription.objects.filter(subscriber=user_profile).values_list("subscribed_to", flat=True)
-        return Post.objects.filter(user__in=subscribed_users).order_by("-uploaded_at")
+    page_size = 20
+    max_page_size = 100
+
+    def list(self, request, *args, **kwargs):
+        """ A page of the user's home timeline, newest first; 'after' continues from the previous page """
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", self.page_size)), self.max_page_size))
+        except ValueError:
+            return Response({"error": "Invalid 'limit' parameter"}, status=status.HTTP_400_BAD_REQUEST)
+        after = request.query_params.get("after")
+        after_id = decode_cursor(after, 1)[0] if after else None
+        if after_id is not None and (type(after_id) is not int or after_id < 1):
+            return Response({"error": "Invalid 'after' parameter"}, status=status.HTTP_400_BAD_REQUEST)
+
+        post_ids, has_more = timeline.read_page(request.user.id, after_id, limit)
+        posts = Post.objects.prefetch_related("media").in_bulk(post_ids)
+        page = [posts[post_id] for post_id in post_ids if post_id in posts]
+
+        return Response({
+            "previous": None,
+            "next": encode_cursor([post_ids[-1]]) if has_more else None,
+            "results": self.get_serializer(page, many=True).data,
+        })
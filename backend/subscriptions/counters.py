@@ -0,0 +1,83 @@
+"""
+Follower and following counts kept on UserProfile.
+
+Counting UserSubscription rows for every profile view does not scale with
+popular users, so UserProfile.follower_count and following_count hold the
+counts. follow() and unfollow() change the subscription and both counters
+in one transaction, with F() updates so concurrent requests cannot lose an
+increment. The two rows are updated in id order, which keeps two users
+following each other at the same time from deadlocking.
+
+Subscriptions removed by a cascade (a deleted user) do not go through here;
+`manage.py reconcile_subscription_counts` recomputes the counters from the
+subscriptions.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from accounts.models import UserProfile
+from .models import UserSubscription
+
+
+def adjust(subscriber_id, subscribed_to_id, delta):
+    changes = {int(subscriber_id): "following_count", int(subscribed_to_id): "follower_count"}
+    for user_id in sorted(changes):
+        field = changes[user_id]
+        users = UserProfile.objects.filter(id=user_id)
+        if delta < 0:
+            # A counter that drifted to 0 stays there until reconciled
+            users = users.filter(**{f"{field}__gte": -delta})
+        users.update(**{field: F(field) + delta})
+
+
+def follow(serializer):
+    """ Saves a validated UserSubscriptionSerializer and counts the subscription """
+    with transaction.atomic():
+        subscription = serializer.save()
+        adjust(subscription.subscriber_id, subscription.subscribed_to_id, 1)
+    return subscription
+
+
+def unfollow(subscriber_id, subscribed_to_id):
+    """ Removes a subscription; returns whether there was one """
+    with transaction.atomic():
+        deleted, _ = UserSubscription.objects.filter(
+            subscriber_id=subscriber_id, subscribed_to_id=subscribed_to_id,
+        ).delete()
+        if deleted:
+            adjust(subscriber_id, subscribed_to_id, -1)
+    return bool(deleted)
+
+
+def actual_counts():
+    """ Subqueries counting the subscriptions of the outer UserProfile """
+    def count(field):
+        return Coalesce(Subquery(
+            UserSubscription.objects.filter(**{field: OuterRef("pk")}).order_by()
+            .values(field).annotate(count=Count("id")).values("count")
+        ), 0)
+    return {"follower_count": count("subscribed_to"), "following_count": count("subscriber")}
+
+
+def reconcile(batch_size=1000, dry_run=False):
+    """
+    Recomputes the counters of every user, batch_size users per statement, and
+    returns how many were wrong. Only the drifted rows are written.
+    """
+    drifted = 0
+    last_id = 0
+    while batch := list(
+        UserProfile.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size]
+    ):
+        last_id = batch[-1]
+        counts = actual_counts()
+        ids = list(
+            UserProfile.objects.filter(id__in=batch)
+            .annotate(actual_followers=counts["follower_count"], actual_following=counts["following_count"])
+            .exclude(follower_count=F("actual_followers"), following_count=F("actual_following"))
+            .values_list("id", flat=True)
+        )
+        drifted += len(ids)
+        if ids and not dry_run:
+            UserProfile.objects.filter(id__in=ids).update(**actual_counts())
+    return drifted
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from subscriptions import counters
+
+class Command(BaseCommand):
+    help = "Recomputes UserProfile.follower_count and following_count from the subscriptions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Users recomputed per statement.")
+        parser.add_argument("--dry-run", action="store_true", help="Only report how many counters are wrong.")
+
+    def handle(self, *args, **options):
+        drifted = counters.reconcile(batch_size=options["batch_size"], dry_run=options["dry_run"])
+        verb = "Found" if options["dry_run"] else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {drifted} users with wrong counters."))
@@ -1,3 +1,45 @@
+import io
+from django.core.management import call_command
 from django.test import TestCase
+from rest_framework.test import APIClient
+from accounts.models import UserProfile
+from .models import UserSubscription
 
-# Create your tests here.
+class SubscriptionCountersTest(TestCase):
+    def setUp(self):
+        self.alice, self.bob = [
+            UserProfile.objects.create_user(username=name, email=f"{name}@example.com", phone_number=str(index), password="pass")
+            for index, name in enumerate(["alice", "bob"])
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def counts(self, user):
+        user.refresh_from_db()
+        return user.follower_count, user.following_count
+
+    def test_subscribing_and_unsubscribing_update_both_counters(self):
+        self.assertEqual(self.client.post("/api/subscriptions/", {"subscribed_to": self.bob.id}).status_code, 201)
+        self.assertEqual(self.counts(self.alice), (0, 1))
+        self.assertEqual(self.counts(self.bob), (1, 0))
+
+        self.assertEqual(self.client.delete("/api/subscriptions/", {"subscribed_to": self.bob.id}).status_code, 204)
+        self.assertEqual(self.client.delete("/api/subscriptions/", {"subscribed_to": self.bob.id}).status_code, 404)
+        self.assertEqual(self.counts(self.alice), (0, 0))
+        self.assertEqual(self.counts(self.bob), (0, 0))
+
+    def test_profile_exposes_the_counters(self):
+        self.client.post("/api/subscriptions/", {"subscribed_to": self.bob.id})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/accounts/user/{self.bob.id}/")
+        self.assertEqual(response.data["follower_count"], 1)
+
+    def test_reconciliation_fixes_drifted_counters(self):
+        UserSubscription.objects.create(subscriber=self.bob, subscribed_to=self.alice)
+        UserProfile.objects.filter(id=self.bob.id).update(follower_count=5)
+
+        call_command("reconcile_subscription_counts", batch_size=1, stdout=io.StringIO())
+
+        self.assertEqual(self.counts(self.alice), (1, 0))
+        self.assertEqual(self.counts(self.bob), (0, 1))
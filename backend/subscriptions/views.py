@@ -1,13 +1,15 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
+from accounts.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from .serializers import UserSubscriptionSerializer
 from .models import UserSubscription
+from posts import timeline
+from . import counters
 
 class SubscriptionView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
@@ -21,7 +23,8 @@ class SubscriptionView(APIView):
             "subscribed_to": subscribed_to_id
         })
         if serializer.is_valid():
-            serializer.save()
+            counters.follow(serializer)
+            timeline.invalidate(request.user.id)
             return Response({"message": "Subscription added successfully"}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -45,9 +48,7 @@ class SubscriptionView(APIView):
         if not subscribed_to_id:
             return Response({"error": "Missing 'subscribed_to' parameter"}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            subscription = UserSubscription.objects.get(subscriber=request.user, subscribed_to_id=subscribed_to_id)
-            subscription.delete()
-            return Response({"message": "Subscription deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
-        except UserSubscription.DoesNotExist:
+        if not counters.unfollow(request.user.id, subscribed_to_id):
             return Response({"error": "Subscription not found"}, status=status.HTTP_404_NOT_FOUND)
+        timeline.invalidate(request.user.id)
+        return Response({"message": "Subscription deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
@@ -171,7 +171,7 @@ const Header = () => {
                 ? user.username.slice(0, 18) + "..."
                 : user.username}
             </span>
-            {user.avatar_base64 && (
+            {user.avatar && (
               <div
                 ref={avatarRef}
                 className="avatar-wrapper"
@@ -182,7 +182,7 @@ const Header = () => {
               >
                 <img
                   className="user-avatar"
-                  src={`data:image/png;base64,${user.avatar_base64}`}
+                  src={user.avatar.small}
                   alt="User Avatar"
                 />
               </div>
@@ -0,0 +1,24 @@
+import React from "react";
+
+// Resized variants generated by the backend, best format first
+const VARIANT_TYPES = [
+  ["avif", "image/avif"],
+  ["webp", "image/webp"],
+];
+
+// Renders an uploaded image, letting the browser pick a resized variant from
+// media.srcset and falling back to the original until variants exist
+const ResponsiveImage = ({ media, src, sizes = "(max-width: 700px) 100vw, 640px", ...props }) => {
+  const srcset = media?.srcset || {};
+
+  return (
+    <picture>
+      {VARIANT_TYPES.filter(([format]) => srcset[format]).map(([format, type]) => (
+        <source key={format} type={type} srcSet={srcset[format]} sizes={sizes} />
+      ))}
+      <img src={src} loading="lazy" {...props} />
+    </picture>
+  );
+};
+
+export default ResponsiveImage;
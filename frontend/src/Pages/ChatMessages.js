@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useRef } from "react";
 import { useParams } from "react-router-dom";
+import ResponsiveImage from "../Components/ResponsiveImage";
 import "../css/ChatMessages.css";
 
 const API_URL = process.env.REACT_APP_API_URL;
@@ -16,9 +17,11 @@ const ChatMessages = () => {
   const [file, setFile] = useState(null);
   const [errorMessage, setErrorMessage] = useState("");
   const [isBatchLoading, setIsBatchLoading] = useState(false);
+  const [olderCursor, setOlderCursor] = useState(null);
   const token = localStorage.getItem("token");
 
   const messagesEndRef = useRef(null);
+  const socketRef = useRef(null);
   const textareaRef = useRef(null);
   const [footerVisible, setFooterVisible] = useState(false);
   const [footerHeight, setFooterHeight] = useState(0);
@@ -54,16 +57,18 @@ const ChatMessages = () => {
       );
   }, [token]);
 
-  // Load all messages
+  // Load the latest page of messages
   const fetchMessages = () => {
     fetch(`${API_URL}/api/chat_messages/${chatId}/messages/`, {
       headers: { Authorization: `Token ${token}` },
     })
       .then((res) => res.json())
       .then((data) => {
-        if (Array.isArray(data)) {
-          setAllMessages(data);
+        if (Array.isArray(data.results)) {
+          setAllMessages(data.results);
+          setOlderCursor(data.previous);
           setErrorMessage("");
+          markRead();
           // Scroll down after loading
           setTimeout(() => {
             messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -85,7 +90,10 @@ const ChatMessages = () => {
     fetchMessages();
 
     // Connect to WebSocket to receive new messages
-    const socket = new WebSocket(`${WS_URL}/ws/chat/${chatId}/`);
+    const socket = new WebSocket(
+      `${WS_URL}/ws/chat/${chatId}/?token=${encodeURIComponent(token)}`
+    );
+    socketRef.current = socket;
     socket.onmessage = (event) => {
       const data = JSON.parse(event.data);
       if (data.type === "message") {
@@ -98,25 +106,61 @@ const ChatMessages = () => {
           media: data.media_url ? { file_url: data.media_url } : null,
         };
         setAllMessages((prev) => [...prev, newMessage]);
-        if (!users[newMessage.user]) fetchUserInfo(newMessage.user);
+        socket.send(JSON.stringify({ type: "read", message: newMessage.id }));
+        if (!users[newMessage.user]) fetchUsersInfo([newMessage.user]);
         messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
       } else if (data.type === "notification") {
         fetchMessages();
+      } else if (data.type === "error") {
+        console.error("Error sending message:", data.error);
       }
     };
-    return () => socket.close();
+    return () => {
+      socketRef.current = null;
+      socket.close();
+    };
   }, [chatId, users]);
 
-  const fetchUserInfo = (userId) => {
-    fetch(`${API_URL}/api/accounts/user/${userId}`, {
+  // Reset the unread counter of this chat
+  const markRead = () => {
+    fetch(`${API_URL}/api/chat_messages/${chatId}/read/`, {
+      method: "POST",
+      headers: { Authorization: `Token ${token}` },
+    }).catch((error) => console.error("Error marking chat read:", error));
+  };
+
+  // Load the page of messages preceding the oldest loaded one
+  const fetchOlderMessages = () => {
+    if (!olderCursor) return Promise.resolve();
+    return fetch(
+      `${API_URL}/api/chat_messages/${chatId}/messages/?before=${encodeURIComponent(olderCursor)}`,
+      { headers: { Authorization: `Token ${token}` } }
+    )
+      .then((res) => res.json())
+      .then((data) => {
+        if (Array.isArray(data.results)) {
+          setAllMessages((prev) => [...data.results, ...prev]);
+          setOlderCursor(data.previous);
+        }
+      })
+      .catch((error) => console.error("Error loading older messages:", error));
+  };
+
+  // Load the summaries of several users with one request
+  const fetchUsersInfo = (userIds) => {
+    if (userIds.length === 0) return;
+    fetch(`${API_URL}/api/accounts/user/batch/?ids=${userIds.join(",")}`, {
       headers: { Authorization: `Token ${token}` },
     })
       .then((res) => res.json())
       .then((data) =>
-        setUsers((prev) => ({
-          ...prev,
-          [userId]: data,
-        }))
+        setUsers((prev) => {
+          const next = { ...prev };
+          (data.results || []).forEach((user) => {
+            next[user.id] = user;
+          });
+          return next;
+        })
       )
       .catch((error) =>
         console.error("Error loading user data:", error)
@@ -125,9 +169,7 @@ const ChatMessages = () => {
 
   useEffect(() => {
     const userIds = Array.from(new Set(allMessages.map((msg) => msg.user)));
-    userIds.forEach((userId) => {
-      if (!users[userId]) fetchUserInfo(userId);
-    });
+    fetchUsersInfo(userIds.filter((userId) => !users[userId]));
   }, [allMessages]);
 
   // Automatically adjust the height of the textarea
@@ -140,6 +182,20 @@ const ChatMessages = () => {
   const handleSendMessage = async (e) => {
     e.preventDefault();
     if (!chatId || (!text && !file)) return;
+
+    // Text-only messages go straight over the WebSocket; files still use HTTP
+    const socket = socketRef.current;
+    if (!file && socket && socket.readyState === WebSocket.OPEN) {
+      socket.send(
+        JSON.stringify({ type: "message", client_id: `${Date.now()}`, text })
+      );
+      setText("");
+      if (textareaRef.current) {
+        textareaRef.current.style.height = "auto";
+      }
+      return;
+    }
+
     const formData = new FormData();
     formData.append("chat", chatId);
     formData.append("text", text);
@@ -159,7 +215,7 @@ const ChatMessages = () => {
       if (textareaRef.current) {
         textareaRef.current.style.height = "auto";
       }
-      if (!users[data.user]) fetchUserInfo(data.user);
+      if (!users[data.user]) fetchUsersInfo([data.user]);
     } catch (error) {
       console.error("Error:", error.message);
     }
@@ -169,15 +225,16 @@ const ChatMessages = () => {
     const handleWindowScroll = () => {
       if (
         window.scrollY < 100 &&
-        visibleCount < allMessages.length &&
+        (visibleCount < allMessages.length || olderCursor) &&
         !isBatchLoading
       ) {
         setIsBatchLoading(true);
         const prevHeight = document.documentElement.scrollHeight;
-        setTimeout(() => {
-          setVisibleCount((prev) =>
-            Math.min(prev + BATCH_SIZE, allMessages.length)
-          );
+        setTimeout(async () => {
+          if (visibleCount + BATCH_SIZE > allMessages.length) {
+            await fetchOlderMessages();
+          }
+          setVisibleCount((prev) => prev + BATCH_SIZE);
           setTimeout(() => {
             const newHeight = document.documentElement.scrollHeight;
             window.scrollTo({
@@ -192,7 +249,7 @@ const ChatMessages = () => {
 
     window.addEventListener("scroll", handleWindowScroll);
     return () => window.removeEventListener("scroll", handleWindowScroll);
-  }, [visibleCount, allMessages, isBatchLoading]);
+  }, [visibleCount, allMessages, isBatchLoading, olderCursor]);
 
   const visibleMessages = allMessages.slice(-visibleCount);
 
@@ -288,9 +345,9 @@ const ChatMessages = () => {
                   {!isMyMessage &&
                     showHeader &&
                     users[msg.user] &&
-                    users[msg.user].avatar_base64 && (
+                    users[msg.user].avatar && (
                       <img
-                        src={`data:image/png;base64,${users[msg.user].avatar_base64}`}
+                        src={users[msg.user].avatar.small}
                         alt="avatar"
                         className="avatar"
                       />
@@ -308,10 +365,12 @@ const ChatMessages = () => {
                     {msg.media?.file_url && (
                       <div className="message-file">
                         {msg.media.file_url.match(/\.(jpg|png|gif|jpeg)$/) ? (
-                          <img
+                          <ResponsiveImage
+                            media={msg.media}
                             src={msg.media.file_url}
                             alt="media"
                             className="media-image"
+                            sizes="320px"
                           />
                         ) : msg.media.file_url.match(/\.(mp4|webm)$/) ? (
                           <video controls className="message-video">
@@ -355,9 +414,9 @@ const ChatMessages = () => {
                   {isMyMessage &&
                     showHeader &&
                     users[msg.user] &&
-                    users[msg.user].avatar_base64 && (
+                    users[msg.user].avatar && (
                       <img
-                        src={`data:image/png;base64,${users[msg.user].avatar_base64}`}
+                        src={users[msg.user].avatar.small}
                         alt="avatar"
                         className="avatar"
                       />
@@ -7,7 +7,6 @@ const Chats = () => {
   const navigate = useNavigate();
   const [chats, setChats] = useState([]);
   const [currentUser, setCurrentUser] = useState(null);
-  const [usersMap, setUsersMap] = useState({});
   const [loading, setLoading] = useState(true);
 
   // Fetching the current user data
@@ -47,7 +46,7 @@ const Chats = () => {
     }
     const fetchChats = async () => {
       try {
-        const response = await fetch(`${API_URL}/api/chats/get/`, {
+        const response = await fetch(`${API_URL}/api/chats/inbox/`, {
           headers: {
             "Content-Type": "application/json",
             Authorization: `Token ${token}`,
@@ -55,7 +54,7 @@ const Chats = () => {
         });
         const data = await response.json();
         if (response.ok) {
-          setChats(data);
+          setChats(data.results);
           console.log("Fetched chats:", data);
         } else {
           console.error("Error fetching chats:", data);
@@ -69,32 +68,6 @@ const Chats = () => {
     fetchChats();
   }, []);
 
-  // Fetching user details for chat participants
-  useEffect(() => {
-    if (!currentUser || chats.length === 0) return;
-    const token = localStorage.getItem("token");
-    chats.forEach((chat) => {
-      const otherUserId = chat.users.find(
-        (userId) => Number(userId) !== Number(currentUser.id)
-      );
-      if (otherUserId && !usersMap[otherUserId]) {
-        fetch(`${API_URL}/api/accounts/user/${otherUserId}`, {
-          headers: {
-            "Content-Type": "application/json",
-            Authorization: `Token ${token}`,
-          },
-        })
-          .then((response) => response.json())
-          .then((data) => {
-            setUsersMap((prev) => ({ ...prev, [otherUserId]: data }));
-          })
-          .catch((err) =>
-            console.error(`Error fetching user ${otherUserId}:`, err)
-          );
-      }
-    });
-  }, [currentUser, chats, usersMap]);
-
   const handleChatClick = (chatId) => {
     navigate(`/chats/${chatId}`);
   };
@@ -115,14 +88,11 @@ const Chats = () => {
       ) : (
         <ul>
           {chats.map((chat) => {
-            // Finding the second participant's ID
-            const otherUserId = chat.users.find(
-              (userId) => Number(userId) !== Number(currentUser.id)
+            // Finding the second participant
+            const otherUser = chat.users.find(
+              (user) => Number(user.id) !== Number(currentUser.id)
             );
-            const chatName =
-              otherUserId && usersMap[otherUserId]
-                ? usersMap[otherUserId].username
-                : "Loading...";
+            const chatName = otherUser ? otherUser.username : `Chat ${chat.id}`;
             return (
               <li
                 key={chat.id}
@@ -130,6 +100,12 @@ const Chats = () => {
                 style={{ cursor: "pointer", marginBottom: "10px" }}
               >
                 {chatName}
+                {chat.unread_count > 0 && ` (${chat.unread_count})`}
+                {chat.last_message && (
+                  <div style={{ opacity: 0.7, fontSize: "0.9em" }}>
+                    {chat.last_message.text}
+                  </div>
+                )}
               </li>
             );
           })}
@@ -1,5 +1,6 @@
 import React, { useEffect, useState } from "react";
 import { Link } from "react-router-dom";
+import ResponsiveImage from "../Components/ResponsiveImage";
 import "../css/Profile.css";
 
 const API_URL = process.env.REACT_APP_API_URL;
@@ -30,15 +31,6 @@ const MediaSlider = ({ media, renderMediaItem }) => {
   );
 };
 
-// Function to generate avatar src
-const getAvatarSrc = (avatarBase64) => {
-  if (!avatarBase64) return null;
-  if (avatarBase64.startsWith("data:image")) {
-    return avatarBase64;
-  }
-  return `data:image/jpeg;base64,${avatarBase64}`;
-};
-
 const Home = () => {
   const [posts, setPosts] = useState([]);
   const [usersMap, setUsersMap] = useState({});
@@ -69,13 +61,11 @@ const Home = () => {
           throw new Error(`Error: ${response.status} - ${data.detail || "Unknown error"}`);
         }
 
-        setPosts(data);
+        setPosts(data.results);
 
-        // Get unique author IDs and load their data
-        const authorIds = [...new Set(data.map((post) => post.user))];
-        authorIds.forEach((authorId) => {
-          fetchUserInfo(authorId);
-        });
+        // Load the data of every author with one request
+        const authorIds = [...new Set(data.results.map((post) => post.user))];
+        fetchUsersInfo(authorIds);
       } catch (error) {
         console.error("Error loading posts:", error.message);
       } finally {
@@ -86,12 +76,13 @@ const Home = () => {
     fetchPosts();
   }, []);
 
-  const fetchUserInfo = async (userId) => {
-    if (usersMap[userId]) return;
+  const fetchUsersInfo = async (userIds) => {
+    const missingIds = userIds.filter((userId) => !usersMap[userId]);
+    if (missingIds.length === 0) return;
 
     try {
       const token = localStorage.getItem("token");
-      const response = await fetch(`${API_URL}/api/accounts/user/${userId}`, {
+      const response = await fetch(`${API_URL}/api/accounts/user/batch/?ids=${missingIds.join(",")}`, {
         method: "GET",
         headers: {
           "Content-Type": "application/json",
@@ -102,18 +93,20 @@ const Home = () => {
       const data = await response.json();
 
       if (!response.ok) {
-        throw new Error(data.detail || "Error fetching user");
+        throw new Error(data.error || "Error fetching users");
       }
 
-      const userInfo = {
-        username: data.username,
-        // Use avatar_base64 and getAvatarSrc to generate valid src
-        avatar: data.avatar_base64 ? getAvatarSrc(data.avatar_base64) : null,
-      };
+      const usersInfo = {};
+      data.results.forEach((user) => {
+        usersInfo[user.id] = {
+          username: user.username,
+          avatar: user.avatar ? user.avatar.small : null,
+        };
+      });
 
-      setUsersMap((prev) => ({ ...prev, [userId]: userInfo }));
+      setUsersMap((prev) => ({ ...prev, ...usersInfo }));
     } catch (error) {
-      console.error(`Error fetching data for user ${userId}:`, error.message);
+      console.error("Error fetching authors:", error.message);
     }
   };
 
@@ -130,10 +123,19 @@ const Home = () => {
     const lowerUrl = mediaSrc.toLowerCase();
 
     if (lowerUrl.match(/\.(jpg|jpeg|png|gif)$/)) {
-      return <img src={mediaSrc} alt="Media" className="fixed-media" />;
+      return <ResponsiveImage media={mediaItem} src={mediaSrc} alt="Media" className="fixed-media" />;
     } else if (lowerUrl.match(/\.(mp4|webm)$/)) {
       return (
-        <video controls className="fixed-media">
+        <video
+          controls
+          preload="metadata"
+          poster={mediaItem.poster_url || undefined}
+          className="fixed-media"
+        >
+          {/* Adaptive stream where HLS plays natively, the original file elsewhere */}
+          {mediaItem.hls_url && (
+            <source src={mediaItem.hls_url} type="application/vnd.apple.mpegurl" />
+          )}
           <source
             src={mediaSrc}
             type={`video/${lowerUrl.endsWith(".mp4") ? "mp4" : "webm"}`}
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from "react";
 import { useParams, useNavigate } from "react-router-dom";
+import ResponsiveImage from "../Components/ResponsiveImage";
 import "../css/Profile.css";
 import crown from "../crown.svg";
 
@@ -44,6 +45,7 @@ const Profile = () => {
   const [currentUserLoading, setCurrentUserLoading] = useState(true);
   const [error, setError] = useState(null);
   const [posts, setPosts] = useState([]);
+  const [nextPostsCursor, setNextPostsCursor] = useState(null);
   const [crownVisible, setCrownVisible] = useState(false);
 
   // Fetching the viewed profile data
@@ -148,6 +150,7 @@ const Profile = () => {
       const data = await response.json();
       if (response.ok) {
         console.log("Subscription added successfully", data);
+        setUser((prev) => ({ ...prev, follower_count: prev.follower_count + 1 }));
         checkSubscriptionStatus();
       } else {
         console.error("Subscription error:", data);
@@ -171,6 +174,7 @@ const Profile = () => {
       });
       if (response.ok) {
         console.log("Subscription deleted successfully");
+        setUser((prev) => ({ ...prev, follower_count: Math.max(prev.follower_count - 1, 0) }));
         checkSubscriptionStatus();
       } else {
         const data = await response.json();
@@ -205,45 +209,40 @@ const Profile = () => {
     }
   };
 
-  // Function to get avatar source
-  const getAvatarSrc = (avatarBase64) => {
-    if (!avatarBase64) return null;
-    if (avatarBase64.startsWith("data:image")) {
-      return avatarBase64;
-    }
-    return `data:image/jpeg;base64,${avatarBase64}`;
-  };
-
-  useEffect(() => {
-    const fetchPosts = async () => {
-      const token = localStorage.getItem("token");
-      if (!token) return;
-
-      let url = `${API_URL}/api/posts/user/get/`;
+  // Fetches a page of posts, newest first; with a cursor, the page after it is appended
+  const fetchPosts = async (cursor = null) => {
+    const token = localStorage.getItem("token");
+    if (!token) return;
 
-      if (id) {
-        url += `?user_id=${id}`;
-      }
+    const params = new URLSearchParams();
+    if (id) {
+      params.append("user_id", id);
+    }
+    if (cursor) {
+      params.append("after", cursor);
+    }
 
-      try {
-        const response = await fetch(url, {
-          method: "GET",
-          headers: {
-            "Content-Type": "application/json",
-            Authorization: `Token ${token}`,
-          },
-        });
-        const data = await response.json();
-        if (response.ok) {
-          setPosts(data);
-        } else {
-          console.error("Error fetching posts:", data);
-        }
-      } catch (err) {
-        console.error("Error fetching posts:", err);
+    try {
+      const response = await fetch(`${API_URL}/api/posts/user/get/?${params}`, {
+        method: "GET",
+        headers: {
+          "Content-Type": "application/json",
+          Authorization: `Token ${token}`,
+        },
+      });
+      const data = await response.json();
+      if (response.ok) {
+        setPosts((prev) => (cursor ? [...prev, ...data.results] : data.results));
+        setNextPostsCursor(data.next);
+      } else {
+        console.error("Error fetching posts:", data);
       }
-    };
+    } catch (err) {
+      console.error("Error fetching posts:", err);
+    }
+  };
 
+  useEffect(() => {
     if (currentUser) {
       fetchPosts();
     }
@@ -262,7 +261,8 @@ const Profile = () => {
     const lowerUrl = mediaSrc.toLowerCase();
     if (lowerUrl.match(/\.(jpg|jpeg|png|gif)$/)) {
       return (
-        <img
+        <ResponsiveImage
+          media={mediaItem}
           src={mediaSrc}
           alt="Media"
           className="fixed-media"
@@ -270,7 +270,16 @@ const Profile = () => {
       );
     } else if (lowerUrl.match(/\.(mp4|webm)$/)) {
       return (
-        <video controls className="fixed-media">
+        <video
+          controls
+          preload="metadata"
+          poster={mediaItem.poster_url || undefined}
+          className="fixed-media"
+        >
+          {/* Adaptive stream where HLS plays natively, the original file elsewhere */}
+          {mediaItem.hls_url && (
+            <source src={mediaItem.hls_url} type="application/vnd.apple.mpegurl" />
+          )}
           <source
             src={mediaSrc}
             type={`video/${lowerUrl.endsWith(".mp4") ? "mp4" : "webm"}`}
@@ -331,13 +340,16 @@ const Profile = () => {
       </h2>
 
       <div className="profile-details">
-        {user.avatar_base64 && (
+        {user.avatar && (
           <img
-            src={getAvatarSrc(user.avatar_base64)}
+            src={user.avatar.large}
             alt={user.username}
             className="profile-avatar"
           />
         )}
+        <p className="profile-counts">
+          {user.follower_count} followers · {user.following_count} following
+        </p>
       </div>
       {/* Subscription actions */}
       {!currentUserLoading && (!currentUser || !isOwnProfile) && (
@@ -393,6 +405,9 @@ const Profile = () => {
                 )}
               </div>
             ))}
+        {nextPostsCursor && (
+          <button onClick={() => fetchPosts(nextPostsCursor)}>Load more</button>
+        )}
       </div>
     </div>
   );
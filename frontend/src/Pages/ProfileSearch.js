@@ -23,22 +23,11 @@ const ProfileSearch = () => {
   const fetchSuggestions = async (query) => {
     try {
       const response = await fetch(
-        `${API_URL}/api/accounts/user/search/?query=${encodeURIComponent(query)}`
+        `${API_URL}/api/accounts/user/search/?query=${encodeURIComponent(query)}&mode=prefix&limit=10`
       );
       if (response.ok) {
         const data = await response.json();
-        let results = Array.isArray(data) ? data : data ? [data] : [];
-        results = results.sort((a, b) => {
-          const usernameA = a.username.toLowerCase();
-          const usernameB = b.username.toLowerCase();
-          const queryLower = query.toLowerCase();
-          const indexA = usernameA.indexOf(queryLower);
-          const indexB = usernameB.indexOf(queryLower);
-          if (indexA === 0 && indexB !== 0) return -1;
-          if (indexB === 0 && indexA !== 0) return 1;
-          if (indexA !== indexB) return indexA - indexB;
-          return usernameA.length - usernameB.length;
-        });
+        const results = data.results || [];
         setSuggestions(results);
       } else {
         setSuggestions([]);
@@ -48,14 +37,6 @@ const ProfileSearch = () => {
     }
   };
 
-  const getAvatarSrc = (avatarBase64) => {
-    if (!avatarBase64) return null;
-    if (avatarBase64.startsWith("data:image")) {
-      return avatarBase64;
-    }
-    return `data:image/jpeg;base64,${avatarBase64}`;
-  };
-
   const handleSelect = (user) => {
     navigate(`/profile/${user.id}`);
   };
@@ -78,9 +59,9 @@ const ProfileSearch = () => {
               className="user-search-suggestion-item"
             >
               <div className="user-search-avatar-container">
-                {user.avatar_base64 ? (
+                {user.avatar ? (
                   <img
-                    src={getAvatarSrc(user.avatar_base64)}
+                    src={user.avatar}
                     alt={user.username}
                     className="user-search-avatar"
                   />
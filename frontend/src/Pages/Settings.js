@@ -34,10 +34,8 @@ const Settings = () => {
           setUsername(data.username || "");
           setEmail(data.email || "");
           setPhoneNumber(data.phone_number || "");
-          if (data.avatar_base64) {
-            setOldAvatarPreview(`data:image/png;base64,${data.avatar_base64}`);
-          } else if (data.avatar_url) {
-            setOldAvatarPreview(data.avatar_url);
+          if (data.avatar) {
+            setOldAvatarPreview(data.avatar.medium);
           }
         } else {
           const errorData = await response.json();